@@ -16,7 +16,15 @@
 # along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
 from .input_output import get_obs_data, write_dict, write_ins_file, \
     write_par_data_file, write_pest_files, write_tpl_file, \
-    write_dummy_pred_file, process_sweep_out
-from .functions import launch_pestpp
-from .analyses import calibration, ies, monte_carlo, gsa, linear_uncertainty
+    write_dummy_pred_file, process_sweep_out, read_jco_names, \
+    read_jco_memmap, write_lin_uncert, read_sweep_out, merge_sweep_files, \
+    write_gsa_indices, read_ensemble, read_ies_memmap, write_ensemble, \
+    write_regional_pest_files
+from .functions import failure_summary, launch_pestpp, run_site_models, \
+    run_sweep
+from .analyses import calibration, ies, monte_carlo, gsa, \
+    linear_uncertainty, pred_uncertainty, data_worth, sweep_sensitivity, \
+    screen_parameters, multistart_calibration, ies_results, train_emulator
+from .pipeline import analysis_stages, run_pipeline
+from .campaign import run_campaign
 from ._version import __version__
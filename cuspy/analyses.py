@@ -6,10 +6,22 @@ implemented in the package.
 This module contains the following functions:
 
     * :func:`calibration`: calibrate model.
+    * :func:`data_worth`: worth of observation groups.
     * :func:`gsa`: Global Sensitivity Analysis.
     * :func:`ies`: Iterative Ensemble Smoother.
+    * :func:`ies_results`: summaries of the iterations of IES.
     * :func:`linear_uncertainty`: predictive uncertainty.
     * :func:`monte_carlo`: Monte Carlo simulations.
+    * :func:`multistart_calibration`: calibrate model from several
+      starting points.
+    * :func:`pred_uncertainty`: linear predictive uncertainty of many
+      predictions.
+    * :func:`screen_parameters`: fix parameters with negligible
+      sensitivity.
+    * :func:`sweep_sensitivity`: sensitivity indices from the results
+      of a sweep.
+    * :func:`train_emulator`: train an emulator from the results of a
+      sweep.
 
 """
 # Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
@@ -28,17 +40,38 @@ This module contains the following functions:
 #
 # You should have received a copy of the GNU General Public License
 # along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import glob
+import hashlib
 import os.path
+import time
+from concurrent.futures import ProcessPoolExecutor
+from shutil import copyfile
 
+import numpy as np
+import pandas as pd
 import pyemu
-
-from cuspy import launch_pestpp, process_sweep_out
+from scipy.stats import norm
+
+from cuspy import launch_pestpp, merge_sweep_files, process_sweep_out, \
+    read_ensemble, read_ies_memmap, read_jco_names, read_jco_memmap, \
+    read_sweep_out, run_sweep, write_dict, write_ensemble, write_gsa_indices, \
+    write_lin_uncert
+from cuspy.linear import ensemble_jacobian, get_parcov, info_matrices, \
+    normal_bands, posterior_parcov, pred_variance, super_dimension
+from cuspy.sampling import cov_factor, draw_ensemble, percentile_se, \
+    unit_sample
+from cuspy.surrogate import fit_pce, load_surrogate, predict_pce, \
+    save_surrogate
+from cuspy.sensitivity import binned_indices, group_indices, morris_design, \
+    morris_indices, par_to_unit, rank_correlation, regression_coefs, \
+    sobol_design, sobol_indices, unit_to_par
 
 
 def calibration(method='glm', reg=False, pst_file0='pest.pst',
                 pst_file1='pest.pst', pestpp_folder='..', control_data=None,
                 svd_data=None, reg_data=None, pestpp_opts=None,
-                parallel=False):
+                parallel=False, screening=None, svd_assist=False,
+                eig_thresh=None, warm_start=None):
     """Calibrate model (GLM or DE methods).
 
     Args:
@@ -58,6 +91,45 @@ def calibration(method='glm', reg=False, pst_file0='pest.pst',
         pestpp_opts: a dictionary used to pass options to configure the
             DE method.
         parallel: parallelize model runs.
+        screening: a dictionary of options of :func:`screen_parameters`
+            (e.g., ``{'threshold': 0.05}`` or ``{'results':
+            'test3_sen_morris.msn'}``). If not None, the parameters with
+            negligible sensitivity are fixed before the calibration, so
+            that fewer runs are needed to calculate the Jacobian matrix.
+            If None, all the adjustable parameters are calibrated.
+        svd_assist: use SVD-assisted calibration (method 'glm' only).
+            The Jacobian matrix of the base parameters is calculated
+            once, with the pest file :file:`<pst_file1 root>.base.pst`
+            (``noptmax = -1``). The number of super parameters is then
+            chosen from its singular value spectrum (see
+            :func:`linear.super_dimension`), and `pestpp-glm` is
+            configured to estimate only the super parameters, using the
+            base Jacobian matrix (PEST++ options `base_jcb`,
+            `n_iter_base`, `n_iter_super` and `max_n_super`), so that
+            each iteration needs one run per super parameter instead of
+            one run per base parameter. The singular values are written
+            to the file :file:`<pst_file1 root>.svda.csv`, and a summary
+            of the runs saved compared with a full GLM calibration to
+            the file :file:`<pst_file1 root>.svda.txt`.
+        eig_thresh: ratio of singular values to the largest one under
+            which parameter combinations are not retained as super
+            parameters. If None, the singular values of the Jacobian
+            matrix scaled by weights and prior standard deviations are
+            compared with 1.
+        warm_start: path of the parameter file (:file:`.par` or
+            :file:`.bpa`) of a previous calibration, e.g., before an
+            update of the observations. The initial values of the
+            adjustable parameters are taken from this file (within
+            their bounds). If the Jacobian matrix of the previous
+            calibration (same path with the extension :file:`.jcb`)
+            has the adjustable parameters and the observations of the
+            new calibration, it is used as the first Jacobian matrix
+            (PEST++ option `base_jcb`, also used by `svd_assist`), and
+            so are the residuals (extension :file:`.rei`, PEST++ option
+            `hotstart_resfile`) if they contain all the observations.
+            Otherwise, the calibration starts with the calculation of
+            a new Jacobian matrix. The files used are written to the
+            file :file:`<pst_file1 root>.warm_start.txt`.
 
     Returns:
         A pest instance where the parameter values correspond to the
@@ -75,53 +147,28 @@ def calibration(method='glm', reg=False, pst_file0='pest.pst',
         * White, J.; Welter, D.; Doherty, J. (2019) *PEST++ Version
           4.2.16*. PEST++ Development Team. 175 p.
     """
-    # Load pst file
-    pst0 = pyemu.Pst(pst_file0)
-    nobs = pst0.nobs
-    npar = pst0.npar
-
-    # Set calibration method
-    if method == 'glm':
-        # Make sure 'DE' is not used
-        if 'global_opt' in pst0.pestpp_options:
-            pst0.pestpp_options.pop('global_opt')
-    elif method == 'de':
-        pst0.pestpp_options['global_opt'] = 'de'
-        if pestpp_opts is None:
-            pestpp_opts = {}
-        for k in pestpp_opts:
-            pst0.pestpp_options[k] = pestpp_opts[k]
-    else:
-        raise ValueError('Method not recognised. Choose "glm" or "de".')
-
-    # Set regularisation configuration
-    if nobs < npar:
-        if not reg:
-            msg = 'nobs < npar, regularisation activated ' +\
-                '(value of variable reg switched to True).'
-            raise Warning(msg)
-        reg = True
-
-    if reg:
-        pyemu.helpers.zero_order_tikhonov(pst0)
-        if reg_data is None:
-            reg_data = {}
-        for k in reg_data:
-            pst0.reg_data.__setattr__(k, reg_data[k])
+    # Load pst file (fixing insensitive parameters)
+    if screening is None:
+        pst0 = pyemu.Pst(pst_file0)
     else:
-        pst0.control_data.pestmode = 'estimation'
-
-    # Configure control data
-    if control_data is None:
-        control_data = {}
-    for k in control_data:
-        pst0.control_data.__setattr__(k, control_data[k])
-
-    # Configure SVD data
-    if svd_data is None:
-        svd_data = {}
-    for k in svd_data:
-        pst0.svd_data.__setattr__(k, svd_data[k])
+        pst0 = screen_parameters(pst_file0, pst_file1,
+                                 pestpp_folder=pestpp_folder,
+                                 parallel=parallel, **screening)[0]
+    _set_calibration(pst0, method, reg, control_data, svd_data, reg_data,
+                     pestpp_opts)
+
+    # Start from a previous calibration
+    jco_file = None
+    if warm_start is not None:
+        jco_file = _warm_start(pst0, pst_file1, warm_start)
+
+    # Configure SVD-assisted calibration
+    if svd_assist:
+        if method != 'glm':
+            raise ValueError('SVD-assisted calibration requires method ' +
+                             '"glm".')
+        _svd_assist(pst0, pst_file1, pestpp_folder, parallel, eig_thresh,
+                    jco_file)
 
     # Write modified pest file
     pst0.write(pst_file1)
@@ -137,9 +184,291 @@ def calibration(method='glm', reg=False, pst_file0='pest.pst',
     return pst1
 
 
+def screen_parameters(pst_file0, pst_file1, threshold=0.05, results=None,
+                      obs_groups=None, pestpp_folder='..', parallel=True,
+                      n_traj=10, n_levels=4, n_candidates=None, seed=None,
+                      noptmax=None):
+    """Fix parameters with negligible sensitivity.
+
+    The parameters are screened with Morris's method: the mean absolute
+    elementary effect (mu*) of each adjustable parameter is divided by
+    the largest mu* of the observation group, and the parameters whose
+    relative mu* is lower than `threshold` for all the groups are fixed
+    (at their initial values) in `pst_file1`. Each iteration of
+    `pestpp-glm` then needs one model run less per fixed parameter to
+    calculate the Jacobian matrix.
+
+    Args:
+        pst_file0: path of original pest file.
+        pst_file1: path of modified pest file, where the insensitive
+            parameters are fixed.
+        threshold: relative mu* under which a parameter is fixed.
+        results: results of a previous Morris analysis. It may be the
+            dataframe of indices by group returned by :func:`gsa` with
+            the native engine (or the file
+            :file:`gsa_morris_groups.txt`), or the file :file:`.msn` of
+            `pestpp-sen` (sensitivity of the objective function). If
+            None, an analysis is made with the native engine of
+            :func:`gsa`, using the pest file
+            :file:`<pst_file1 root>.screen.pst`. A ValueError is raised
+            if some adjustable parameters of `pst_file0`, or all the
+            groups of `obs_groups`, are missing from the results.
+        obs_groups: list of observation groups whose sensitivities are
+            considered. If None, the groups of observations with
+            non-zero weight.
+        pestpp_folder: folder containing the PEST++ executables.
+        parallel: parallelize model runs.
+        n_traj: number of Morris trajectories (if `results` is None).
+        n_levels: number of levels of the Morris design.
+        n_candidates: number of candidate trajectories of the optimized
+            Morris design.
+        seed: seed of the random number generator.
+        noptmax: expected number of iterations of the calibration, used
+            to estimate the savings. If None, the value of `noptmax` in
+            `pst_file0`.
+
+    Returns:
+        A tuple containing the modified pest instance, a pandas
+        dataframe indexed by parameter name with the relative mu*
+        ('mu_star') and the decision ('fixed'), and a dictionary
+        summarizing the savings: number of adjustable parameters before
+        and after screening ('n_adj_before', 'n_adj_after'), number of
+        runs per Jacobian matrix before and after screening
+        ('runs_per_iter_before', 'runs_per_iter_after'), number of runs
+        of the screening ('screening_runs'), expected number of runs
+        saved by the calibration ('runs_saved', net of the screening
+        runs) and fraction of the runs of the calibration saved
+        ('fraction_saved'). The table and the summary are written to
+        the files :file:`<pst_file1 root>.screening.csv` and
+        :file:`<pst_file1 root>.screening.txt`.
+
+    References:
+        * Campolongo, F.; Cariboni, J.; Saltelli, A. (2007) An
+          effective screening design for sensitivity analysis of large
+          models. *Environmental Modelling & Software*, 22,
+          1509-1518.
+    """
+    pst = pyemu.Pst(pst_file0)
+    base1 = pst_file1.rsplit('.', 1)[0]
+    adj_names = pst.adj_par_names
+    if obs_groups is None:
+        obs_groups = pst.nnz_obs_groups
+
+    # Sensitivities (mu*) of the parameters
+    screening_runs = 0
+    if results is None:
+        results = gsa(method='morris', pst_file0=pst_file0,
+                      pst_file1=base1 + '.screen.pst',
+                      pestpp_folder=pestpp_folder, parallel=parallel,
+                      engine='native', n_samples=n_traj, n_levels=n_levels,
+                      n_candidates=n_candidates, seed=seed)[1]
+        screening_runs = n_traj * (len(adj_names) + 1)
+    elif isinstance(results, str) and results.lower().endswith('.msn'):
+        msn = pd.read_csv(results)
+        msn.columns = msn.columns.str.strip().str.lower()
+        results = pd.DataFrame({
+            'group': 'phi',
+            'parnme': msn['parameter_name'].str.strip().str.lower(),
+            'mu_star': msn['sen_mean_abs']}).set_index(['group', 'parnme'])
+        obs_groups = ['phi']
+    elif isinstance(results, str):
+        results = pd.read_csv(results, sep=' ', index_col=[0, 1])
+    mu_star = results['mu_star'].unstack(level=0)
+    missing = [n for n in adj_names if n not in mu_star.index]
+    if len(missing) > 0:
+        raise ValueError('The results of the Morris analysis do not ' +
+                         f'contain the adjustable parameters {missing}.')
+    groups = [g for g in obs_groups if g in mu_star.columns]
+    if len(groups) == 0:
+        raise ValueError('The results of the Morris analysis do not ' +
+                         f'contain the observation groups {obs_groups}.')
+    mu_star = mu_star.reindex(index=adj_names, columns=groups)
+    rel = (mu_star / mu_star.max()).max(axis=1).fillna(0)
+
+    # Fix insensitive parameters
+    screen = pd.DataFrame({'mu_star': rel, 'fixed': rel < threshold})
+    screen.index.name = 'parnme'
+    pst.parameter_data.loc[screen.index[screen.fixed], 'partrans'] = 'fixed'
+    pst.write(pst_file1)
+
+    # Savings
+    if noptmax is None:
+        noptmax = max(pst.control_data.noptmax, 1)
+    n_before, n_after = len(adj_names), len(adj_names) - screen.fixed.sum()
+    summary = {'n_adj_before': n_before, 'n_adj_after': int(n_after),
+               'runs_per_iter_before': n_before + 1,
+               'runs_per_iter_after': int(n_after) + 1,
+               'screening_runs': screening_runs,
+               'runs_saved': int(noptmax * (n_before - n_after) -
+                                 screening_runs),
+               'fraction_saved': float((n_before - n_after) /
+                                       (n_before + 1))}
+    screen.to_csv(base1 + '.screening.csv')
+    write_dict(summary, base1 + '.screening.txt')
+    return pst, screen, summary
+
+
+def multistart_calibration(pst_file0, pst_file1, pestpp_folder='..',
+                           n_starts=8, n_workers=None, max_concurrent=None,
+                           stage_iter=2, kill_ratio=2.0, seed=None, reg=False,
+                           control_data=None, svd_data=None, reg_data=None,
+                           port=4004):
+    """Calibrate model from several starting points (GLM method).
+
+    The Gauss-Levenberg-Marquardt algorithm may converge to a local
+    minimum of the objective function (phi). This function runs
+    `n_starts` calibrations from different starting points: the initial
+    parameter values of `pst_file0` and a Latin hypercube sample of the
+    parameter bounds (in log space for log-transformed parameters).
+    Each start is run in its own folder
+    (:file:`<pst_file1 root>.start_<k>`, a copy of the files of the
+    folder of `pst_file0`), and up to `max_concurrent` starts run at the
+    same time, sharing `n_workers` workers.
+
+    The calibrations are run by stages of `stage_iter` iterations. After
+    each stage, the starts whose phi is larger than `kill_ratio` times
+    the lowest phi are abandoned ('killed'), as well as those that
+    converged before the end of the stage ('converged'); the other
+    starts are resumed from their current parameter values, Jacobian
+    matrix and residuals (so that each stage does not compute the
+    Jacobian matrix again), with the workers of the abandoned starts.
+    The calibration ends after `noptmax` iterations in total.
+
+    Args:
+        pst_file0: path of original pest file.
+        pst_file1: path of modified pest file, containing the best
+            calibrated parameters.
+        pestpp_folder: folder containing the PEST++ executables.
+        n_starts: number of starting points.
+        n_workers: total number of workers shared by the concurrent
+            starts. If None, the number of cores.
+        max_concurrent: maximum number of starts run at the same time.
+            If None, all the starts are run at the same time.
+        stage_iter: number of iterations of each stage.
+        kill_ratio: ratio of phi to the lowest phi above which a start
+            is abandoned.
+        seed: seed of the random number generator.
+        reg: use Tikhonov regularisation.
+        control_data: a dictionary defining options in the control data
+            section of the pest file.
+        svd_data: a dictionary used to pass options to the svd section
+            of the pest file.
+        reg_data: a dictionary used to pass options to the
+            regularization section of the pest file.
+        port: port of the first start (the start `k` uses `port + k`).
+
+    Returns:
+        A tuple containing the pest instance of the best start (with the
+        calibrated parameter values) and a pandas dataframe indexed by
+        start with its status ('converged', 'killed', 'failed' or
+        'completed'), number of iterations ('n_iter'), initial and final
+        phi ('phi0', 'phi') and calibrated parameter values. The table
+        and the trajectories of phi are written to the files
+        :file:`<pst_file1 root>.multistart.csv` and
+        :file:`<pst_file1 root>.multistart_phi.csv`, and the results of
+        the best start are copied to the files of `pst_file1`.
+
+    Note:
+        This function calls the PEST++ executable `pestpp-glm` in
+        parallel mode.
+    """
+    pst0 = pyemu.Pst(pst_file0)
+    _set_calibration(pst0, 'glm', reg, control_data, svd_data, reg_data,
+                     None)
+    base1 = pst_file1.rsplit('.', 1)[0]
+    case = os.path.basename(base1)
+    folder0 = os.path.dirname(os.path.abspath(pst_file0))
+    noptmax = max(pst0.control_data.noptmax, 1)
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    if max_concurrent is None:
+        max_concurrent = n_starts
+
+    # Starting points (the first one is the initial parameter values)
+    starts = unit_to_par(pst0, unit_sample(n_starts - 1,
+                                           len(pst0.adj_par_names),
+                                           sampler='lhs', seed=seed))
+    starts = pd.concat([pst0.parameter_data[['parval1']].T, starts],
+                       ignore_index=True).astype(np.float64)
+    starts.index = [f'start_{k}' for k in range(n_starts)]
+
+    # Folders of the starts
+    pst_files = {}
+    for k, start in enumerate(starts.index):
+        folder = os.path.abspath(f'{base1}.{start}')
+        os.makedirs(folder, exist_ok=True)
+        for fname in os.listdir(folder0):
+            if os.path.isfile(os.path.join(folder0, fname)):
+                copyfile(os.path.join(folder0, fname),
+                         os.path.join(folder, fname))
+        pst_files[start] = os.path.join(folder, case + '.pst')
+        pst0.parameter_data['parval1'] = starts.loc[start, pst0.par_names]
+        pst0.write(pst_files[start])
+
+    # Calibration by stages
+    table = pd.DataFrame({'status': 'running', 'n_iter': 0,
+                          'phi0': np.nan, 'phi': np.nan},
+                         index=starts.index)
+    phi_traj = {}
+    n_done = 0
+    while (table.status == 'running').any() and (n_done < noptmax):
+        n_iter = min(stage_iter, noptmax - n_done)
+        running = table.index[table.status == 'running']
+        n_concurrent = min(len(running), max_concurrent)
+        n_share = max(n_workers // n_concurrent, 1)
+        with ProcessPoolExecutor(max_workers=n_concurrent) as executor:
+            futures = {start: executor.submit(
+                _run_start, pst_files[start], pestpp_folder, n_iter,
+                n_done > 0, n_share, port + starts.index.get_loc(start))
+                for start in running}
+        for start, future in futures.items():
+            try:
+                phi = future.result()
+            except (RuntimeError, OSError, KeyError, ValueError):
+                table.loc[start, 'status'] = 'failed'
+                continue
+            traj = phi_traj.setdefault(start, [phi.iloc[0]])
+            traj.extend(phi.iloc[1:])
+            table.loc[start, ['phi0', 'phi']] = traj[0], traj[-1]
+            table.loc[start, 'n_iter'] += len(phi) - 1
+            if len(phi) - 1 < n_iter:
+                table.loc[start, 'status'] = 'converged'
+        n_done += n_iter
+        losing = (table.status == 'running') & \
+            (table.phi > kill_ratio * table.phi.min())
+        table.loc[losing, 'status'] = 'killed'
+    table.loc[table.status == 'running', 'status'] = 'completed'
+    if table.phi.isna().all():
+        raise RuntimeError('All the starts failed.')
+
+    # Results of the best start
+    for start in table.index[table.phi.notna()]:
+        table.loc[start, pst0.adj_par_names] = \
+            pyemu.Pst(pst_files[start]).parameter_data.loc[
+                pst0.adj_par_names, 'parval1'].values
+    best = table.phi.idxmin()
+    pst1 = pyemu.Pst(pst_files[best])
+    for option in ['base_jcb', 'hotstart_resfile']:
+        pst1.pestpp_options.pop(option, None)
+    pst1.control_data.noptmax = noptmax
+    pst1.write(pst_file1)
+    # calibration files written after pst_file1 (see linear_uncertainty)
+    for ext in ['.par', '.rei', '.jcb', '.iobj', '.rec']:
+        fname = os.path.join(os.path.dirname(pst_files[best]), 'master',
+                             case + ext)
+        if os.path.isfile(fname):
+            copyfile(fname, base1 + ext)
+    table.to_csv(base1 + '.multistart.csv', index_label='start')
+    pd.DataFrame({start: pd.Series(traj) for start, traj in
+                  phi_traj.items()}).to_csv(base1 + '.multistart_phi.csv',
+                                            index_label='iteration')
+    return pst1, table
+
+
 def ies(pst_file0, pst_file1, pestpp_folder, n_reals=50, parcov=None,
         control_data=None, svd_data=None, reg_data=None, pestpp_opts=None,
-        parallel=True):
+        parallel=True, restart=None, restart_iter=None, seed=None,
+        binary=False):
     """Iterative Ensemble Smoother.
 
     Args:
@@ -158,6 +487,37 @@ def ies(pst_file0, pst_file1, pestpp_folder, n_reals=50, parcov=None,
         pestpp_opts: a dictionary containing additional options to pass
             to `pestpp-ies`.
         parallel: parallelize calculations.
+        restart: path of the pest file of a previous run of `pestpp-ies`
+            (e.g., before new observations were added). If not None,
+            the smoother starts from the parameter ensemble of iteration
+            `restart_iter` of the previous run (file
+            :file:`<restart root>.<N>.par.csv`, PEST++ option
+            `ies_par_en`) instead of drawing a new prior ensemble, and
+            `n_reals` is ignored. The simulated values of this ensemble
+            (file :file:`<restart root>.<N>.obs.csv`) are reused (option
+            `ies_restart_obs_en`) if they contain all the observations
+            and realizations; otherwise the ensemble is run again. If
+            these files are not found next to `restart`, they are read
+            in the folder :file:`master` of its folder (parallel run).
+            The noise of the observation ensemble (file
+            :file:`<restart root>.obs+noise.csv`) is kept for the
+            observations whose weight has not changed, and drawn for
+            the new observations (option `ies_obs_en`). The ensembles
+            are written to the files
+            :file:`<pst_file1 root>.restart.<par|obs|obs+noise>.csv`
+            (:file:`.jcb` if `binary` is True), and a summary to the file
+            :file:`<pst_file1 root>.restart.txt`. One or two iterations
+            (``control_data={'noptmax': 1}``) are usually enough to
+            assimilate the new observations.
+        restart_iter: iteration of the previous run used to restart. If
+            None, the last iteration found.
+        seed: seed of the random number generator used to draw the noise
+            of new observations (if `restart` is not None).
+        binary: save the ensembles in PEST binary format (PEST++ option
+            `ies_save_binary`, files :file:`.jcb` instead of
+            :file:`.csv`), which is faster to write and read for large
+            ensembles (see :func:`ies_results`). The restart ensembles
+            are then also written in binary format.
 
     Returns:
         A modified pest control file and the associated output files.
@@ -201,6 +561,11 @@ def ies(pst_file0, pst_file1, pestpp_folder, n_reals=50, parcov=None,
     pst0.pestpp_options['ies_num_reals'] = n_reals
     if parcov is not None:
         pst0.pestpp_options['parcov'] = parcov
+    if binary:
+        pst0.pestpp_options['ies_save_binary'] = True
+    if restart is not None:
+        _ies_restart(pst0, pst_file1, restart, restart_iter, seed,
+                     '.jcb' if binary else '.csv')
 
     # Write modified pest control file
     pst0.write(pst_file1)
@@ -211,11 +576,95 @@ def ies(pst_file0, pst_file1, pestpp_folder, n_reals=50, parcov=None,
     return
 
 
+def ies_results(pst_file, percentiles=(5, 50, 95)):
+    """Summaries of the iterations of IES.
+
+    The observation ensembles of all the iterations of `pestpp-ies` are
+    read as a memory-mapped array of shape (n_iter, n_reals, n_obs) (see
+    :func:`input_output.read_ies_memmap`), and the summaries are
+    computed one iteration at a time with vectorized operations over
+    realizations and observations.
+
+    Args:
+        pst_file: path of the pest file used by `pestpp-ies`.
+        percentiles: percentiles of the simulated values.
+
+    Returns:
+        A dictionary containing:
+
+        * 'phi': a pandas dataframe (iterations x realizations) of the
+          measurement objective function of each realization, computed
+          with the observation ensemble
+          (:file:`<case>.obs+noise.csv` or :file:`.jcb`), or with the
+          observed values if it is not found. Failed realizations have
+          NaN values.
+        * 'phi_summary': a pandas dataframe indexed by iteration with
+          the number of realizations ('n_reals') and the 'mean', 'sd',
+          'min', 'p50' and 'max' of phi.
+        * 'spread': a pandas dataframe (iterations x observations) of
+          the standard deviations of the simulated values.
+        * 'percentiles': a dictionary of pandas dataframes (iterations
+          x observations) of the percentiles of the simulated values,
+          with the percentiles as keys.
+    """
+    x, iters, reals, obs_names = read_ies_memmap(pst_file, 'obs')
+    pst = pyemu.Pst(pst_file)
+    case = pst_file.rsplit('.', 1)[0]
+    master = os.path.join(os.path.dirname(os.path.abspath(pst_file)),
+                          'master', os.path.basename(case))
+
+    # weights and observed values (with noise) of the observations
+    obs = pst.observation_data.reindex(obs_names)
+    nnz = np.flatnonzero(obs.weight.fillna(0).values.astype(np.float64) > 0)
+    nnz_names = [obs_names[i] for i in nnz]
+    weights = obs.weight.values[nnz].astype(np.float64)
+    targets = np.tile(obs.obsval.values[nnz].astype(np.float64),
+                      (len(reals), 1))
+    noise_files = [root + ext for root in [case, master]
+                   for ext in ['.obs+noise.csv', '.obs+noise.jcb']]
+    for fname in noise_files:
+        if os.path.isfile(fname):
+            noise = read_ensemble(fname).reindex(index=reals,
+                                                 columns=nnz_names)
+            targets = np.where(np.isnan(noise.values), targets, noise.values)
+            break
+
+    # summaries by iteration
+    phi = np.empty((len(iters), len(reals)))
+    spread = np.empty((len(iters), len(obs_names)))
+    ptls = np.empty((len(percentiles), len(iters), len(obs_names)))
+    for i in range(len(iters)):
+        sim = np.asarray(x[i])
+        phi[i] = np.sum(((sim[:, nnz] - targets) * weights)**2, axis=1)
+        spread[i] = np.nanstd(sim, axis=0)
+        ptls[:, i, :] = np.nanpercentile(sim, percentiles, axis=0)
+
+    phi = pd.DataFrame(phi, index=iters, columns=reals)
+    phi.index.name = 'iteration'
+    phi_summary = pd.DataFrame({'n_reals': phi.notna().sum(axis=1),
+                                'mean': phi.mean(axis=1),
+                                'sd': phi.std(axis=1),
+                                'min': phi.min(axis=1),
+                                'p50': phi.median(axis=1),
+                                'max': phi.max(axis=1)})
+    spread = pd.DataFrame(spread, index=phi.index, columns=obs_names)
+    ptls = {p: pd.DataFrame(ptls[k], index=phi.index, columns=obs_names)
+            for k, p in enumerate(percentiles)}
+    return {'phi': phi, 'phi_summary': phi_summary, 'spread': spread,
+            'percentiles': ptls}
+
+
 def monte_carlo(pst_file0='pest.pst', pst_file1='pest.pst', dist_type='post',
                 distribution='gaussian', n_samples=100, how_dict=None,
                 csv_in='sweep_in.csv', pestpp_folder='..', add_base=False,
                 control_data=None, svd_data=None, reg_data=None,
-                pestpp_opts=None, parallel=True, process_swp_out=False):
+                pestpp_opts=None, parallel=True, process_swp_out=False,
+                method='sampling', jco_file=None, spot_check=0,
+                sampler='random', seed=None, tol=None, batch_size=None,
+                max_samples=None, tol_percentiles=(5, 95), extend=False,
+                resume=False, chunk_size=None, max_fail_rate=None,
+                fail_window=100, var_explained=1.0, binary=False,
+                emulator=None, flag_factor=3.0):
     """Monte Carlo simulations.
 
     Args:
@@ -243,12 +692,140 @@ def monte_carlo(pst_file0='pest.pst', pst_file1='pest.pst', dist_type='post',
         process_swp_out: option to process the sweep_out.csv results
             file. Observation group names should correspond to the names
             of the variables to which the observations belong.
+        method: 'sampling' to run the model for each sample, or
+            'linear' to propagate the parameter covariance through the
+            Jacobian matrix (first-order second-moment method), without
+            model runs. In the latter case, the mean values of the
+            predictions are the simulated values in the residuals file
+            (:file:`.rei`) of `pst_file0`, and the percentile bands are
+            those of a normal distribution (see
+            :func:`linear.normal_bands`). They are written in the
+            same format as the files created by
+            :func:`input_output.process_sweep_out`, in the folder of
+            `csv_in`.
+        jco_file: path of the Jacobian matrix file used if
+            ``method = linear``. If None, it is the path of `pst_file0`
+            with the extension :file:`.jcb` (e.g., the Jacobian matrix
+            left by the calibration).
+        spot_check: if ``method = linear``, number of samples of a
+            nonlinear Monte Carlo simulation used to check the
+            linearized percentile bands. If 0, no model runs are made.
+        sampler: 'random' for the pseudo-random draws of pyemu, 'lhs'
+            for Latin hypercube sampling, or 'sobol' or 'halton' for
+            scrambled quasi-random sequences (see
+            :func:`sampling.draw_ensemble`). Stratified and quasi-random
+            samples need fewer realizations to obtain stable percentile
+            bands (see :func:`sampling.percentile_convergence`).
+        seed: seed of the random number generator (only used if
+            `sampler` is not 'random' or if ``dist_type = post``).
+        tol: tolerance of the standard error of the percentiles (in the
+            units of the observations). If not None, the simulations
+            are made by batches of `batch_size` realizations, and they
+            are stopped when the standard error of the percentiles
+            `tol_percentiles` of all the observations (see
+            :func:`sampling.percentile_se`) is lower than `tol`, or when
+            `max_samples` realizations have been run. In that case,
+            `n_samples` is ignored.
+        batch_size: number of realizations in each batch (adaptive
+            simulations). If None, it is equal to `n_samples`.
+        max_samples: maximum number of realizations (adaptive
+            simulations). If None, it is 10 times `batch_size`.
+        tol_percentiles: percentiles whose standard error is compared
+            with `tol`.
+        extend: extend an existing sweep. If True and `csv_in` exists,
+            its realizations (and their results in the sweep output
+            file) are kept, and only the realizations needed to reach
+            `n_samples` (or, if `tol` is not None, the next batches) are
+            drawn and run. The new realizations continue the
+            quasi-random sequence ('sobol' or 'halton') of the existing
+            ones if `seed` is the same as in the original sweep; with
+            the pseudo-random draws of pyemu ('random'), they are
+            independent draws. They are run with the files
+            :file:`sweep_in.<i>.csv` and :file:`sweep_out.<i>.csv`,
+            where `i` is the number of existing realizations, and merged
+            into `csv_in` and the sweep output file (see
+            :func:`input_output.merge_sweep_files`). Latin hypercube
+            samples ('lhs') cannot be extended without losing their
+            stratification: a ValueError is raised in that case.
+        resume: resume an interrupted sweep. If True and `csv_in`
+            exists, the parameter samples are not drawn again: the
+            results of the sweep output file and of the chunk output
+            files written after `csv_in` are merged, and only the
+            realizations of `csv_in` that are missing or failed are run
+            (in chunks of `chunk_size` realizations). It may be combined
+            with `extend` or `tol` to continue the sweep afterwards.
+        chunk_size: number of realizations run by each call of
+            `pestpp-swp`. If not None, the realizations are run in
+            chunks with the files :file:`sweep_in.<i>.csv` and
+            :file:`sweep_out.<i>.csv`, where `i` is the name of the
+            first realization of the chunk, and the results are merged
+            into the sweep output file after each chunk, so that an
+            interrupted sweep loses at most one chunk (see `resume`).
+            Ignored by adaptive simulations, whose batches play the same
+            role.
+        max_fail_rate: maximum fraction of failed runs in the last
+            `fail_window` runs. If not None, the sweep is stopped as
+            soon as it is exceeded, and a RuntimeError is raised with a
+            summary of the parameter region of the failed runs (see
+            :func:`functions.run_sweep`). The sweep may then be resumed
+            (see `resume`). Since the failures of parallel runs are only
+            checked at the end of each call of `pestpp-swp`, parallel
+            sweeps are then run in chunks of at most `fail_window`
+            realizations (see `chunk_size`).
+        fail_window: number of runs of the sliding window used to
+            calculate the fraction of failed runs.
+        var_explained: if ``dist_type = post``, fraction of the
+            variance of the posterior parameter covariance explained by
+            the components of its factor (see
+            :func:`sampling.cov_factor`). The factor is cached in the
+            file :file:`<pst_file0 root>.post.cov.factor.npz`, and the
+            realizations are drawn from it (in chunks of `chunk_size`
+            realizations) with any `sampler`.
+        binary: write the parameter samples in PEST binary format (see
+            :func:`input_output.write_ensemble`), in the file `csv_in`
+            with the extension :file:`.jcb`, which is faster to write
+            and read by `pestpp-swp` than a CSV file for large
+            ensembles. The results of `pestpp-swp` are still written in
+            CSV format.
+        emulator: surrogate model (dictionary or path of the file
+            written by :func:`train_emulator`) used instead of the model
+            to simulate the realizations. The emulated results are
+            written to the file :file:`<csv_out root>.<i>.emulated.csv`
+            (where `i` is the name of the first realization) and merged
+            into the sweep output file; the realizations flagged by the
+            emulator (see :func:`surrogate.predict_pce`) are recorded
+            there as failed runs and are run with the model (they are
+            also run by `resume`). The emulator must have been trained
+            with the same parameters, bounds and observations.
+        flag_factor: threshold of the disagreement between the models
+            of the cross-validation of the emulator above which a
+            realization is flagged (see :func:`surrogate.predict_pce`).
 
     Returns:
         A modified pest control file and the associated output files.
+        If `tol` is not None, a pandas dataframe with the convergence
+        history (one row per batch: total number of realizations
+        'n_samples', number of failed runs 'n_failed', maximum standard
+        error of each percentile in `tol_percentiles`, e.g. 'se_p05',
+        and 'converged'), which is also written to the file
+        :file:`mc_convergence.txt` in the folder of the sweep output
+        file. The batches are run with the files
+        :file:`sweep_in.<i>.csv` and :file:`sweep_out.<i>.csv`, where
+        `i` is the name of the first realization of the batch, and they
+        are merged into `csv_in` and the sweep output file after each
+        batch.
+        If ``method = linear`` and `spot_check` > 0, a pandas dataframe
+        indexed by variable name (observation group) comparing the
+        nonlinear samples with the linearized bands: number of
+        successful runs ('n_runs'), fraction of simulated values inside
+        the p05-p95 band ('coverage_90', to be compared with 0.90), mean
+        difference between the sample and linearized means in units of
+        the linearized standard deviation ('mean_bias') and mean ratio
+        of sample and linearized standard deviations ('sd_ratio').
 
     Note:
-        This function calls the PEST++ executable `pestpp-swp`.
+        This function calls the PEST++ executable `pestpp-swp` (only
+        for the spot check if ``method = linear``).
 
     References:
         * White, J.T.; Fienen, M.N.; Doherty, J.E. (2016) A python
@@ -284,66 +861,134 @@ def monte_carlo(pst_file0='pest.pst', pst_file1='pest.pst', dist_type='post',
     pst1.pestpp_options.update(pestpp_opts)
 
     # Set sweep_parameter_csv_file
+    if binary:
+        csv_in = csv_in.rsplit('.', 1)[0] + '.jcb'
     pst1.pestpp_options['sweep_parameter_csv_file'] = csv_in
 
     # Write modified pst file
     pst1.write(pst_file1)
 
     # Load parameter covariance
+    base0 = pst_file0.rsplit('.', 1)[0]
+    factor = None
     if dist_type == 'prior':
         parcov = pyemu.Cov.from_parameter_data(pst1)
     elif dist_type == 'post':
-        fname = pst_file0.rstrip('.pst') + '.post.cov'
-        parcov = pyemu.Matrix.from_ascii(fname)
+        # cached (possibly truncated) factor of the posterior covariance
+        factor = cov_factor(base0 + '.post.cov', var_explained)
+        parcov = pyemu.Cov(x=factor.x @ factor.x.T, names=factor.row_names)
         distribution = 'gaussian'
     else:
         raise KeyError
 
+    # Linearized propagation of the parameter covariance
+    if method == 'linear':
+        if jco_file is None:
+            jco_file = base0 + '.jcb'
+        folder_out = os.path.dirname(csv_in)
+        bands = _linear_bands(pst1, jco_file, base0 + '.rei', parcov,
+                              n_samples)
+        write_lin_uncert(bands, pst1.obs_groups, folder_out,
+                         prefix='mc_uncert_')
+        if spot_check == 0:
+            return
+        # draw a small nonlinear sample around the calibrated values
+        if os.path.isfile(base0 + '.par'):
+            pst1.parrep(base0 + '.par')
+        n_samples, distribution = spot_check, 'gaussian'
+        add_base, process_swp_out = False, False
+    elif method != 'sampling':
+        raise ValueError('Method not recognised. Choose "sampling" or ' +
+                         '"linear".')
+
+    csv_out = _sweep_out_path(pst1, csv_in)
+    folder_out = os.path.dirname(csv_out)
+
+    # Existing realizations
+    n_old, n_base = 0, 0
+    if (extend or resume) and (method == 'sampling') and \
+            os.path.isfile(csv_in):
+        if csv_in.lower().endswith('.csv'):
+            old_ids = pd.read_csv(csv_in, index_col=0, usecols=[0]).index
+        else:
+            old_ids = pd.Index(read_jco_names(csv_in)[0])
+        n_old = len(old_ids)
+        n_base = int('base' in old_ids.astype(str))
+        add_base = add_base and (n_base == 0)
+        if extend and (n_old > 0) and (sampler == 'lhs'):
+            raise ValueError('Latin hypercube samples cannot be extended. ' +
+                             'Choose "sobol", "halton" or "random".')
+
+    # Run missing or failed realizations of an interrupted sweep
+    if resume and (n_old > 0):
+        pe = _missing_runs(csv_in, csv_out)
+        if pe.shape[0] > 0:
+            _run_batch(pst1, pst_file1, pe, csv_in, csv_out, pestpp_folder,
+                       parallel, append=True, chunk_size=chunk_size,
+                       max_fail_rate=max_fail_rate, fail_window=fail_window,
+                       emulator=emulator, flag_factor=flag_factor)
+
     # Draw samples
-    if distribution == 'gaussian':
-        pe = pyemu.ParameterEnsemble.\
-            from_gaussian_draw(pst=pst1, cov=parcov, num_reals=n_samples,
-                               by_groups=False)
-        pe.enforce(how='reset')
-    elif distribution == 'uniform':
-        pe = pyemu.ParameterEnsemble.from_uniform_draw(pst=pst1,
-                                                       num_reals=n_samples)
-    elif distribution == 'triangular':
-        pe = pyemu.ParameterEnsemble.from_triangular_draw(pst=pst1,
-                                                          num_reals=n_samples)
-    elif distribution == 'mixed':
-        pe = pyemu.ParameterEnsemble.\
-            from_mixed_draws(pst=pst1, how_dict=how_dict, num_reals=n_samples,
-                             cov=parcov, enforce_bounds=True)
+    if tol is not None:
+        return _adaptive_sweep(pst1, pst_file1, csv_in, csv_out,
+                               pestpp_folder, parallel, process_swp_out,
+                               add_base, distribution, sampler, parcov,
+                               how_dict, seed, tol, batch_size or n_samples,
+                               max_samples, tol_percentiles, n_old, n_base,
+                               max_fail_rate, fail_window, factor, emulator,
+                               flag_factor)
+    if n_old > 0:
+        # the base realization replaces a drawn one (see pyemu)
+        n_new = n_samples - n_old
+        if extend and (n_new > 0):
+            pe = _draw_samples(pst1, n_new, distribution, sampler, parcov,
+                               how_dict, seed, skip=n_old - n_base,
+                               factor=factor, chunk_size=chunk_size)
+            if add_base:
+                pe.add_base()
+            _run_batch(pst1, pst_file1, pe, csv_in, csv_out, pestpp_folder,
+                       parallel, append=True, chunk_size=chunk_size,
+                       max_fail_rate=max_fail_rate, fail_window=fail_window,
+                       emulator=emulator, flag_factor=flag_factor)
     else:
-        raise KeyError
-    if add_base:
-        pe.add_base()
-
-    # Save draw to csv
-    pe.to_csv(csv_in)
-
-    # Run simulations
-    launch_pestpp(pst_file=pst_file1, pestpp_folder=pestpp_folder,
-                  pestpp_cmd='pestpp-swp', parallel=parallel)
+        pe = _draw_samples(pst1, n_samples, distribution, sampler, parcov,
+                           how_dict, seed, factor=factor,
+                           chunk_size=chunk_size)
+        if add_base:
+            pe.add_base()
+
+        if (chunk_size is None) and (max_fail_rate is None) and \
+                (emulator is None):
+            # Save draw to csv (or binary file)
+            write_ensemble(pe, csv_in)
+
+            # Run simulations
+            launch_pestpp(pst_file=pst_file1, pestpp_folder=pestpp_folder,
+                          pestpp_cmd='pestpp-swp', parallel=parallel)
+        else:
+            _run_batch(pst1, pst_file1, pe, csv_in, csv_out, pestpp_folder,
+                       parallel, append=False, chunk_size=chunk_size,
+                       max_fail_rate=max_fail_rate, fail_window=fail_window,
+                       emulator=emulator, flag_factor=flag_factor)
 
     if process_swp_out:
         # Process results
-        try:
-            csv_out = pst1.pestpp_options['sweep_output_csv_file']
-            folder_out = os.path.dirname(csv_out)
-        except KeyError:
-            folder_out = os.path.dirname(csv_in)
-            csv_out = os.path.join(folder_out, 'sweep_out.csv')
         process_sweep_out(fname_in=csv_out, var_names=pst1.obs_groups,
                           folder_out=folder_out)
 
+    if method == 'linear':
+        # Compare nonlinear samples with linearized bands
+        return _check_linear_bands(bands, csv_out, pst1)
+
     return
 
 
 def gsa(method='morris', pst_file0='pest.pst', pst_file1='pest.pst',
         control_data=None, svd_data=None, reg_data=None, pestpp_opts=None,
-        pestpp_folder='..', parallel=True):
+        pestpp_folder='..', parallel=True, engine='pestpp', n_samples=None,
+        n_levels=None, n_candidates=None, seed=None, n_boot=100,
+        chunk_size=None, max_fail_rate=None, fail_window=100, extend=False,
+        emulator=None, flag_factor=3.0):
     """Carry global sensitivity analysis (Morris or Sobol methods).
 
     Args:
@@ -361,12 +1006,74 @@ def gsa(method='morris', pst_file0='pest.pst', pst_file1='pest.pst',
             GSA method.
         pestpp_folder: folder containing the PEST++ executables.
         parallel: parallelize model runs.
+        engine: 'pestpp' to carry the analysis with `pestpp-sen`, or
+            'native' to generate the design (see
+            :func:`sensitivity.sobol_design` and
+            :func:`sensitivity.morris_design`), run it with `pestpp-swp`
+            and calculate the indices (see
+            :func:`sensitivity.sobol_indices` and
+            :func:`sensitivity.morris_indices`) with cuspy. The design
+            is run with the files :file:`<pst_file1 root>.gsa_in.csv`
+            and :file:`<pst_file1 root>.gsa_out.csv`.
+        n_samples: number of rows of the Sobol design or number of
+            Morris trajectories (native engine). If None, the PEST++
+            options `gsa_sobol_samples` or `gsa_morris_r` are used
+            (default 4).
+        n_levels: number of levels of the Morris design (native
+            engine). If None, the PEST++ option `gsa_morris_p` is used
+            (default 4).
+        n_candidates: number of candidate trajectories of the optimized
+            Morris design (native engine). If None, the trajectories are
+            not optimized.
+        seed: seed of the random number generators (native engine).
+        n_boot: number of bootstrap resamples used to calculate the
+            confidence intervals (native engine).
+        chunk_size: number of runs made by each call of `pestpp-swp`
+            (native engine, see :func:`monte_carlo`).
+        max_fail_rate: maximum fraction of failed runs (native engine,
+            see :func:`functions.run_sweep`).
+        fail_window: number of runs of the sliding window used to
+            calculate the fraction of failed runs.
+        extend: extend an existing Sobol analysis (native engine). If
+            True and the design file :file:`<pst_file1 root>.gsa_in.csv`
+            exists, its runs are kept, the runs of its complete rows
+            that are missing or failed (e.g., after an interruption) are
+            run again, and only the rows needed to reach `n_samples`
+            rows are appended to the design, continuing the Sobol
+            sequence. A `seed` is required, and the same one must be
+            used with each call. The indices
+            and their confidence intervals are calculated with the
+            enlarged design. With each call, a line is added to the file
+            :file:`gsa_sobol_convergence.txt` (number of rows and runs,
+            and largest confidence intervals of the group indices), so
+            that the sample size can be increased until the indices are
+            stable.
+        emulator: surrogate model used instead of the model to simulate
+            the design (native engine, see :func:`monte_carlo` and
+            :func:`train_emulator`). The realizations flagged by the
+            emulator are run with the model.
+        flag_factor: threshold of the disagreement between the models
+            of the cross-validation of the emulator (see
+            :func:`surrogate.predict_pce`).
 
     Returns:
         A modified pst file and associated files containing results.
+        With the native engine, a tuple of two pandas dataframes of
+        sensitivity indices: one with a MultiIndex (observation name,
+        parameter name), and one with a MultiIndex (observation group,
+        parameter name), where the indices of the observations of each
+        group are averaged (see :func:`sensitivity.group_indices`). For
+        Sobol's method, the columns are 'S1', 'S1_conf', 'ST' and
+        'ST_conf'; for Morris's method, 'mu', 'mu_star', 'sigma' and
+        'mu_star_conf'. The first dataframe is written to the files
+        :file:`gsa_<method>_<v>.txt` (see
+        :func:`input_output.write_gsa_indices`), and the second one to
+        the file :file:`gsa_<method>_groups.txt`, in the folder of
+        `pst_file1`.
 
     Note:
-        This function calls the PEST++ executable `pestpp-sen`.
+        This function calls the PEST++ executable `pestpp-sen`, or
+        `pestpp-swp` with the native engine.
 
     References:
         * Saltelli, A.; Ratto, M.; Andres, T.; Campolongo, F.; Cariboni,
@@ -403,6 +1110,15 @@ def gsa(method='morris', pst_file0='pest.pst', pst_file1='pest.pst',
         pestpp_opts = {}
     pst0.pestpp_options.update(pestpp_opts)
 
+    if engine == 'native':
+        return _native_gsa(pst0, pst_file1, method, pestpp_folder, parallel,
+                           n_samples, n_levels, n_candidates, seed, n_boot,
+                           chunk_size, max_fail_rate, fail_window, extend,
+                           emulator, flag_factor)
+    elif engine != 'pestpp':
+        raise ValueError('Engine not recognised. Choose "pestpp" or ' +
+                         '"native".')
+
     # Write modified pest file
     pst0.write(pst_file1)
 
@@ -413,7 +1129,8 @@ def gsa(method='morris', pst_file0='pest.pst', pst_file1='pest.pst',
 
 
 def linear_uncertainty(analysis, pst_file0, pst_file1, pestpp_folder,
-                       predictions=None):
+                       predictions=None, reuse_jco=True, ensemble=None,
+                       alpha=1e-3):
     """Carry linear uncertainty calculations.
 
     Args:
@@ -427,6 +1144,29 @@ def linear_uncertainty(analysis, pst_file0, pst_file1, pestpp_folder,
         predictions: list of predictions names. If None, predictions are
             read from the `pst_file0` as the observations with null
             weight.
+        reuse_jco: reuse the Jacobian matrix (:file:`.jcb`) and the
+            residuals (:file:`.rei`) left by the calibration of
+            `pst_file0` when they are up to date. In that case, the
+            parameter values are read from the :file:`.par` file of the
+            calibration and no model runs are needed to compute the
+            Jacobian matrix.
+        ensemble: tuple of the paths of a parameter ensemble and of the
+            corresponding observation ensemble, e.g., the files
+            :file:`<case>.<N>.par.csv` and :file:`<case>.<N>.obs.csv`
+            of :func:`ies`, or the files :file:`sweep_in.csv` and
+            :file:`sweep_out.csv` of :func:`monte_carlo` (failed runs
+            are ignored), in CSV or binary format (see
+            :func:`input_output.read_ensemble`). If not None, the
+            Jacobian matrix is estimated from the ensemble by
+            regularized regression (see :func:`linear.ensemble_jacobian`)
+            instead of finite differences, so that no model runs are
+            needed. The observation weights are adjusted with the
+            residuals of the realization "base" if the ensemble contains
+            it, otherwise with those of the mean of the ensemble, and
+            the prior information of a regularized calibration is
+            removed from `pst_file1`.
+        alpha: ridge penalty of the regression (if `ensemble` is not
+            None).
 
     Returns:
         A :class:`LinearAnalysis` object (``analysis='prior'``),
@@ -440,7 +1180,10 @@ def linear_uncertainty(analysis, pst_file0, pst_file1, pestpp_folder,
         It is supposed that the model has already been calibrated.
         Thus, the original PEST control file `pst_file0`
         should be in the same folder as the files created
-        during the calibration process.
+        during the calibration process. If the calibration files can be
+        reused (see `reuse_jco`), the analysis needs one model run (if
+        the residuals are missing) or none, instead of the npar + 2
+        runs needed to adjust the weights and compute the Jacobian.
 
     References:
         * Doherty, J. (2010) *Methodologies and Software for PEST-Based
@@ -452,21 +1195,58 @@ def linear_uncertainty(analysis, pst_file0, pst_file1, pestpp_folder,
     """
     # load pest file
     pst0 = pyemu.Pst(pst_file0)
-
-    # adjust weights
-    pst0.control_data.noptmax = 0
-    pst0.write(pst_file1)
-    launch_pestpp(pst_file=pst_file1, pestpp_folder=pestpp_folder,
-                  pestpp_cmd='pestpp-glm')
-    pst1 = pyemu.Pst(pst_file1)
-    pst1.adjust_weights_discrepancy()
-
-    # calculate Jacobian matrix
-    pst1.control_data.noptmax = -1
-    pst1.write(pst_file1)
-    launch_pestpp(pst_file=pst_file1, pestpp_folder=pestpp_folder,
-                  pestpp_cmd='pestpp-glm')
     jco_file = pst_file1.rsplit('.', 1)[0] + '.jcb'
+    res_file = pst_file1.rsplit('.', 1)[0] + '.rei'
+
+    # check whether the calibration files can be reused
+    jco_ok, res_ok = False, False
+    if reuse_jco:
+        jco_ok, res_ok = _check_calib_files(pst0, pst_file0)
+
+    if ensemble is not None:
+        # estimate Jacobian matrix from the ensemble
+        obs_en = _ensemble_jco(pst0, ensemble[0], ensemble[1], jco_file,
+                               alpha)
+        pst1 = pst0
+        # the Jacobian matrix has no rows of prior information
+        pst1.prior_information = pst1.prior_information.iloc[0:0, :]
+        pst1.control_data.pestmode = 'estimation'
+        # adjust weights (residuals of the base realization or of the mean)
+        pst1.set_res(pyemu.pst_utils.res_from_en(pst1, obs_en))
+        pst1.adjust_weights_discrepancy()
+        pst1.control_data.noptmax = -1
+        pst1.write(pst_file1)
+    elif jco_ok:
+        # reuse Jacobian matrix (and residuals) of the calibration
+        base0 = pst_file0.rsplit('.', 1)[0]
+        pst0.parrep(base0 + '.par')
+        copyfile(base0 + '.jcb', jco_file)
+        if res_ok:
+            copyfile(base0 + '.rei', res_file)
+        else:
+            # only the residuals are calculated (one model run)
+            pst0.control_data.noptmax = 0
+            pst0.write(pst_file1)
+            launch_pestpp(pst_file=pst_file1, pestpp_folder=pestpp_folder,
+                          pestpp_cmd='pestpp-glm')
+        pst1 = pst0
+        pst1.adjust_weights_discrepancy(resfile=res_file)
+        pst1.control_data.noptmax = -1
+        pst1.write(pst_file1)
+    else:
+        # adjust weights
+        pst0.control_data.noptmax = 0
+        pst0.write(pst_file1)
+        launch_pestpp(pst_file=pst_file1, pestpp_folder=pestpp_folder,
+                      pestpp_cmd='pestpp-glm')
+        pst1 = pyemu.Pst(pst_file1)
+        pst1.adjust_weights_discrepancy()
+
+        # calculate Jacobian matrix
+        pst1.control_data.noptmax = -1
+        pst1.write(pst_file1)
+        launch_pestpp(pst_file=pst_file1, pestpp_folder=pestpp_folder,
+                      pestpp_cmd='pestpp-glm')
 
     # create LinearAnalysis object
     if predictions is None:
@@ -484,3 +1264,1255 @@ def linear_uncertainty(analysis, pst_file0, pst_file1, pestpp_folder,
         raise KeyError('Type of analysis not recognised.')
 
     return la
+
+
+def pred_uncertainty(pst_file, jco_file=None, parcov=None, predictions=None,
+                     var_names=None, folder_out=None, block_size=10000):
+    """Linear predictive uncertainty of many predictions.
+
+    This function calculates the prior and posterior (Schur's
+    complement) variances of the predictions, like
+    :func:`linear_uncertainty` with ``analysis='schur'``, but it is
+    designed for large numbers of predictions (e.g., daily values of
+    several variables): the Jacobian matrix is memory-mapped (see
+    :func:`input_output.read_jco_memmap`) and the variances of all the
+    predictions are computed by blocks of rows with matrix products
+    (see :func:`linear.pred_variance`).
+
+    Args:
+        pst_file: path of the pest file. Observation weights are taken
+            from this file (e.g., the modified pest file created by
+            :func:`linear_uncertainty`, whose weights have been
+            adjusted).
+        jco_file: path of the Jacobian matrix file. If None, it is the
+            path of `pst_file` with the extension :file:`.jcb`.
+        parcov: prior parameter covariance (see
+            :func:`linear.get_parcov`).
+        predictions: list of predictions names. If None, predictions are
+            read from the `pst_file` as the observations with null
+            weight.
+        var_names: list of variable names used to write the results to
+            text files (see :func:`input_output.write_lin_uncert`). If
+            None, no files are written.
+        folder_out: folder where the results are written. If None, it
+            is the folder of `pst_file`.
+        block_size: number of rows of the Jacobian matrix processed in
+            one pass.
+
+    Returns:
+        A pandas dataframe indexed by prediction names with the columns
+        'base' (simulated value, if a residuals file :file:`.rei` is
+        found next to `pst_file`, NaN otherwise), 'prior_var',
+        'post_var', 'prior_sd' and 'post_sd'. If `var_names` is given,
+        the files "lin_uncert_<v>.txt" are also written.
+
+    References:
+        * Doherty, J. (2010) *Methodologies and Software for PEST-Based
+          Model Predictive Uncertainty Analysis.* Watermark Numerical
+          Computing. 157 p.
+    """
+    pst = pyemu.Pst(pst_file)
+    base = pst_file.rsplit('.', 1)[0]
+    if jco_file is None:
+        jco_file = base + '.jcb'
+    if predictions is None:
+        predictions = pst.zero_weight_obs_names
+    predictions = [p.lower() for p in predictions]
+
+    # load Jacobian matrix and covariance matrices
+    jco, row_names, col_names = read_jco_memmap(jco_file)
+    row_inds = pd.Series(range(len(row_names)), index=row_names)
+    obs = pst.observation_data.loc[pst.nnz_obs_names, :]
+    prior_cov = get_parcov(pst, col_names, parcov)
+    post_cov = posterior_parcov(jco, row_inds[obs.obsnme].values,
+                                obs.weight.values, prior_cov,
+                                block_size=block_size)
+
+    # calculate prior and posterior variances
+    pvar = pred_variance(jco, row_inds[predictions].values,
+                         [prior_cov, post_cov], block_size=block_size)
+    uncert = pd.DataFrame({'base': np.nan, 'prior_var': pvar[0, :],
+                           'post_var': pvar[1, :]}, index=predictions)
+    uncert['prior_sd'] = np.sqrt(uncert['prior_var'])
+    uncert['post_sd'] = np.sqrt(uncert['post_var'])
+    if os.path.isfile(base + '.rei'):
+        res = pyemu.pst_utils.read_resfile(base + '.rei')
+        res.index = res.index.str.lower()
+        uncert['base'] = res.modelled.reindex(predictions).values
+
+    # write results
+    if var_names is not None:
+        if folder_out is None:
+            folder_out = os.path.dirname(os.path.abspath(pst_file))
+        write_lin_uncert(uncert, var_names, folder_out)
+
+    return uncert
+
+
+def data_worth(pst_file, jco_file=None, parcov=None, predictions=None,
+               obs_groups=None, base_groups=None, reset_zero_weight=None,
+               block_size=10000, parallel=True, cache=True):
+    """Worth of observation groups.
+
+    The worth of a group of observations is measured as the reduction
+    of the (linear) predictive variance it brings about. Two types of
+    scenarios are evaluated for each group:
+
+    * 'remove': increase of the posterior variance of the predictions
+      when the group is removed from the whole set of groups (worth of
+      the group given the other groups).
+    * 'add': reduction of the variance of the predictions when the group
+      is added to the base groups (`base_groups`; by default, no
+      observations are used, so that the worth of the group alone is
+      obtained).
+
+    The information matrices of the groups (see
+    :func:`linear.info_matrices`) are calculated once by reading the
+    memory-mapped Jacobian matrix, and they are saved to a cache file
+    (:file:`.dw.npz`) next to the Jacobian matrix, which is reused while
+    the Jacobian matrix, the groups and the weights do not change.
+    The posterior covariance matrices of all the scenarios are then
+    obtained from the information matrices by a batched inversion, and
+    the variances of the predictions are computed for all the
+    scenarios at once by blocks of rows of the Jacobian matrix (in
+    parallel if `parallel` is True).
+
+    Args:
+        pst_file: path of the pest file (e.g., the modified pest file
+            created by :func:`linear_uncertainty`).
+        jco_file: path of the Jacobian matrix file. If None, it is the
+            path of `pst_file` with the extension :file:`.jcb`.
+        parcov: prior parameter covariance (see
+            :func:`linear.get_parcov`).
+        predictions: list of predictions names. If None, predictions are
+            read from the `pst_file` as the observations with null
+            weight.
+        obs_groups: dictionary of group names (keys) and lists of
+            observation names (values). If None, the groups of
+            observations with non-zero weight in `pst_file` are used
+            (e.g., 'tepi' and 'thyp').
+        base_groups: list of names of groups in `obs_groups` used as
+            base for the 'add' scenarios.
+        reset_zero_weight: weight assigned to observations with null
+            weight in `obs_groups` (e.g., to evaluate the worth of
+            future sampling campaigns). If None, these observations do
+            not contribute to the worth of their groups.
+        block_size: number of rows of the Jacobian matrix processed in
+            one pass.
+        parallel: process blocks of predictions in parallel threads.
+        cache: save the information matrices of the groups to a cache
+            file, or reuse them if the cache file is up to date.
+
+    Returns:
+        A tuple containing:
+
+        * a pandas dataframe with a row for each scenario and group
+          (index levels 'scenario' and 'group') and a column for each
+          prediction, containing the reduction of predictive variance
+          attributable to each group;
+        * a dictionary with the times (in s) spent in calculating the
+          information matrices ('factor'), the scenario covariance
+          matrices ('scenarios'), the predictive variances
+          ('predictions') and in total ('total').
+
+    References:
+        * Doherty, J. (2010) *Methodologies and Software for PEST-Based
+          Model Predictive Uncertainty Analysis.* Watermark Numerical
+          Computing. 157 p.
+        * White, J.T.; Fienen, M.N.; Doherty, J.E. (2016) A python
+          framework for environmental model uncertainty analysis.
+          *Environmental Modelling & Software*, 85, 217-228.
+    """
+    t0 = time.perf_counter()
+    pst = pyemu.Pst(pst_file)
+    base = pst_file.rsplit('.', 1)[0]
+    if jco_file is None:
+        jco_file = base + '.jcb'
+    if predictions is None:
+        predictions = pst.zero_weight_obs_names
+    predictions = [p.lower() for p in predictions]
+    obs = pst.observation_data
+    if obs_groups is None:
+        obs_groups = {g: obs.loc[(obs.obgnme == g) & (obs.weight > 0),
+                                 'obsnme'].tolist()
+                      for g in pst.nnz_obs_groups}
+    if base_groups is None:
+        base_groups = []
+    group_names = list(obs_groups.keys())
+
+    # get row indexes and weights of the observation groups
+    jco, row_names, col_names = read_jco_memmap(jco_file)
+    row_inds = pd.Series(range(len(row_names)), index=row_names)
+    groups = []
+    for g in group_names:
+        names = [o.lower() for o in obs_groups[g]]
+        weights = obs.loc[names, 'weight'].values.astype(np.float64)
+        if reset_zero_weight is not None:
+            weights[weights == 0] = reset_zero_weight
+        groups.append((row_inds[names].values, weights))
+
+    # information matrices of the groups (from cache if up to date)
+    key = hashlib.sha1(str([os.path.getmtime(jco_file), group_names] +
+                           [(g[0].tolist(), g[1].tolist()) for g in groups]
+                           ).encode()).hexdigest()
+    cache_file = jco_file.rsplit('.', 1)[0] + '.dw.npz'
+    info = None
+    if cache and os.path.isfile(cache_file):
+        with np.load(cache_file) as data:
+            if str(data['key']) == key:
+                info = data['info']
+    if info is None:
+        info = info_matrices(jco, groups, block_size=block_size)
+        if cache:
+            np.savez(cache_file, key=key, info=info)
+    t1 = time.perf_counter()
+
+    # posterior covariance matrices of all the scenarios
+    prior_inv = np.linalg.inv(get_parcov(pst, col_names, parcov))
+    is_base = np.array([g in base_groups for g in group_names])
+    info_all = info.sum(axis=0)
+    info_base = info[is_base].sum(axis=0)
+    scen_info = np.concatenate([
+        (prior_inv + info_all)[np.newaxis],
+        prior_inv + info_all - info,
+        (prior_inv + info_base)[np.newaxis],
+        prior_inv + info_base +
+        info * (~is_base)[:, np.newaxis, np.newaxis]])
+    scen_covs = np.linalg.inv(scen_info)
+    t2 = time.perf_counter()
+
+    # predictive variances of all the scenarios
+    n_jobs = os.cpu_count() if parallel else 1
+    pvar = pred_variance(jco, row_inds[predictions].values, scen_covs,
+                         block_size=block_size, n_jobs=n_jobs)
+    ngroups = len(group_names)
+    removed = pvar[1:ngroups + 1] - pvar[0]
+    added = pvar[ngroups + 1] - pvar[ngroups + 2:]
+    index = pd.MultiIndex.from_product([['remove', 'add'], group_names],
+                                       names=['scenario', 'group'])
+    worth = pd.DataFrame(np.concatenate([removed, added]), index=index,
+                         columns=predictions)
+    t3 = time.perf_counter()
+
+    timings = {'factor': t1 - t0, 'scenarios': t2 - t1,
+               'predictions': t3 - t2, 'total': t3 - t0}
+
+    return worth, timings
+
+
+def sweep_sensitivity(pst_file, csv_in='sweep_in.csv', csv_out=None,
+                      n_bins=None, folder_out=None):
+    """Sensitivity indices from the results of a sweep.
+
+    Given-data sensitivity measures are calculated from the parameter
+    samples and the results of an existing sweep (e.g., a Monte Carlo
+    simulation made with :func:`monte_carlo`), without additional model
+    runs. The successful runs of all the realizations except the base
+    realization are used, and the measures are calculated for all the
+    observations at once (see :func:`sensitivity.rank_correlation`,
+    :func:`sensitivity.regression_coefs` and
+    :func:`sensitivity.binned_indices`). Parameters are used in log
+    space if they are log-transformed in `pst_file`. The measures assume
+    independent parameters (e.g., prior samples rather than posterior
+    ones).
+
+    Args:
+        pst_file: path of the pest file used to run the sweep.
+        csv_in: path of the file containing the parameter samples (CSV
+            or PEST binary format).
+        csv_out: path of the results file. If None, it is the PEST++
+            option `sweep_output_csv_file` of `pst_file` if it is set,
+            and otherwise :file:`sweep_out.csv` in the folder of
+            `csv_in`.
+        n_bins: number of bins used to calculate the first-order
+            indices (see :func:`sensitivity.binned_indices`).
+        folder_out: folder where the results are written. If None, it is
+            the folder of `csv_out`.
+
+    Returns:
+        A tuple of two pandas dataframes of sensitivity measures: one
+        with a MultiIndex (observation name, parameter name), and one
+        with a MultiIndex (observation group, parameter name), where
+        the measures of the observations of each group are averaged,
+        weighted by their variance (see
+        :func:`sensitivity.group_indices`). The columns are 'rho'
+        (Spearman's rank correlation coefficient), 'src' (standardized
+        regression coefficient), 'r2' (coefficient of determination of
+        the regression of the observation) and 'S1' (first-order
+        index). The first dataframe is written to the files
+        :file:`sweep_sen_<v>.txt` (see
+        :func:`input_output.write_gsa_indices`), and the second one to
+        the file :file:`sweep_sen_groups.txt`.
+    """
+    pst = pyemu.Pst(pst_file)
+    if csv_out is None:
+        csv_out = _sweep_out_path(pst, csv_in)
+    if folder_out is None:
+        folder_out = os.path.dirname(os.path.abspath(csv_out))
+
+    # Samples of successful runs
+    x, y = _sweep_pairs(pst, csv_in, csv_out, base=False)
+    obs_names = pst.obs_names
+
+    # Sensitivity measures
+    src, r2 = regression_coefs(x, y)
+    measures = {'rho': rank_correlation(x, y), 'src': src,
+                'r2': np.tile(r2, (x.shape[1], 1)),
+                'S1': binned_indices(x, y, n_bins=n_bins)}
+    index = pd.MultiIndex.from_product([obs_names, pst.adj_par_names],
+                                       names=['obsnme', 'parnme'])
+    by_obs = pd.DataFrame({k: v.T.ravel() for k, v in measures.items()},
+                          index=index)
+    weights = pd.Series(np.var(y, axis=0), index=obs_names)
+    by_group = group_indices(by_obs, pst.observation_data.obgnme, weights)
+
+    # Write results
+    write_gsa_indices(by_obs, pst.obs_groups, folder_out,
+                      prefix='sweep_sen_')
+    by_group.to_csv(os.path.join(folder_out, 'sweep_sen_groups.txt'),
+                    sep=' ')
+    return by_obs, by_group
+
+
+def train_emulator(pst_file, csv_in='sweep_in.csv', csv_out=None, degree=3,
+                   var_explained=0.9999, n_folds=5, alpha=1e-8, seed=None,
+                   fname=None):
+    """Train an emulator from the results of a sweep.
+
+    A polynomial chaos expansion of the observations (see
+    :func:`surrogate.fit_pce`) is fitted to the parameter samples and
+    the results of the successful runs of an existing sweep (e.g., a
+    Monte Carlo simulation made with :func:`monte_carlo`). Parameters
+    are scaled between their bounds (in log space if they are
+    log-transformed in `pst_file`, see :func:`sensitivity.par_to_unit`).
+    The emulator may then replace the model in :func:`monte_carlo` and
+    :func:`gsa` (argument `emulator`), as long as the parameter bounds
+    are unchanged; samples outside the range of the training samples
+    are flagged and run with the model.
+
+    Args:
+        pst_file: path of the pest file used to run the sweep.
+        csv_in: path of the file containing the parameter samples (CSV
+            or PEST binary format).
+        csv_out: path of the results file. If None, it is the PEST++
+            option `sweep_output_csv_file` of `pst_file` if it is set,
+            and otherwise :file:`sweep_out.csv` in the folder of
+            `csv_in`.
+        degree: maximum total degree of the polynomials.
+        var_explained: fraction of the variance of the standardized
+            observations explained by the principal components
+            emulated.
+        n_folds: number of folds of the cross-validation.
+        alpha: ridge penalty of the fit.
+        seed: seed of the random number generator used to split the
+            samples into folds.
+        fname: path of the file where the emulator is saved (see
+            :func:`surrogate.save_surrogate`). If None, it is
+            :file:`<csv_out root>.emulator.npz`.
+
+    Returns:
+        A tuple containing the emulator (a dictionary of arrays) and a
+        pandas dataframe of its cross-validation errors, indexed by
+        observation group: number of training runs ('n_runs'), root mean
+        squared error ('rmse'), rmse divided by the standard deviation
+        of the observations ('nrmse'), predictivity coefficient ('q2',
+        1 for a perfect emulator) and maximum absolute error
+        ('max_error'). The dataframe is written to the file
+        :file:`emulator_cv.txt` in the folder of `csv_out`.
+
+    References:
+        * Sudret, B. (2008) Global sensitivity analysis using polynomial
+          chaos expansions. *Reliability Engineering & System Safety*,
+          93, 964-979.
+    """
+    pst = pyemu.Pst(pst_file)
+    if csv_out is None:
+        csv_out = _sweep_out_path(pst, csv_in)
+    if fname is None:
+        fname = csv_out.rsplit('.', 1)[0] + '.emulator.npz'
+
+    # Fit on the successful runs
+    u, y = _sweep_pairs(pst, csv_in, csv_out, base=True)
+    model = fit_pce(u, y, degree=degree, var_explained=var_explained,
+                    n_folds=n_folds, alpha=alpha, seed=seed)
+    err = model.pop('cv_pred') - y
+    model['par_names'] = np.array(pst.adj_par_names)
+    model['obs_names'] = np.array(pst.obs_names)
+    save_surrogate(model, fname)
+
+    # Cross-validation errors by observation group
+    groups = pst.observation_data.loc[pst.obs_names, 'obgnme'].values
+    cv = pd.DataFrame(index=pd.Index(pst.obs_groups, name='obgnme'),
+                      columns=['n_runs', 'rmse', 'nrmse', 'q2', 'max_error'],
+                      dtype=np.float64)
+    for g in pst.obs_groups:
+        e, yg = err[:, groups == g], y[:, groups == g]
+        sse, sst = np.sum(e**2), np.sum((yg - yg.mean(axis=0))**2)
+        rmse = np.sqrt(np.mean(e**2))
+        cv.loc[g, :] = [y.shape[0], rmse, rmse / max(np.std(yg), 1e-300),
+                        1 - sse / sst if sst > 0 else np.nan,
+                        np.max(np.abs(e))]
+    cv['n_runs'] = cv['n_runs'].astype(np.int64)
+    cv.to_csv(os.path.join(os.path.dirname(os.path.abspath(csv_out)),
+                           'emulator_cv.txt'), sep=' ')
+    return model, cv
+
+
+def _draw_samples(pst, n_samples, distribution, sampler, parcov, how_dict,
+                  seed, skip=0, factor=None, chunk_size=None):
+    """Draw parameter samples for Monte Carlo simulations.
+
+    Args:
+        pst: a pest instance.
+        n_samples: number of samples to draw.
+        distribution: 'uniform', 'triangular', 'gaussian', 'mixed'.
+        sampler: 'random' (pyemu draws), 'lhs', 'sobol' or 'halton'.
+        parcov: parameter covariance.
+        how_dict: dictionary of parameter names (keys) and distributions
+            (values).
+        seed: seed of the random number generator.
+        skip: number of samples previously drawn (see
+            :func:`sampling.draw_ensemble`).
+        factor: factor of the parameter covariance (see
+            :func:`sampling.cov_factor`). If not None, gaussian samples
+            are drawn from it with any sampler.
+        chunk_size: number of realizations drawn in one pass from
+            `factor`.
+
+    Returns:
+        A :class:`pyemu.ParameterEnsemble` instance, whose realizations
+        are named from `skip` to `skip` + `n_samples` - 1.
+    """
+    if (sampler != 'random') or \
+            ((factor is not None) and (distribution == 'gaussian')):
+        pe = draw_ensemble(pst, n_samples, distribution=distribution,
+                           sampler=sampler, cov=parcov, how_dict=how_dict,
+                           seed=seed, skip=skip, factor=factor,
+                           chunk_size=chunk_size)
+    elif distribution == 'gaussian':
+        pe = pyemu.ParameterEnsemble.\
+            from_gaussian_draw(pst=pst, cov=parcov, num_reals=n_samples,
+                               by_groups=False)
+        pe.enforce(how='reset')
+    elif distribution == 'uniform':
+        pe = pyemu.ParameterEnsemble.from_uniform_draw(pst=pst,
+                                                       num_reals=n_samples)
+    elif distribution == 'triangular':
+        pe = pyemu.ParameterEnsemble.from_triangular_draw(pst=pst,
+                                                          num_reals=n_samples)
+    elif distribution == 'mixed':
+        pe = pyemu.ParameterEnsemble.\
+            from_mixed_draws(pst=pst, how_dict=how_dict, num_reals=n_samples,
+                             cov=parcov, enforce_bounds=True)
+    else:
+        raise KeyError
+    pe._df.index = np.arange(skip, skip + n_samples, dtype=np.int64)
+    return pe
+
+
+def _adaptive_sweep(pst, pst_file, csv_in, csv_out, pestpp_folder, parallel,
+                    process_swp_out, add_base, distribution, sampler, parcov,
+                    how_dict, seed, tol, batch_size, max_samples,
+                    percentiles, n_old=0, n_base=0, max_fail_rate=None,
+                    fail_window=100, factor=None, emulator=None,
+                    flag_factor=3.0):
+    """Adaptive Monte Carlo simulations (see :func:`monte_carlo`).
+
+    Returns:
+        A pandas dataframe with the convergence history.
+    """
+    if max_samples is None:
+        max_samples = 10 * batch_size
+    folder_out = os.path.dirname(csv_out)
+    se_cols = [f'se_p{p:02d}' for p in percentiles]
+    history = pd.DataFrame(columns=['n_samples', 'n_failed'] + se_cols +
+                           ['converged'])
+    obs_names = set(pst.obs_names)
+
+    n_done = n_old
+    while n_done < max_samples:
+        # Draw and run one batch, and merge it with previous ones
+        n_batch = min(batch_size, max_samples - n_done)
+        pe = _draw_samples(pst, n_batch, distribution, sampler, parcov,
+                           how_dict, seed, skip=n_done - n_base,
+                           factor=factor)
+        if add_base and (n_base == 0):
+            # the base realization replaces the last one of the batch
+            pe.add_base()
+            n_base = 1
+        mc_results = _run_batch(pst, pst_file, pe, csv_in, csv_out,
+                                pestpp_folder, parallel, append=n_done > 0,
+                                max_fail_rate=max_fail_rate,
+                                fail_window=fail_window, emulator=emulator,
+                                flag_factor=flag_factor)
+        n_done += n_batch
+
+        # Update statistics
+        if process_swp_out:
+            process_sweep_out(fname_in=csv_out, var_names=pst.obs_groups,
+                              folder_out=folder_out)
+        ok = mc_results['failed_flag'] == 0
+        cols = [c for c in mc_results.columns if c.lower() in obs_names]
+        se = np.nanmax(percentile_se(mc_results.loc[ok, cols].values,
+                                     percentiles), axis=1)
+        converged = bool(np.all(se <= tol))
+        history.loc[len(history), :] = [n_done, int((~ok).sum())] + \
+            list(se) + [converged]
+        history.to_csv(os.path.join(folder_out, 'mc_convergence.txt'),
+                       index=False, sep=' ')
+        if converged:
+            break
+
+    return history
+
+
+def _run_batch(pst, pst_file, pe, csv_in, csv_out, pestpp_folder, parallel,
+               append, chunk_size=None, max_fail_rate=None, fail_window=100,
+               emulator=None, flag_factor=3.0):
+    """Run a batch of realizations and merge it into a sweep.
+
+    The realizations are added to `csv_in` before being run, in chunks
+    of `chunk_size` realizations, with the files
+    :file:`<csv_in root>.<i>.csv` and :file:`<csv_out root>.<i>.csv`,
+    where `i` is the name of the first realization of the chunk. The
+    results are merged into `csv_out` after each chunk. If `emulator`
+    is not None, the realizations are first evaluated with it, and only
+    the flagged ones are run with the model.
+
+    Args:
+        pst: a pest instance.
+        pst_file: path of the pest file written to run the batch.
+        pe: parameter ensemble (or pandas dataframe) of the batch.
+        csv_in: sweep input file.
+        csv_out: sweep output file.
+        pestpp_folder: folder containing the PEST++ executables.
+        parallel: parallelize calculations.
+        append: merge the batch with the existing `csv_in` and
+            `csv_out`; otherwise, they are replaced by the batch.
+        chunk_size: number of realizations of each chunk. If None, the
+            batch is run in one chunk.
+        max_fail_rate: maximum fraction of failed runs (see
+            :func:`functions.run_sweep`). If not None and `parallel` is
+            True, the chunks have at most `fail_window` realizations.
+        fail_window: number of runs of the sliding window used to
+            calculate the fraction of failed runs.
+        emulator: surrogate model (dictionary or path of the file
+            written by :func:`train_emulator`).
+        flag_factor: threshold of the disagreement between the models
+            of the cross-validation of the emulator.
+
+    Returns:
+        A pandas dataframe containing the merged results.
+    """
+    in_root, in_ext = csv_in.rsplit('.', 1)
+    out_root = csv_out.rsplit('.', 1)[0]
+    if append:
+        batch_in = f'{in_root}.{pe.index[0]}.{in_ext}'
+        write_ensemble(pe, batch_in)
+        merge_sweep_files([csv_in, batch_in], csv_in, output=False)
+    else:
+        write_ensemble(pe, csv_in)
+
+    if emulator is not None:
+        # emulated results; flagged realizations are run with the model
+        emu_out = f'{out_root}.{pe.index[0]}.emulated.csv'
+        flags = _emulate(pst, pe, emulator, emu_out, flag_factor)
+        mc_results = merge_sweep_files([csv_out, emu_out] if append
+                                       else [emu_out], csv_out)
+        pe, append = pe.loc[flags, :], True
+    if chunk_size is None:
+        chunk_size = max(pe.shape[0], 1)
+    if parallel and (max_fail_rate is not None):
+        # failures of parallel runs are checked at the end of each chunk
+        chunk_size = min(chunk_size, fail_window)
+
+    for start in range(0, pe.shape[0], chunk_size):
+        chunk = pe.iloc[start:start + chunk_size, :]
+        chunk_in = f'{in_root}.{chunk.index[0]}.{in_ext}'
+        chunk_out = f'{out_root}.{chunk.index[0]}.csv'
+        prev_out = [csv_out] if append or (start > 0) else []
+        try:
+            run_sweep(pst, pst_file, chunk, chunk_in, chunk_out,
+                      pestpp_folder, parallel=parallel,
+                      max_fail_rate=max_fail_rate, fail_window=fail_window)
+        finally:
+            # keep the runs of an interrupted chunk
+            fnames = [f for f in prev_out + [chunk_out] if os.path.isfile(f)]
+            if len(fnames) > 0:
+                mc_results = merge_sweep_files(fnames, csv_out)
+    return mc_results
+
+
+def _emulate(pst, pe, emulator, fname, flag_factor):
+    """Evaluate realizations with an emulator (see :func:`_run_batch`).
+
+    The results are written to `fname` in the format of the sweep
+    output files of `pestpp-swp`, the flagged realizations being
+    recorded as failed runs.
+
+    Returns:
+        A boolean array of the flagged realizations.
+    """
+    if isinstance(emulator, str):
+        emulator = load_surrogate(emulator)
+    if (list(emulator['par_names']) != pst.adj_par_names) or \
+            (list(emulator['obs_names']) != pst.obs_names):
+        raise ValueError('The emulator was not trained with the ' +
+                         'parameters and observations of the pest file.')
+    if isinstance(pe, pyemu.Ensemble):
+        if pe.istransformed:
+            pe = pe.copy()
+            pe.back_transform()
+        pe = pe._df
+
+    # Simulated values (by chunks, to limit memory use)
+    n = pe.shape[0]
+    sim = np.empty((n, len(pst.obs_names)))
+    flags = np.empty(n, dtype=bool)
+    for start in range(0, n, 100000):
+        rows = slice(start, start + 100000)
+        sim[rows], flags[rows] = predict_pce(
+            emulator, par_to_unit(pst, pe.iloc[rows, :]),
+            flag_factor=flag_factor)
+    sim[flags] = np.nan
+
+    # Objective function (total, measurement, regularization, groups)
+    obs = pst.observation_data.loc[pst.obs_names, :]
+    res2 = ((sim - obs.obsval.values.astype(np.float64)) *
+            obs.weight.values.astype(np.float64))**2
+    phi_groups = pd.DataFrame({g: res2[:, (obs.obgnme == g).values].sum(
+        axis=1) for g in pst.obs_groups})
+    regul = [g for g in pst.obs_groups if g.startswith('regul')]
+    results = pd.DataFrame({
+        'run_id': np.arange(n), 'input_run_id': pe.index.astype(str),
+        'failed_flag': flags.astype(np.int64), 'phi': res2.sum(axis=1),
+        'meas_phi': phi_groups.drop(columns=regul).sum(axis=1).values,
+        'regul_phi': phi_groups.loc[:, regul].sum(axis=1).values})
+    results = pd.concat([results, phi_groups,
+                         pd.DataFrame(sim, columns=pst.obs_names)], axis=1)
+    results.loc[flags, 'phi':] = np.nan
+    results.to_csv(fname, index=False, na_rep='-1e10')
+    return flags
+
+
+def _missing_runs(csv_in, csv_out):
+    """Realizations of an interrupted sweep that remain to be run.
+
+    The results of `csv_out` and of the chunk output files
+    (:file:`<csv_out root>.<i>.csv`) written after `csv_in` are merged
+    into `csv_out`.
+
+    Returns:
+        A pandas dataframe containing the parameter values of the
+        realizations of `csv_in` that are missing or failed.
+    """
+    pe = read_ensemble(csv_in)
+    t_in = os.path.getmtime(csv_in)
+    out_root = csv_out.rsplit('.', 1)[0]
+    fnames = [f for f in sorted(glob.glob(f'{out_root}.*.csv'))
+              if os.path.getmtime(f) >= t_in]
+    if os.path.isfile(csv_out):
+        fnames = [csv_out] + fnames
+    if len(fnames) == 0:
+        return pe
+    mc_results = merge_sweep_files(fnames, csv_out)
+    done = mc_results.loc[mc_results['failed_flag'] == 0, 'input_run_id']
+    return pe.loc[~pe.index.isin(done.astype(str)), :]
+
+
+def _sweep_out_path(pst, csv_in):
+    """Path of the sweep output file.
+
+    Returns:
+        The PEST++ option `sweep_output_csv_file` of `pst` if it is
+        set; otherwise, :file:`sweep_out.csv` in the folder of `csv_in`.
+    """
+    return pst.pestpp_options.get(
+        'sweep_output_csv_file',
+        os.path.join(os.path.dirname(csv_in), 'sweep_out.csv'))
+
+
+def _sweep_pairs(pst, csv_in, csv_out, base=False):
+    """Parameter samples and results of the successful runs of a sweep.
+
+    Args:
+        base: keep the base realization.
+
+    Returns:
+        A tuple of two arrays: the parameter values scaled to the unit
+        interval (see :func:`sensitivity.par_to_unit`) and the
+        simulated values of the observations, one row per run.
+    """
+    pe = read_ensemble(csv_in)
+    results = read_sweep_out(csv_out)
+    results.columns = results.columns.str.lower()
+    ids = results['input_run_id'].astype(str)
+    ok = ((results['failed_flag'] == 0) & (base | (ids != 'base')) &
+          ids.isin(pe.index)).values
+    y = results.loc[ok, pst.obs_names].values
+    ok_rows = ~np.any(np.isnan(y), axis=1)
+    y = y[ok_rows]
+    x = par_to_unit(pst, pe.loc[ids[ok].values[ok_rows], :])
+    return x, y
+
+
+def _native_gsa(pst, pst_file, method, pestpp_folder, parallel, n_samples,
+                n_levels, n_candidates, seed, n_boot, chunk_size,
+                max_fail_rate, fail_window, extend=False, emulator=None,
+                flag_factor=3.0):
+    """Global sensitivity analysis with the native engine (see :func:`gsa`).
+
+    Returns:
+        A tuple of two pandas dataframes of sensitivity indices (by
+        observation and by observation group).
+    """
+    opts = pst.pestpp_options
+    base1 = pst_file.rsplit('.', 1)[0]
+    csv_in, csv_out = base1 + '.gsa_in.csv', base1 + '.gsa_out.csv'
+
+    # Design
+    n_old = 0
+    if method == 'sobol':
+        if n_samples is None:
+            n_samples = int(opts.get('gsa_sobol_samples', 4))
+        if extend and (seed is None):
+            raise ValueError('A seed is needed to extend a Sobol ' +
+                             'analysis (the same seed with each call).')
+        if extend and os.path.isfile(csv_in):
+            # rows of the existing design (the last one may be partial)
+            n_block = len(pst.adj_par_names) + 2
+            old = pd.read_csv(csv_in, index_col=0)
+            n_old = old.shape[0] // n_block
+            first = sobol_design(pst, 1, seed=seed)._df
+            if not np.allclose(old.iloc[:n_block, :].values,
+                               first.loc[:, old.columns].values):
+                raise ValueError('The existing design was not generated ' +
+                                 'with the same seed.')
+
+            # missing or failed runs of the complete rows
+            missing = _missing_runs(csv_in, csv_out)
+            missing = missing[missing.index.isin(
+                old.index[:n_old * n_block].astype(str))]
+            if missing.shape[0] > 0:
+                _run_batch(pst, pst_file, missing, csv_in, csv_out,
+                           pestpp_folder, parallel, append=True,
+                           chunk_size=chunk_size,
+                           max_fail_rate=max_fail_rate,
+                           fail_window=fail_window, emulator=emulator,
+                           flag_factor=flag_factor)
+        design = sobol_design(pst, max(n_samples - n_old, 0), seed=seed,
+                              skip=n_old)
+    elif method == 'morris':
+        if n_samples is None:
+            n_samples = int(opts.get('gsa_morris_r', 4))
+        if n_levels is None:
+            n_levels = int(opts.get('gsa_morris_p', 4))
+        design = morris_design(pst, n_samples, n_levels=n_levels,
+                               n_candidates=n_candidates, seed=seed)
+    else:
+        raise ValueError('Method not recognised. Choose "sobol" or ' +
+                         '"morris".')
+
+    # Model runs
+    if design.shape[0] > 0:
+        results = _run_batch(pst, pst_file, design, csv_in, csv_out,
+                             pestpp_folder, parallel, append=n_old > 0,
+                             chunk_size=chunk_size,
+                             max_fail_rate=max_fail_rate,
+                             fail_window=fail_window, emulator=emulator,
+                             flag_factor=flag_factor)
+    else:
+        results = read_sweep_out(csv_out)
+    design = pd.read_csv(csv_in, index_col=0)
+    folder_out = os.path.dirname(os.path.abspath(pst_file))
+    by_obs, by_group = _gsa_indices(pst, method, design, results, n_boot,
+                                    seed, folder_out)
+
+    if method == 'sobol':
+        # Convergence of the indices
+        fname = os.path.join(folder_out, 'gsa_sobol_convergence.txt')
+        n_rows = design.shape[0] // (len(pst.adj_par_names) + 2)
+        conv = pd.DataFrame({'n_samples': [n_rows],
+                             'n_runs': [results.shape[0]],
+                             'n_failed': [int(results['failed_flag'].
+                                              astype(bool).sum())],
+                             'S1_conf': [by_group['S1_conf'].max()],
+                             'ST_conf': [by_group['ST_conf'].max()]})
+        if (n_old > 0) and os.path.isfile(fname):
+            conv = pd.concat([pd.read_csv(fname, sep=' '), conv])
+        conv.to_csv(fname, sep=' ', index=False)
+    return by_obs, by_group
+
+
+def _gsa_indices(pst, method, design, results, n_boot, seed, folder_out):
+    """Sensitivity indices of a design and its results (see :func:`gsa`).
+
+    Returns:
+        A tuple of two pandas dataframes of sensitivity indices (by
+        observation and by observation group).
+    """
+    # outputs in the order of the design (failed runs are missing)
+    obs_names = pst.obs_names
+    results.columns = results.columns.str.lower()
+    ok = results['failed_flag'] == 0
+    ids = pd.to_numeric(results.loc[ok, 'input_run_id'], errors='coerce')
+    y = pd.DataFrame(results.loc[ok, obs_names].values, index=ids.values)
+    y = y[~y.index.duplicated(keep='last')]
+    y = y.reindex(design.index.astype(np.int64)).values
+
+    n_par = len(pst.adj_par_names)
+    if method == 'sobol':
+        indices = sobol_indices(y, n_par, n_boot=n_boot, seed=seed)
+        weights = pd.Series(indices.pop('var'), index=obs_names)
+    else:
+        indices = morris_indices(par_to_unit(pst, design), y, n_boot=n_boot,
+                                 seed=seed)
+        weights = None
+    index = pd.MultiIndex.from_product([obs_names, pst.adj_par_names],
+                                       names=['obsnme', 'parnme'])
+    by_obs = pd.DataFrame({k: v.T.ravel() for k, v in indices.items()},
+                          index=index)
+    by_group = group_indices(by_obs, pst.observation_data.obgnme, weights)
+
+    # Write results
+    prefix = f'gsa_{method}_'
+    write_gsa_indices(by_obs, pst.obs_groups, folder_out, prefix=prefix)
+    by_group.to_csv(os.path.join(folder_out, prefix + 'groups.txt'),
+                    sep=' ')
+    return by_obs, by_group
+
+
+def _ies_restart(pst, pst_file, restart, restart_iter, seed, ext='.csv'):
+    """Restart `pestpp-ies` from a previous run (see :func:`ies`).
+
+    The ensembles of the previous run may be in CSV or binary format,
+    and the restart ensembles are written with the extension `ext`.
+
+    Returns:
+        A dictionary summarizing the restart, also written to the file
+        :file:`<pst_file root>.restart.txt`.
+    """
+    prev = restart.rsplit('.', 1)[0]
+    master = os.path.join(os.path.dirname(os.path.abspath(restart)),
+                          'master', os.path.basename(prev))
+    if (len(glob.glob(prev + '.*.par.*')) == 0) and \
+            (len(glob.glob(master + '.*.par.*')) > 0):
+        # ensembles of a parallel run (folder master)
+        prev = master
+    base1 = pst_file.rsplit('.', 1)[0]
+    for option in ['ies_par_en', 'ies_obs_en', 'ies_restart_obs_en']:
+        pst.pestpp_options.pop(option, None)
+    files = {}
+    for fname in glob.glob(prev + '.*.*.*'):
+        it, kind, fext = fname[len(prev) + 1:].split('.', 2)
+        if it.isdigit() and kind in ['par', 'obs'] and \
+                fext.lower() in ['csv', 'jcb']:
+            files[(int(it), kind)] = fname
+    if restart_iter is None:
+        iters = [it for it, kind in files if kind == 'par']
+        if not iters:
+            raise FileNotFoundError(prev + '.<N>.par.csv')
+        restart_iter = max(iters)
+
+    # Parameter ensemble (new parameters take their initial values)
+    par_en = read_ensemble(files[(restart_iter, 'par')])
+    for name in pst.par_names:
+        if name not in par_en.columns:
+            par_en[name] = pst.parameter_data.loc[name, 'parval1']
+    write_ensemble(par_en[pst.par_names], base1 + '.restart.par' + ext)
+    pst.pestpp_options['ies_par_en'] = \
+        os.path.basename(base1 + '.restart.par' + ext)
+    pst.pestpp_options['ies_num_reals'] = len(par_en)
+
+    # Simulated values of the parameter ensemble
+    sim_ok = (restart_iter, 'obs') in files
+    if sim_ok:
+        sim_en = read_ensemble(files[(restart_iter, 'obs')])
+        sim_ok = set(pst.obs_names).issubset(sim_en.columns) and \
+            (set(sim_en.index) == set(par_en.index))
+    if sim_ok:
+        write_ensemble(sim_en.loc[par_en.index, pst.obs_names],
+                       base1 + '.restart.obs' + ext)
+        pst.pestpp_options['ies_restart_obs_en'] = \
+            os.path.basename(base1 + '.restart.obs' + ext)
+
+    # Observation ensemble (previous noise kept for unchanged weights)
+    obs = pst.observation_data
+    noise = pd.DataFrame(0.0, index=par_en.index, columns=pst.obs_names)
+    kept = pd.Index([])
+    noise_files = [prev + '.obs+noise' + fext for fext in ['.csv', '.jcb']
+                   if os.path.isfile(prev + '.obs+noise' + fext)]
+    if noise_files:
+        obs_prev = pyemu.Pst(restart).observation_data
+        noise_prev = read_ensemble(noise_files[0])
+        kept = obs.index[obs.weight > 0].intersection(
+            noise_prev.columns).intersection(obs_prev.index)
+        kept = kept[obs.loc[kept, 'weight'].values.astype(np.float64) ==
+                    obs_prev.loc[kept, 'weight'].values.astype(np.float64)]
+        noise_prev = noise_prev.reindex(par_en.index)
+        kept = kept[noise_prev[kept].notna().all().values]
+        noise[kept] = noise_prev[kept].values - \
+            obs_prev.loc[kept, 'obsval'].values.astype(np.float64)
+    drawn = obs.index[obs.weight > 0].difference(kept)
+    rng = np.random.default_rng(seed)
+    noise[drawn] = rng.standard_normal((len(par_en), len(drawn))) / \
+        obs.loc[drawn, 'weight'].values.astype(np.float64)
+    write_ensemble(noise + obs.loc[pst.obs_names, 'obsval'].values.astype(
+        np.float64), base1 + '.restart.obs+noise' + ext)
+    pst.pestpp_options['ies_obs_en'] = \
+        os.path.basename(base1 + '.restart.obs+noise' + ext)
+
+    summary = {'restart': restart, 'restart_iter': restart_iter,
+               'n_reals': len(par_en), 'restart_obs_en': sim_ok,
+               'n_noise_kept': len(kept), 'n_noise_drawn': len(drawn)}
+    write_dict(summary, base1 + '.restart.txt')
+    return summary
+
+
+def _set_calibration(pst, method, reg, control_data, svd_data, reg_data,
+                     pestpp_opts):
+    """Configure the calibration (see :func:`calibration`)."""
+    nobs = pst.nobs
+    npar = pst.npar
+
+    # Set calibration method
+    if method == 'glm':
+        # Make sure 'DE' is not used
+        if 'global_opt' in pst.pestpp_options:
+            pst.pestpp_options.pop('global_opt')
+    elif method == 'de':
+        pst.pestpp_options['global_opt'] = 'de'
+        if pestpp_opts is None:
+            pestpp_opts = {}
+        for k in pestpp_opts:
+            pst.pestpp_options[k] = pestpp_opts[k]
+    else:
+        raise ValueError('Method not recognised. Choose "glm" or "de".')
+
+    # Set regularisation configuration
+    if nobs < npar:
+        if not reg:
+            msg = 'nobs < npar, regularisation activated ' +\
+                '(value of variable reg switched to True).'
+            raise Warning(msg)
+        reg = True
+
+    if reg:
+        pyemu.helpers.zero_order_tikhonov(pst)
+        if reg_data is None:
+            reg_data = {}
+        for k in reg_data:
+            pst.reg_data.__setattr__(k, reg_data[k])
+    else:
+        pst.control_data.pestmode = 'estimation'
+
+    # Configure control data
+    if control_data is None:
+        control_data = {}
+    for k in control_data:
+        pst.control_data.__setattr__(k, control_data[k])
+
+    # Configure SVD data
+    if svd_data is None:
+        svd_data = {}
+    for k in svd_data:
+        pst.svd_data.__setattr__(k, svd_data[k])
+
+
+def _run_start(pst_file, pestpp_folder, n_iter, resume, num_workers, port):
+    """Run a stage of a start of :func:`multistart_calibration`.
+
+    If `resume` is True, the calibration is resumed from the parameter
+    values, the Jacobian matrix and the residuals of the previous stage
+    (PEST++ options `base_jcb` and `hotstart_resfile`), so that the
+    Jacobian matrix is not computed again. The parameter values of
+    `pst_file` are updated with the calibrated values.
+
+    Returns:
+        A pandas series containing the phi of the iterations.
+    """
+    pst = pyemu.Pst(pst_file)
+    folder = os.path.dirname(pst_file)
+    case = os.path.basename(pst_file)[:-4]
+    master_dir = os.path.join(folder, 'master')
+    par_file = os.path.join(master_dir, case + '.par')
+    for option in ['base_jcb', 'hotstart_resfile']:
+        pst.pestpp_options.pop(option, None)
+    if resume:
+        pst.parrep(par_file)
+        # files of the previous stage (the master folder is replaced)
+        for option, ext in [('base_jcb', '.jcb'),
+                            ('hotstart_resfile', '.rei')]:
+            fname = os.path.join(master_dir, case + ext)
+            if not os.path.isfile(fname):
+                break
+            copyfile(fname, os.path.join(folder, case + '.stage' + ext))
+            pst.pestpp_options[option] = case + '.stage' + ext
+    pst.control_data.noptmax = n_iter
+    pst.write(pst_file)
+    launch_pestpp(pst_file=pst_file, pestpp_folder=pestpp_folder,
+                  pestpp_cmd='pestpp-glm', parallel=True,
+                  num_workers=num_workers, port=port)
+    pst.parrep(par_file)
+    pst.control_data.noptmax = n_iter
+    pst.write(pst_file)
+    iobj = pd.read_csv(par_file[:-4] + '.iobj')
+    iobj.columns = iobj.columns.str.strip().str.lower()
+    return iobj['total_phi']
+
+
+def _warm_start(pst, pst_file, par_file):
+    """Start a calibration from a previous one (see :func:`calibration`).
+
+    Returns:
+        The path of the previous Jacobian matrix if it is compatible
+        with `pst`, otherwise None.
+    """
+    base0 = par_file.rsplit('.', 1)[0]
+    jco_file, res_file = base0 + '.jcb', base0 + '.rei'
+
+    # Initial parameter values
+    par = pst.parameter_data
+    adj_names = pst.adj_par_names
+    par_df = pyemu.pst_utils.read_parfile(par_file)
+    par_df.index = par_df.index.str.lower()
+    names = [n for n in adj_names if n in par_df.index]
+    par.loc[names, 'parval1'] = np.clip(
+        par_df.loc[names, 'parval1'].values.astype(np.float64),
+        par.loc[names, 'parlbnd'].values.astype(np.float64),
+        par.loc[names, 'parubnd'].values.astype(np.float64))
+
+    # Jacobian matrix and residuals
+    for option in ['base_jcb', 'hotstart_resfile']:
+        pst.pestpp_options.pop(option, None)
+    jco_ok, res_ok = False, False
+    if (len(names) == len(adj_names)) and os.path.isfile(jco_file):
+        row_names, col_names = read_jco_names(jco_file)
+        jco_ok = (set(col_names) == set(adj_names)) and \
+            (set(row_names) - set(pst.prior_names) == set(pst.obs_names))
+    if jco_ok:
+        pst.pestpp_options['base_jcb'] = os.path.abspath(jco_file)
+        if os.path.isfile(res_file):
+            res_df = pyemu.pst_utils.read_resfile(res_file)
+            res_ok = set(pst.obs_names).issubset(res_df.index.str.lower())
+        if res_ok:
+            pst.pestpp_options['hotstart_resfile'] = os.path.abspath(res_file)
+
+    write_dict({'par_file': par_file, 'n_par_seeded': len(names),
+                'n_par_adj': len(adj_names),
+                'base_jcb': jco_file if jco_ok else None,
+                'hotstart_resfile': res_file if res_ok else None},
+               pst_file.rsplit('.', 1)[0] + '.warm_start.txt')
+    return jco_file if jco_ok else None
+
+
+def _svd_assist(pst, pst_file, pestpp_folder, parallel, eig_thresh,
+                jco_file=None):
+    """Configure SVD-assisted calibration (see :func:`calibration`).
+
+    If `jco_file` is None, the base Jacobian matrix is calculated;
+    otherwise, the Jacobian matrix `jco_file` is used.
+
+    Returns:
+        A dictionary summarizing the runs saved, also written to the
+        file :file:`<pst_file root>.svda.txt`.
+    """
+    base1 = pst_file.rsplit('.', 1)[0]
+
+    # Base Jacobian matrix
+    for option in ['n_iter_base', 'n_iter_super', 'max_n_super']:
+        pst.pestpp_options.pop(option, None)
+    noptmax = pst.control_data.noptmax
+    n_base_runs = 0
+    if jco_file is None:
+        pst.pestpp_options.pop('base_jcb', None)
+        pst.control_data.noptmax = -1
+        pst.write(base1 + '.base.pst')
+        pst.control_data.noptmax = noptmax
+        # no stale matrix if the run fails (parallel runs write it in
+        # the folder master, and it is copied back by launch_pestpp)
+        jco_file = base1 + '.base.jcb'
+        if os.path.isfile(jco_file):
+            os.remove(jco_file)
+        launch_pestpp(pst_file=base1 + '.base.pst',
+                      pestpp_folder=pestpp_folder, pestpp_cmd='pestpp-glm',
+                      parallel=parallel)
+        if not os.path.isfile(jco_file):
+            raise RuntimeError(f'The base Jacobian matrix {jco_file} was ' +
+                               'not computed.')
+        n_base_runs = pst.npar_adj + 1
+
+    # Number of super parameters
+    jco, row_names, col_names = read_jco_memmap(jco_file)
+    row_inds = pd.Series(np.arange(len(row_names)), index=row_names)
+    obs = pst.observation_data.loc[pst.nnz_obs_names, :]
+    parcov = get_parcov(pst, col_names)
+    n_super, sv = super_dimension(jco, row_inds[obs.obsnme].values,
+                                  obs.weight.values, parcov,
+                                  eig_thresh=eig_thresh)
+    pd.DataFrame({'singular_value': sv}).to_csv(base1 + '.svda.csv',
+                                                index_label='component')
+
+    # PEST++ options
+    noptmax = max(noptmax, 1)
+    pst.pestpp_options['base_jcb'] = os.path.abspath(jco_file)
+    pst.pestpp_options['n_iter_base'] = -1
+    pst.pestpp_options['n_iter_super'] = noptmax
+    pst.pestpp_options['max_n_super'] = n_super
+
+    # Runs saved (Jacobian matrices only)
+    n_base = len(col_names)
+    summary = {'n_base': n_base, 'n_super': n_super,
+               'runs_full_glm': noptmax * (n_base + 1),
+               'runs_svda': n_base_runs + noptmax * (n_super + 1)}
+    summary['runs_saved'] = summary['runs_full_glm'] - summary['runs_svda']
+    write_dict(summary, base1 + '.svda.txt')
+    return summary
+
+
+def _linear_bands(pst, jco_file, res_file, parcov, n_samples):
+    """Percentile bands of all the observations by linear propagation.
+
+    Args:
+        pst: a pest instance.
+        jco_file: path of the Jacobian matrix file.
+        res_file: path of the residuals file containing the simulated
+            values used as mean values.
+        parcov: parameter covariance (:class:`pyemu.Matrix` instance).
+        n_samples: sample size used to estimate minimum and maximum.
+
+    Returns:
+        A pandas dataframe indexed by observation names (see
+        :func:`linear.normal_bands`).
+    """
+    if not os.path.isfile(res_file):
+        raise FileNotFoundError('Residuals file not found: ' + res_file)
+    jco, row_names, col_names = read_jco_memmap(jco_file)
+    cov = get_parcov(pst, col_names, parcov)
+    sd = np.sqrt(pred_variance(jco, np.arange(len(row_names)), [cov])[0])
+    res = pyemu.pst_utils.read_resfile(res_file)
+    res.index = res.index.str.lower()
+    mean = res.modelled.reindex(row_names).values
+    return normal_bands(mean, sd, n_samples=n_samples, index=row_names)
+
+
+def _check_linear_bands(bands, csv_out, pst):
+    """Compare Monte Carlo samples with linearized percentile bands.
+
+    Args:
+        bands: pandas dataframe returned by :func:`_linear_bands`.
+        csv_out: path of the :file:`sweep_out.csv` file.
+        pst: a pest instance.
+
+    Returns:
+        A pandas dataframe indexed by observation group (see
+        :func:`monte_carlo`).
+    """
+    mc_results = pd.read_csv(csv_out, na_values=-1e10)
+    mc_results.columns = mc_results.columns.str.lower()
+    mc_results = mc_results.loc[mc_results['failed_flag'] == 0, :]
+    z95 = norm.ppf(0.95)
+    check = pd.DataFrame(index=pst.obs_groups,
+                         columns=['n_runs', 'coverage_90', 'mean_bias',
+                                  'sd_ratio'], dtype=np.float64)
+    obs = pst.observation_data
+    for g in pst.obs_groups:
+        names = [o for o in obs.loc[obs.obgnme == g, 'obsnme']
+                 if o in mc_results.columns and o in bands.index]
+        sim = mc_results[names].values
+        b = bands.loc[names, :]
+        sd = (b['p95'] - b['p50']).values / z95
+        inside = (sim >= b['p05'].values) & (sim <= b['p95'].values)
+        check.loc[g, 'n_runs'] = sim.shape[0]
+        check.loc[g, 'coverage_90'] = np.mean(inside)
+        check.loc[g, 'mean_bias'] = np.nanmean(
+            (np.nanmean(sim, axis=0) - b['p50'].values) / sd)
+        check.loc[g, 'sd_ratio'] = np.nanmean(
+            np.nanstd(sim, axis=0, ddof=1) / sd)
+    return check
+
+
+def _ensemble_jco(pst, par_csv, obs_csv, jco_file, alpha):
+    """Write the Jacobian matrix estimated from an ensemble.
+
+    See :func:`linear_uncertainty` and :func:`linear.ensemble_jacobian`.
+
+    Returns:
+        The observation ensemble of the realizations used.
+    """
+    par_en = read_ensemble(par_csv)
+    if (not obs_csv.lower().endswith('.csv')) or \
+            ('input_run_id' in pd.read_csv(obs_csv, nrows=0).columns):
+        # sweep results or binary ensemble: ignore failed runs
+        obs_en = read_sweep_out(obs_csv)
+        obs_en = obs_en[obs_en.failed_flag == 0].set_index('input_run_id')
+        obs_en.columns = obs_en.columns.str.lower()
+    else:
+        obs_en = read_ensemble(obs_csv)
+    obs_en.index = obs_en.index.astype(str)
+    obs_en = obs_en[pst.obs_names].dropna()
+    reals = par_en.index.intersection(obs_en.index)
+    if len(reals) < 2:
+        raise ValueError('The parameter and observation ensembles have ' +
+                         'less than 2 common realizations.')
+
+    adj_names = pst.adj_par_names
+    par = par_en.loc[reals, adj_names].values.astype(np.float64)
+    log_pars = (pst.parameter_data.loc[adj_names, 'partrans'] ==
+                'log').values
+    par[:, log_pars] = np.log10(par[:, log_pars])
+    jco = ensemble_jacobian(par, obs_en.loc[reals, :].values, alpha=alpha)
+    pyemu.Jco(x=jco, row_names=pst.obs_names,
+              col_names=adj_names).to_binary(jco_file)
+    return obs_en.loc[reals, :]
+
+
+def _check_calib_files(pst, pst_file):
+    """Check whether the files of a calibration can be reused.
+
+    The Jacobian matrix (:file:`.jcb`) is considered up to date when it
+    and the parameter file (:file:`.par`) are more recent than
+    `pst_file`, and the names of its rows (ignoring the prior
+    information of a regularized calibration) and columns match the
+    observations and the adjustable parameters in `pst`. The names of
+    the parameters in the :file:`.par` file must also match those in
+    `pst`. The parameter values at which the Jacobian matrix was
+    computed are not checked: PEST++ computes it at the start of the
+    last iteration, so that it may differ slightly from the Jacobian
+    matrix at the values of the :file:`.par` file. The residuals file
+    (:file:`.rei`) is considered up to date when it is more recent than
+    `pst_file` and contains all the observations in `pst`.
+
+    Args:
+        pst: a pest instance loaded from `pst_file`.
+        pst_file: path of the pest file used for the calibration.
+
+    Returns:
+        A tuple of booleans indicating whether the Jacobian matrix and
+        the residuals can be reused.
+    """
+    base = pst_file.rsplit('.', 1)[0]
+    jco_file, par_file, res_file = [base + ext for ext in
+                                    ['.jcb', '.par', '.rei']]
+    t_pst = os.path.getmtime(pst_file)
+
+    # check Jacobian matrix and parameter file
+    if not (os.path.isfile(jco_file) and os.path.isfile(par_file)):
+        return False, False
+    if min(os.path.getmtime(jco_file), os.path.getmtime(par_file)) < t_pst:
+        return False, False
+    par_df = pyemu.pst_utils.read_parfile(par_file)
+    if set(par_df.parnme.str.lower()) != set(pst.par_names):
+        return False, False
+    row_names, col_names = read_jco_names(jco_file)
+    if (set(col_names) != set(pst.adj_par_names)) or \
+            (set(row_names) - set(pst.prior_names) != set(pst.obs_names)):
+        return False, False
+
+    # check residuals file
+    res_ok = False
+    if os.path.isfile(res_file) and os.path.getmtime(res_file) >= t_pst:
+        res_df = pyemu.pst_utils.read_resfile(res_file)
+        res_ok = set(pst.obs_names).issubset(res_df.index.str.lower())
+
+    return True, res_ok
@@ -0,0 +1,215 @@
+"""Functions to run the analyses of many sites as one campaign.
+
+The functions in this module schedule the analyses of many sites
+(e.g., the calibration and uncertainty analyses of hundreds of lakes)
+over one global pool of worker slots (cores). The analyses of each
+site are a pipeline of stages (see :func:`pipeline.analysis_stages`
+and :func:`pipeline.run_pipeline`), run in its own process and folder,
+so that the failure of a site does not stop the others, and a campaign
+run again only runs the stages that are not up to date. Each site
+requests a number of slots, which are given to the PEST++ runs of its
+stages as workers, with a port of its own (see
+:func:`functions.launch_pestpp`), and the sites are started by order
+of priority and of expected cost as soon as enough slots are free.
+
+This module contains the following functions:
+
+    * :func:`run_campaign`: run the analyses of many sites.
+
+"""
+# Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
+#
+# This file is part of the Python package "cuspy".
+#
+# The package "cuspy" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The package "cuspy" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os.path
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from cuspy.input_output import write_dict
+from cuspy.pipeline import run_pipeline
+
+
+def run_campaign(sites, n_slots=None, max_running=None, start_interval=0,
+                 base_port=4004, report_file='campaign.txt', verbose=True):
+    """Run the analyses of many sites.
+
+    The sites waiting to be run are sorted by decreasing priority and,
+    for equal priorities, by decreasing expected cost (so that long
+    analyses do not end the campaign alone). A site is started as soon
+    as it has enough free slots (a site that does not fit may be
+    overtaken by smaller ones), and at most `max_running` sites run at
+    the same time, started at least `start_interval` seconds apart.
+    The stages of a site whose argument `parallel` is True run PEST++
+    with as many workers as the slots of the site (or serially if it has
+    one slot), on the port `base_port` plus the position of the site in
+    `sites`. The failures of a site (exceptions of its stages, see
+    :func:`pipeline.run_pipeline`) are recorded in the report and do not
+    stop the other sites.
+
+    Args:
+        sites: list of sites. Each site is a dictionary with the keys
+            'name' (unique name), 'folder' (working folder of the site,
+            where its paths are relative to), 'stages' (list of stages
+            of the site, see :func:`pipeline.run_pipeline`) and,
+            optionally, 'priority' (default 0), 'slots' (number of
+            worker slots, default 1) and 'cost' (expected cost, e.g.,
+            run time in seconds; by default, the run time of the last
+            run of its stages if the site was run before, and 1
+            otherwise).
+        n_slots: number of worker slots of the pool. If None, the
+            number of cores.
+        max_running: maximum number of sites run at the same time. If
+            None, it is `n_slots`.
+        start_interval: minimum time (in seconds) between the starts of
+            two sites.
+        base_port: port of the first site.
+        report_file: path of the report file.
+        verbose: print the progress of the campaign when a site ends.
+
+    Returns:
+        A tuple containing a pandas dataframe indexed by site name with
+        the priority, slots, expected cost, status ('waiting',
+        'running', 'done' or 'failed'), start and run time (seconds
+        from the start of the campaign) and error message of each site,
+        and a dictionary summarizing the campaign (number of sites done
+        and failed, elapsed time, throughput in sites per hour, fraction
+        of the expected cost done and use of the slots). The dataframe
+        is written to `report_file` and the summary to
+        :file:`<report_file root>.summary.txt`, each time a site ends.
+    """
+    if n_slots is None:
+        n_slots = os.cpu_count()
+    if max_running is None:
+        max_running = n_slots
+    names = [site['name'] for site in sites]
+    if len(set(names)) < len(names):
+        raise ValueError('Site names must be unique.')
+    report = pd.DataFrame(
+        {'priority': [site.get('priority', 0) for site in sites],
+         'slots': [min(site.get('slots', 1), n_slots) for site in sites],
+         'cost': [_site_cost(site) for site in sites],
+         'status': 'waiting', 'start': np.nan, 'seconds': np.nan,
+         'error': ''}, index=pd.Index(names, name='site'))
+    queue = list(report.sort_values(['priority', 'cost'],
+                                    ascending=False).index)
+    by_name = {site['name']: (i, site) for i, site in enumerate(sites)}
+
+    t0, last_start = time.time(), -np.inf
+    free, running = n_slots, {}
+    summary = _summary(report, 0, n_slots)
+    with ProcessPoolExecutor(min(max_running, n_slots)) as executor:
+        while len(queue) + len(running) > 0:
+            # Start the sites that fit in the free slots
+            for name in list(queue):
+                wait_time = last_start + start_interval - time.time()
+                if (len(running) >= max_running) or (wait_time > 0):
+                    break
+                if report.loc[name, 'slots'] > free:
+                    continue
+                i, site = by_name[name]
+                slots = int(report.loc[name, 'slots'])
+                parallel = {'num_workers': slots, 'port': base_port + i} \
+                    if slots > 1 else False
+                future = executor.submit(_run_site,
+                                         os.path.abspath(site['folder']),
+                                         site['stages'], name, parallel)
+                running[future] = name
+                queue.remove(name)
+                free -= slots
+                last_start = time.time()
+                report.loc[name, ['status', 'start']] = \
+                    ['running', last_start - t0]
+
+            # Wait for a site to end (or for the next start)
+            timeout = None
+            if (len(queue) > 0) and (start_interval > 0):
+                timeout = max(last_start + start_interval - time.time(), 0)
+            if len(running) == 0:
+                time.sleep(timeout or 0)
+                continue
+            done, _ = wait(running, timeout=timeout,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                free += int(report.loc[name, 'slots'])
+                report.loc[name, 'seconds'] = \
+                    time.time() - t0 - report.loc[name, 'start']
+                try:
+                    future.result()
+                    report.loc[name, 'status'] = 'done'
+                except Exception as e:
+                    report.loc[name, ['status', 'error']] = \
+                        ['failed', f'{type(e).__name__}: {e}']
+            if len(done) > 0:
+                summary = _summary(report, time.time() - t0, n_slots)
+                report.to_csv(report_file, sep=' ')
+                write_dict(summary,
+                           report_file.rsplit('.', 1)[0] + '.summary.txt')
+                if verbose:
+                    print(f'{summary["n_done"]} done, '
+                          f'{summary["n_failed"]} failed, '
+                          f'{summary["n_running"]} running and '
+                          f'{summary["n_waiting"]} waiting sites '
+                          f'({summary["cost_done"]:.0%} of cost, '
+                          f'{summary["sites_per_hour"]:.1f} sites/h)')
+    return report, summary
+
+
+def _run_site(folder, stages, name, parallel):
+    """Run the stages of a site in its folder (see :func:`run_campaign`).
+
+    Returns:
+        The report of :func:`pipeline.run_pipeline`.
+    """
+    os.chdir(folder)
+    stages = [dict(stage, kwargs=dict(stage.get('kwargs', {}),
+                                      parallel=parallel))
+              if stage.get('kwargs', {}).get('parallel') is True else stage
+              for stage in stages]
+    return run_pipeline(stages, state_file=f'{name}.pipeline.json')
+
+
+def _site_cost(site):
+    """Expected cost of a site (see :func:`run_campaign`)."""
+    if 'cost' in site:
+        return float(site['cost'])
+    state_file = os.path.join(site['folder'], f'{site["name"]}.pipeline.json')
+    if os.path.isfile(state_file):
+        with open(state_file) as f:
+            seconds = [s['seconds'] for s in json.load(f)['stages'].values()]
+        if len(seconds) > 0:
+            return float(sum(seconds))
+    return 1.0
+
+
+def _summary(report, elapsed, n_slots):
+    """Summary of the progress of a campaign."""
+    status = report['status']
+    ended = status.isin(['done', 'failed'])
+    busy = report.loc[ended, 'seconds'] * report.loc[ended, 'slots']
+    return {'n_sites': len(report),
+            'n_done': int((status == 'done').sum()),
+            'n_failed': int((status == 'failed').sum()),
+            'n_running': int((status == 'running').sum()),
+            'n_waiting': int((status == 'waiting').sum()),
+            'elapsed': elapsed,
+            'sites_per_hour': 3600 * int(ended.sum()) / max(elapsed, 1e-9),
+            'cost_done': report.loc[ended, 'cost'].sum() /
+            report['cost'].sum(),
+            'slot_use': busy.sum() / (n_slots * max(elapsed, 1e-9))}
@@ -1,10 +1,13 @@
 """Useful functions.
 
-The function in this module is used to launch the PEST++ executable.
+The functions in this module are used to launch the PEST++ executables.
 
-This module contains the following function:
+This module contains the following functions:
 
+    * :func:`failure_summary`: parameter region of failed runs
     * :func:`launch_pestpp`: launch PEST++ executable
+    * :func:`run_site_models`: run the models of several sites
+    * :func:`run_sweep`: run a sweep of parameter sets
 
 """
 # Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
@@ -23,14 +26,70 @@ This module contains the following function:
 #
 # You should have received a copy of the GNU General Public License
 # along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import json
 import os
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from shutil import copyfile
 
+import numpy as np
+import pandas as pd
 import pyemu
+from scipy.stats import ks_2samp
+
+from cuspy.input_output import read_sweep_out, write_ensemble
+
+
+def failure_summary(pe, results):
+    """Parameter region of failed runs.
+
+    The parameter values of the failed and successful runs of a sweep
+    are compared to identify the parameters associated with model
+    failures. For each parameter, the two-sample Kolmogorov-Smirnov
+    statistic measures the difference between the distributions of the
+    values of failed and successful runs (0: same distribution, 1:
+    disjoint ranges).
+
+    Args:
+        pe: a :class:`pyemu.ParameterEnsemble` instance or a pandas
+            dataframe containing the parameter sets of the sweep.
+        results: pandas dataframe containing the results of the sweep
+            (see :func:`input_output.read_sweep_out`).
+
+    Returns:
+        A pandas dataframe indexed by parameter name, sorted by
+        decreasing Kolmogorov-Smirnov statistic, with the columns
+        'n_failed', 'fail_min', 'fail_max', 'fail_median' (statistics of
+        the values of failed runs), 'ok_min', 'ok_max', 'ok_median'
+        (statistics of the values of successful runs) and 'ks'.
+    """
+    if isinstance(pe, pyemu.ParameterEnsemble):
+        pe = pe._df
+    par = pe.copy()
+    par.index = par.index.astype(str)
+    ids = results['input_run_id'].astype(str)
+    par = par.loc[ids[ids.isin(par.index)], :]
+    failed = results.loc[ids.isin(par.index).values, 'failed_flag'].\
+        values != 0
+    par = par.loc[:, par.std() > 0]
+    summary = pd.DataFrame(index=par.columns)
+    summary['n_failed'] = failed.sum()
+    for name, rows in [('fail', failed), ('ok', ~failed)]:
+        summary[f'{name}_min'] = par[rows].min()
+        summary[f'{name}_max'] = par[rows].max()
+        summary[f'{name}_median'] = par[rows].median()
+    if failed.any() and (~failed).any():
+        summary['ks'] = [ks_2samp(par.loc[failed, c], par.loc[~failed, c])[0]
+                         for c in par.columns]
+    else:
+        summary['ks'] = np.nan
+    return summary.sort_values(by='ks', ascending=False)
 
 
 def launch_pestpp(pst_file, pestpp_folder, pestpp_cmd='pestpp-glm',
-                  parallel=False):
+                  parallel=False, monitor=None, poll_interval=10,
+                  num_workers=None, port=4004):
     """Launch PEST++ executable.
 
     This function launches the requested PEST++ executable, either
@@ -54,12 +113,31 @@ def launch_pestpp(pst_file, pestpp_folder, pestpp_cmd='pestpp-glm',
         pestpp_cmd: PEST++ executable. The PEST++ executables are:
             "pestpp-glm", "pestpp-sen", "pestpp-opt", "pestpp-ies" and
             "pestpp-swp".
-        parallel: parallelize calculations.
+        parallel: parallelize calculations. It may also be a dictionary
+            with the keys 'num_workers' and 'port', whose values replace
+            the arguments of the same names, so that the analyses
+            calling this function may be given their workers and port
+            through their argument `parallel` (see
+            :func:`campaign.run_campaign`).
+        monitor: function without arguments called every `poll_interval`
+            seconds while the PEST++ executable runs (only at the end of
+            the run if `parallel` is True). If it returns a message
+            (string), the run is stopped and a RuntimeError is raised
+            with this message.
+        poll_interval: time (in seconds) between calls of `monitor`.
+        num_workers: number of workers started if `parallel` is True. If
+            None, the number of cores.
+        port: port used by the master and the workers if `parallel` is
+            True (several PEST++ runs in parallel need different ports).
 
     Returns:
         The output of the PEST++ command is shown on screen. In
         addition, the `pestpp_cmd` output files are written in the
-        folder containing the `pst_file`.
+        folder containing the `pst_file`. In parallel, PEST++ runs in
+        the folder :file:`master` of this folder, and the files it
+        writes there (e.g., :file:`.par`, :file:`.jcb`, :file:`.rei`
+        and :file:`.post.cov`) are copied back next to `pst_file`, so
+        that later analyses find them.
 
     References:
         * White, J.T. (2018) A model-independent iterative ensemble
@@ -73,22 +151,185 @@ def launch_pestpp(pst_file, pestpp_folder, pestpp_cmd='pestpp-glm',
         * White, J.; Welter, D.; Doherty, J. (2019) *PEST++ Version
           4.2.16*. PEST++ Development Team. 175 p.
     """
+    if isinstance(parallel, dict):
+        num_workers = parallel.get('num_workers', num_workers)
+        port = parallel.get('port', port)
     if parallel:
         # Set folders and paths
-        folder = os.path.dirname(pst_file)
+        folder = os.path.dirname(os.path.abspath(pst_file))
         master_dir = os.path.join(folder, 'master')
         exe_path = os.path.join(pestpp_folder, pestpp_cmd)
         exe_rel_path = os.path.relpath(exe_path, master_dir)
         pst_rel_path = os.path.basename(pst_file)
         worker_root = os.path.dirname(master_dir)
+        t_start = time.time()
         # Run PEST++ command
         pyemu.helpers.start_workers(worker_dir=folder,
                                     exe_rel_path=exe_rel_path,
                                     pst_rel_path=pst_rel_path,
-                                    worker_root=worker_root,
+                                    num_workers=num_workers,
+                                    worker_root=worker_root, port=port,
                                     master_dir=master_dir)
-    else:
+        # Copy the files written by the master next to the pest file
+        for root, _, fnames in os.walk(master_dir):
+            for fname in fnames:
+                src = os.path.join(root, fname)
+                if os.path.getmtime(src) < t_start:
+                    continue
+                dst = os.path.join(folder, os.path.relpath(src, master_dir))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                copyfile(src, dst)
+        message = monitor() if monitor is not None else None
+    elif monitor is None:
         # Run PEST++ command
         subprocess.run([os.path.join(pestpp_folder, pestpp_cmd),
                         pst_file])
+        message = None
+    else:
+        # Run PEST++ command and check its progress
+        message = None
+        with subprocess.Popen([os.path.join(pestpp_folder, pestpp_cmd),
+                               pst_file]) as proc:
+            while message is None:
+                try:
+                    proc.wait(timeout=poll_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    message = monitor()
+            if message is not None:
+                proc.terminate()
+                proc.wait()
+        message = message or monitor()
+    if message is not None:
+        raise RuntimeError(message)
     return
+
+
+def run_site_models(sites_file, n_jobs=None):
+    """Run the models of several sites.
+
+    This function is the model command of the regional pest files (see
+    :func:`input_output.write_regional_pest_files`). The model command
+    of each site is run in its folder, and at most `n_jobs` site models
+    are run concurrently. The output file of each site is deleted before
+    its model is run, so that PEST++ records a failed run if the model
+    of a site fails.
+
+    Args:
+        sites_file: path of the JSON file listing the sites (keys
+            'name', 'folder', 'command' and 'output_file' of each site
+            in the list 'sites'; folders relative to the folder of
+            `sites_file`) and the default value of `n_jobs` (key
+            'n_jobs').
+        n_jobs: maximum number of site models run concurrently. If
+            None, it is read from `sites_file`, or else it is the number
+            of cores.
+
+    Returns:
+        The output files of the site models are written in the folders
+        of the sites. If some of the models fail, a RuntimeError is
+        raised once all of them are finished.
+    """
+    with open(sites_file) as f:
+        sites_dict = json.load(f)
+    folder0 = os.path.dirname(os.path.abspath(sites_file))
+    if n_jobs is None:
+        n_jobs = sites_dict.get('n_jobs') or os.cpu_count()
+
+    def _run_site(site):
+        folder = os.path.join(folder0, site['folder'])
+        output_file = os.path.join(folder, site['output_file'])
+        if os.path.isfile(output_file):
+            os.remove(output_file)
+        return subprocess.run(site['command'], shell=True,
+                              cwd=folder).returncode
+
+    with ThreadPoolExecutor(n_jobs) as executor:
+        codes = list(executor.map(_run_site, sites_dict['sites']))
+    failed = [site['name'] for site, code in zip(sites_dict['sites'], codes)
+              if code != 0]
+    if len(failed) > 0:
+        raise RuntimeError(f'The models of the sites {failed} failed.')
+    return
+
+
+def run_sweep(pst, pst_file, pe, csv_in, csv_out, pestpp_folder,
+              parallel=False, max_fail_rate=None, fail_window=100,
+              poll_interval=10):
+    """Run a sweep of parameter sets.
+
+    The parameter sets are written to `csv_in`, the pest instance is
+    configured to read them and to write the results to `csv_out`, and
+    the model is run for each parameter set with `pestpp-swp`.
+
+    If `max_fail_rate` is not None, the sweep works as a circuit
+    breaker: the fraction of failed runs among the last `fail_window`
+    runs written to `csv_out` is checked every `poll_interval` seconds
+    (only at the end of the sweep if `parallel` is True, so that the
+    sweeps of :mod:`analyses` run in parallel with a `max_fail_rate`
+    are split into sweeps of at most `fail_window` runs). If it exceeds
+    `max_fail_rate`, the sweep is stopped, the parameter region of the
+    failed runs (see :func:`failure_summary`) is written to
+    :file:`<csv_out root>.failures.txt` and a RuntimeError is raised.
+    The realizations already run are kept in `csv_out`, so that the
+    sweep may be resumed once the model setup has been fixed.
+
+    Args:
+        pst: a pest instance.
+        pst_file: path of the pest file written to run the sweep.
+        pe: a :class:`pyemu.ParameterEnsemble` instance or a pandas
+            dataframe containing the parameter sets (one row per
+            realization, indexed by realization names).
+        csv_in: path of the file where the parameter sets are written
+            (in PEST binary format if its extension is not
+            :file:`.csv`, see :func:`input_output.write_ensemble`).
+        csv_out: path of the file where `pestpp-swp` writes the
+            results.
+        pestpp_folder: folder containing the PEST++ executables.
+        parallel: parallelize calculations.
+        max_fail_rate: maximum fraction of failed runs (between 0 and
+            1). If None, the failures are not monitored.
+        fail_window: number of runs of the sliding window used to
+            calculate the fraction of failed runs. Sweeps of fewer
+            runs are checked once all their runs are done.
+        poll_interval: time (in seconds) between checks of `csv_out`.
+
+    Returns:
+        A pandas dataframe containing the results of the simulations
+        (see :func:`input_output.read_sweep_out`).
+    """
+    # Absolute paths, so that results are found also for parallel runs
+    csv_in, csv_out = os.path.abspath(csv_in), os.path.abspath(csv_out)
+    pst.pestpp_options['sweep_parameter_csv_file'] = csv_in
+    pst.pestpp_options['sweep_output_csv_file'] = csv_out
+    pst.write(pst_file)
+    write_ensemble(pe, csv_in)
+    if os.path.isfile(csv_out):
+        os.remove(csv_out)
+
+    def _check_failures():
+        # fraction of failed runs in the sliding window
+        try:
+            results = read_sweep_out(csv_out)
+        except (OSError, ValueError, pd.errors.EmptyDataError):
+            return None
+        n_min = min(fail_window, pe.shape[0])
+        if results.shape[0] < n_min:
+            return None
+        rate = np.mean(results['failed_flag'].values[-n_min:] != 0)
+        if rate <= max_fail_rate:
+            return None
+        summary = failure_summary(pe, results)
+        fname = csv_out.rsplit('.', 1)[0] + '.failures.txt'
+        summary.to_csv(fname, sep=' ', index_label='parnme')
+        return (f'{rate:.0%} of the last {n_min} runs failed ' +
+                f'(maximum {max_fail_rate:.0%}); sweep stopped after ' +
+                f'{results.shape[0]} runs. Parameters associated with ' +
+                'failures:\n' + summary.head().to_string() +
+                f'\nSee {fname}.')
+
+    launch_pestpp(pst_file=pst_file, pestpp_folder=pestpp_folder,
+                  pestpp_cmd='pestpp-swp', parallel=parallel,
+                  monitor=_check_failures if max_fail_rate is not None
+                  else None, poll_interval=poll_interval)
+    return read_sweep_out(csv_out)
@@ -6,11 +6,21 @@ input and output files.
 This module contains the following functions:
 
 - :func:`get_obs_data`: Get observation data.
+- :func:`merge_sweep_files`: Merge sweep input and output files.
 - :func:`process_sweep_out`: Process file :file:`sweep_out.csv`.
+- :func:`read_ensemble`: Read an ensemble file.
+- :func:`read_ies_memmap`: Read the ensembles of the iterations of IES.
+- :func:`read_jco_memmap`: Read a Jacobian file as a memory-mapped array.
+- :func:`read_jco_names`: Read row and column names of a Jacobian file.
+- :func:`read_sweep_out`: Read file :file:`sweep_out.csv`.
+- :func:`write_gsa_indices`: Write results of global sensitivity analyses.
+- :func:`write_lin_uncert`: Write results of linear uncertainty analyses.
 - :func:`write_dict`: Write dictionary to file.
+- :func:`write_ensemble`: Write an ensemble file.
 - :func:`write_dummy_pred_file`: Write a predictions file with dummy values.
 - :func:`write_ins_file`: Write PEST instruction file.
 - :func:`write_pest_files`: Writes PEST files.
+- :func:`write_regional_pest_files`: Write PEST files of several sites.
 - :func:`write_par_data_file`: Write parameter data file.
 - :func:`write_tpl_file`: Write PEST template parameter file.
 
@@ -31,13 +41,27 @@ This module contains the following functions:
 #
 # You should have received a copy of the GNU General Public License
 # along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import glob
+import json
 import os
+import re
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
 import pyemu
 
+# record types of the PEST binary Jacobian (.jcb) format. Files with a
+# negative header use the original format (column-major index, 12 and 20
+# character names); files with a positive header use the new format
+# written by recent versions of PEST++ (row and column indexes, 200
+# character names).
+JCO_HEADER_DT = np.dtype([('itemp1', np.int32), ('itemp2', np.int32),
+                          ('icount', np.int32)])
+JCO_REC_DT = np.dtype([('j', np.int32), ('dtemp', np.float64)])
+JCO_COO_REC_DT = np.dtype([('i', np.int32), ('j', np.int32),
+                           ('dtemp', np.float64)])
+
 
 def get_obs_data(obs_file, start_date, end_date, weights=1, groups='obs',
                  obsnames='default', delimiter=' '):
@@ -140,6 +164,59 @@ def get_obs_data(obs_file, start_date, end_date, weights=1, groups='obs',
     return obs_data3
 
 
+def merge_sweep_files(fnames_in, fname_out, output=True):
+    """Merge sweep input and output files.
+
+    This function merges several :file:`sweep_in.csv` files (parameter
+    values) or :file:`sweep_out.csv` files (simulation results) of
+    `pestpp-swp` into one file, e.g., when the realizations of a Monte
+    Carlo simulation are run in several batches. Realizations are
+    identified by their names (first column of :file:`sweep_in.csv`
+    and column "input_run_id" of :file:`sweep_out.csv`). If a
+    realization is found in several files, the last occurrence is kept
+    (for output files, a successful run is always preferred to a failed
+    one). In merged output files, the column "run_id" is renumbered so
+    that it corresponds to the position of the realization in the
+    merged file.
+
+    Args:
+        fnames_in: List of paths of the files to merge. Missing files
+            are ignored.
+        fname_out: Path of the merged file. It may be one of the files
+            in `fnames_in`.
+        output: True if the files are :file:`sweep_out.csv` files, False
+            if they are :file:`sweep_in.csv` files (or PEST binary
+            parameter ensembles, see :func:`write_ensemble`).
+
+    Returns:
+        A pandas dataframe containing the merged data. The data is also
+        written to `fname_out`.
+    """
+    dfs = []
+    for fname in fnames_in:
+        if os.path.isfile(fname):
+            if output:
+                dfs.append(read_sweep_out(fname))
+            else:
+                dfs.append(read_ensemble(fname))
+    df = pd.concat(dfs)
+
+    if output:
+        id_col = _sweep_id_col(df)
+        # keep last occurrence of each realization (successful runs first)
+        df = df.iloc[np.argsort(df['failed_flag'].values == 0,
+                                kind='stable'), :]
+        df = df.drop_duplicates(subset=id_col, keep='last')
+        df = df.iloc[_natural_order(df[id_col]), :]
+        df['run_id'] = np.arange(df.shape[0])
+        df.to_csv(fname_out, index=False)
+    else:
+        df = df[~df.index.duplicated(keep='last')]
+        df = df.iloc[_natural_order(df.index.to_series()), :]
+        write_ensemble(df, fname_out)
+    return df
+
+
 def process_sweep_out(fname_in, var_names, folder_out, ptl_avg=None):
     """Process file :file:`sweep_out.csv`.
 
@@ -168,21 +245,8 @@ def process_sweep_out(fname_in, var_names, folder_out, ptl_avg=None):
         case, the output files follow the pattern
         "mc_pavg_<vpa>_by_<v>.txt".
     """
-    # read only first line to get dtypes
-    mc_res0 = pd.read_csv(fname_in, na_values=-1e10, nrows=1)
-    res_dtypes = mc_res0.dtypes
-    # manually assign dtypes to avoid warning about mixed dtypes later
-    res_dtypes[:] = np.float64
-    res_dtypes.run_id = np.int64
-    res_dtypes.failed_flag = np.int64
-    if "input_run_id" in res_dtypes:
-        res_dtypes.input_run_id = "str"
-    elif "Unnamed: 0" in res_dtypes:
-        res_dtypes["Unnamed: 0"] = "str"
-    res_dtypes = res_dtypes.to_dict()
-
     # read sweep_out.csv file
-    mc_results = pd.read_csv(fname_in, na_values=-1e10, dtype=res_dtypes)
+    mc_results = read_sweep_out(fname_in)
     # get observation names
     a_list = ['run_id', 'input_run_id', 'failed_flag', 'phi', 'meas_phi',
               'regul_phi'] + var_names
@@ -242,6 +306,360 @@ def process_sweep_out(fname_in, var_names, folder_out, ptl_avg=None):
     return
 
 
+def read_ensemble(fname):
+    """Read an ensemble file.
+
+    Args:
+        fname: Path of a parameter or observation ensemble written by
+            PEST++ (or cuspy), either in CSV format (first column
+            containing the realization names) or in PEST binary format
+            (:file:`.jcb`, realizations as rows, see
+            :func:`write_ensemble`).
+
+    Returns:
+        A pandas dataframe indexed by realization names (as strings),
+        with lower-case column names.
+    """
+    if fname.lower().endswith('.csv'):
+        df = pd.read_csv(fname, index_col=0, dtype={0: str})
+        df.index = df.index.astype(str)
+        df.columns = df.columns.str.lower()
+        return df
+
+    row_names, col_names = read_jco_names(fname)
+    with open(fname, 'rb') as f:
+        itemp1, itemp2, icount = np.fromfile(f, JCO_HEADER_DT, 1)[0]
+        rec_dt = JCO_REC_DT if itemp1 < 0 else JCO_COO_REC_DT
+        data = np.fromfile(f, rec_dt, int(icount))
+    x = np.zeros((len(row_names), len(col_names)))
+    if itemp1 < 0:
+        icols = (data['j'] - 1) // len(row_names)
+        irows = data['j'] - 1 - icols * len(row_names)
+    else:
+        irows, icols = data['i'], data['j']
+    x[irows, icols] = data['dtemp']
+    return pd.DataFrame(x, index=row_names, columns=col_names)
+
+
+def read_ies_memmap(pst_file, kind='obs', cache_file=None):
+    """Read the ensembles of the iterations of IES.
+
+    The ensembles written by `pestpp-ies` at each iteration
+    (:file:`<case>.<N>.<kind>.csv`, or :file:`.jcb` if the PEST++
+    option `ies_save_binary` is used) are found and converted once to a
+    dense array saved in the NumPy format (:file:`.npy`), with the names
+    of the iterations, realizations and columns saved in a JSON file of
+    the same name. The array is then memory-mapped in read-only mode.
+    The converted files are reused as long as they are more recent than
+    the ensemble files. Realizations missing in an iteration (e.g.,
+    failed runs dropped by `pestpp-ies`) are filled with NaN.
+
+    Args:
+        pst_file: path of the pest file used by `pestpp-ies`. If the
+            ensembles are not found next to it, they are read in the
+            folder :file:`master` of its folder (parallel runs).
+        kind: 'obs' for the observation ensembles (simulated values) or
+            'par' for the parameter ensembles.
+        cache_file: path of the dense array file. If None, it is
+            :file:`<case>.ies_<kind>.npy`.
+
+    Returns:
+        A tuple containing the memory-mapped array (shape (n_iter,
+        n_reals, n_cols)), the list of iterations, the list of
+        realization names and the list of column names (observations or
+        parameters).
+    """
+    if kind not in ['obs', 'par']:
+        raise ValueError('Kind not recognised. Choose "obs" or "par".')
+    case = pst_file.rsplit('.', 1)[0]
+    if cache_file is None:
+        cache_file = f'{case}.ies_{kind}.npy'
+    names_file = cache_file.rsplit('.', 1)[0] + '.json'
+
+    # find ensemble files of the iterations (next to the pest file, or
+    # in the folder master of a parallel run)
+    files = {}
+    master = os.path.join(os.path.dirname(os.path.abspath(pst_file)),
+                          'master', os.path.basename(case))
+    for root in [case, master]:
+        for fname in glob.glob(f'{root}.*.{kind}.*'):
+            it, ext = fname[len(root) + 1:].split('.', 1)
+            if it.isdigit() and \
+                    ext.lower() in [kind + '.csv', kind + '.jcb']:
+                files[int(it)] = fname
+        if files:
+            break
+    if not files:
+        raise FileNotFoundError(f'{case}.<N>.{kind}.csv')
+    iters = sorted(files)
+
+    # check whether the converted files are up to date
+    t_files = max(os.path.getmtime(f) for f in files.values())
+    if os.path.isfile(cache_file) and os.path.isfile(names_file) and \
+            min(os.path.getmtime(cache_file),
+                os.path.getmtime(names_file)) >= t_files:
+        with open(names_file) as f:
+            names = json.load(f)
+        if names['iterations'] == iters:
+            x = np.load(cache_file, mmap_mode='r')
+            return x, iters, names['reals'], names['columns']
+
+    # convert ensembles to dense array file
+    en = read_ensemble(files[iters[0]])
+    reals, columns = list(en.index), list(en.columns)
+    x = np.lib.format.open_memmap(cache_file, mode='w+', dtype=np.float64,
+                                  shape=(len(iters), len(reals),
+                                         len(columns)))
+    for i, it in enumerate(iters):
+        if i > 0:
+            en = read_ensemble(files[it])
+        x[i] = en.reindex(index=reals, columns=columns).values
+    x.flush()
+    del x
+    with open(names_file, 'w') as f:
+        json.dump({'iterations': iters, 'reals': reals, 'columns': columns},
+                  f)
+
+    x = np.load(cache_file, mmap_mode='r')
+    return x, iters, reals, columns
+
+
+def read_jco_memmap(fname, cache_file=None, chunk=1000000):
+    """Read a Jacobian file as a memory-mapped array.
+
+    The PEST binary Jacobian format only stores the non-zero elements of
+    the matrix, so it cannot be memory-mapped directly. The first time
+    this function is called on a Jacobian file, the matrix is converted
+    (in chunks of `chunk` elements) to a dense array saved in the NumPy
+    format (:file:`.npy`). This file is then memory-mapped in read-only
+    mode, so that only the parts of the matrix that are used in the
+    calculations are loaded in memory. The converted file is reused as
+    long as it is more recent than the Jacobian file.
+
+    Args:
+        fname: Path of the binary Jacobian file (:file:`.jcb`).
+        cache_file: Path of the dense array file. If None, it is the
+            path of the Jacobian file with the extension :file:`.npy`.
+        chunk: Number of elements of the Jacobian file processed in one
+            pass during the conversion.
+
+    Returns:
+        A tuple containing the memory-mapped array (shape
+        (nobs, npar)), the list of row names (observations) and the list
+        of column names (parameters).
+    """
+    if cache_file is None:
+        cache_file = fname.rsplit('.', 1)[0] + '.npy'
+    row_names, col_names = read_jco_names(fname)
+    shape = (len(row_names), len(col_names))
+
+    # check whether the dense array file is up to date
+    if os.path.isfile(cache_file) and \
+            os.path.getmtime(cache_file) >= os.path.getmtime(fname):
+        x = np.load(cache_file, mmap_mode='r')
+        if x.shape == shape:
+            return x, row_names, col_names
+
+    # convert sparse binary records to dense array file
+    with open(fname, 'rb') as f:
+        itemp1, itemp2, icount = np.fromfile(f, JCO_HEADER_DT, 1)[0]
+    rec_dt = JCO_REC_DT if itemp1 < 0 else JCO_COO_REC_DT
+    recs = np.memmap(fname, dtype=rec_dt, mode='r',
+                     offset=JCO_HEADER_DT.itemsize, shape=(int(icount),))
+    x = np.lib.format.open_memmap(cache_file, mode='w+', dtype=np.float64,
+                                  shape=shape)
+    for start in range(0, int(icount), chunk):
+        data = recs[start:start + chunk]
+        if itemp1 < 0:
+            # column-major index (starting at 1)
+            icols = (data['j'] - 1) // shape[0]
+            irows = data['j'] - 1 - icols * shape[0]
+        else:
+            irows, icols = data['i'], data['j']
+        x[irows, icols] = data['dtemp']
+    x.flush()
+    del x, recs
+
+    x = np.load(cache_file, mmap_mode='r')
+    return x, row_names, col_names
+
+
+def read_sweep_out(fname):
+    """Read file :file:`sweep_out.csv`.
+
+    Args:
+        fname: Path of the :file:`sweep_out.csv` file, created when
+            making Monte Carlo simulations, or of an observation
+            ensemble in PEST binary format (:file:`.jcb`, see
+            :func:`read_ensemble`).
+
+    Returns:
+        A pandas dataframe containing the results of the simulations.
+        The names of the realizations (column "input_run_id") are read
+        as strings, and the missing values (-1e10) are replaced by NaN.
+        If the last line of the file is incomplete (e.g., when
+        `pestpp-swp` was interrupted while writing it), it is ignored.
+        For binary files, the realizations whose values are all
+        missing are flagged as failed (column "failed_flag").
+    """
+    if not fname.lower().endswith('.csv'):
+        df = read_ensemble(fname).replace(-1e10, np.nan)
+        failed = df.isna().all(axis=1).values.astype(np.int64)
+        df.insert(0, 'failed_flag', failed)
+        df.insert(0, 'input_run_id', df.index)
+        df.insert(0, 'run_id', np.arange(df.shape[0]))
+        return df.reset_index(drop=True)
+
+    # ignore incomplete last line
+    nrows = None
+    with open(fname, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.seek(0)
+                nrows = sum(block.count(b'\n') for block in
+                            iter(lambda: f.read(1 << 20), b'')) - 1
+
+    # read only first line to get dtypes
+    mc_res0 = pd.read_csv(fname, na_values=-1e10, nrows=1)
+    res_dtypes = mc_res0.dtypes
+    # manually assign dtypes to avoid warning about mixed dtypes later
+    res_dtypes[:] = np.float64
+    res_dtypes.run_id = np.int64
+    res_dtypes.failed_flag = np.int64
+    if "input_run_id" in res_dtypes:
+        res_dtypes.input_run_id = "str"
+    elif "Unnamed: 0" in res_dtypes:
+        res_dtypes["Unnamed: 0"] = "str"
+    res_dtypes = res_dtypes.to_dict()
+
+    return pd.read_csv(fname, na_values=-1e10, dtype=res_dtypes, nrows=nrows)
+
+
+def read_jco_names(fname):
+    """Read row and column names of a Jacobian file.
+
+    Only the header and the names at the end of the PEST binary
+    Jacobian file are read; the values of the matrix are skipped. This
+    is useful to check whether a Jacobian matrix is compatible with a
+    PEST control file without loading it.
+
+    Args:
+        fname: Path of the binary Jacobian file (:file:`.jcb`).
+
+    Returns:
+        A tuple containing the list of row names (observations) and
+        the list of column names (parameters) of the Jacobian matrix.
+    """
+    with open(fname, 'rb') as f:
+        itemp1, itemp2, icount = np.fromfile(f, JCO_HEADER_DT, 1)[0]
+        ncol, nrow = abs(itemp1), abs(itemp2)
+        if itemp1 < 0:
+            rec_dt, par_length, obs_length = JCO_REC_DT, 12, 20
+        else:
+            rec_dt, par_length, obs_length = JCO_COO_REC_DT, 200, 200
+        f.seek(JCO_HEADER_DT.itemsize + int(icount) * rec_dt.itemsize)
+        col_names = [f.read(par_length).decode().strip().lower()
+                     for _ in range(ncol)]
+        row_names = [f.read(obs_length).decode().strip().lower()
+                     for _ in range(nrow)]
+    return row_names, col_names
+
+
+def write_lin_uncert(uncert, var_names, folder_out, prefix='lin_uncert_'):
+    """Write results of linear uncertainty analyses.
+
+    Args:
+        uncert: pandas dataframe indexed by prediction names, as
+            returned by :func:`analyses.pred_uncertainty`.
+        var_names: List of variable names. Prediction names should have
+            the format "<v>_YYYYmmdd", where `v` is a variable name.
+        folder_out: Folder where the processed data will be written.
+        prefix: Prefix of the names of the output files.
+
+    Returns:
+        A series of text files containing, for each prediction date, the
+        columns of `uncert`. The names of the output files follow the
+        pattern "<prefix><v>.txt" (by default, "lin_uncert_<v>.txt"),
+        where `v` is the name of the output variable.
+    """
+    for v in var_names:
+        var_preds = [p for p in uncert.index if p.startswith(v + '_')]
+        v_df = uncert.loc[var_preds, :].copy()
+        dates = pd.to_datetime([p.replace(v + '_', '') for p in var_preds],
+                               format='%Y%m%d')
+        v_df.insert(0, 'time', dates.strftime('%Y-%m-%d'))
+        v_df = v_df.sort_values(by='time')
+
+        # write to file
+        fname_out = os.path.join(folder_out, prefix + v + '.txt')
+        v_df.to_csv(fname_out, index=False, sep=' ')
+    return
+
+
+def write_ensemble(df, fname):
+    """Write an ensemble file.
+
+    Large ensembles are faster to write and read, and smaller, in PEST
+    binary format than in CSV format. The binary format is the extended
+    format of PEST++ (row and column indexes, 200 character names),
+    which can be read by PEST++ (e.g., PEST++ options
+    `sweep_parameter_csv_file` or `ies_par_en`), by :mod:`pyemu` and by
+    :func:`read_ensemble`. Zero values are not stored.
+
+    Args:
+        df: pandas dataframe or :class:`pyemu.Ensemble` indexed by
+            realization names.
+        fname: Path of the ensemble file. If its extension is
+            :file:`.csv`, the ensemble is written in CSV format;
+            otherwise, in PEST binary format (e.g., :file:`.jcb`).
+    """
+    if isinstance(df, pyemu.Ensemble):
+        if df.istransformed:
+            df = df.copy()
+            df.back_transform()
+        df = df._df
+    if fname.lower().endswith('.csv'):
+        df.to_csv(fname)
+    else:
+        pyemu.Matrix.from_dataframe(df.astype(np.float64)).to_coo(
+            fname, chunk=1000000)
+
+
+def write_gsa_indices(indices, var_names, folder_out, prefix='gsa_'):
+    """Write results of global sensitivity analyses.
+
+    Args:
+        indices: pandas dataframe of sensitivity indices with a
+            MultiIndex (output name, parameter name), as returned by
+            :func:`analyses.gsa`.
+        var_names: List of variable names. Output names should have the
+            format "<v>_YYYYmmdd", where `v` is a variable name.
+        folder_out: Folder where the processed data will be written.
+        prefix: Prefix of the names of the output files.
+
+    Returns:
+        A series of text files containing, for each output date and
+        parameter, the columns of `indices`. The names of the output
+        files follow the pattern "<prefix><v>.txt", where `v` is the
+        name of the output variable.
+    """
+    names = indices.index.get_level_values(0)
+    for v in var_names:
+        v_df = indices.loc[names.str.startswith(v + '_'), :].reset_index()
+        dates = pd.to_datetime(v_df.iloc[:, 0].str.replace(v + '_', ''),
+                               format='%Y%m%d')
+        v_df.iloc[:, 0] = dates.dt.strftime('%Y-%m-%d')
+        v_df = v_df.rename(columns={v_df.columns[0]: 'time'})
+        v_df = v_df.sort_values(by=['time', v_df.columns[1]])
+
+        # write to file
+        fname_out = os.path.join(folder_out, prefix + v + '.txt')
+        v_df.to_csv(fname_out, index=False, sep=' ')
+    return
+
+
 def write_dict(x_dict, path):
     """Write dictionary to file.
 
@@ -629,6 +1047,163 @@ def write_pest_files(start_date, end_date, model_command,
     return
 
 
+def write_regional_pest_files(sites, par_data_file='par_data.txt',
+                              pst_file='regional.pst', n_jobs=None,
+                              python_cmd='python', control_data=None,
+                              svd_data=None, reg_data=None, pestpp_opts=None):
+    """Write PEST files of several sites.
+
+    The PEST files of each site are written in its folder (see
+    :func:`write_pest_files`), with the parameters of `par_data_file`,
+    which are shared by all the sites (e.g., regional coefficients).
+    The regional PEST control file `pst_file` gathers the observations
+    of all the sites, whose names and groups are prefixed by the site
+    name ("<site>_<obsname>"), and the template and instruction files
+    of all the sites. Its model command runs the script
+    :file:`<pst_file root>.run_sites.py`, which runs the models of the
+    sites listed in :file:`<pst_file root>.sites.json` concurrently
+    (see :func:`functions.run_site_models`), so that one model run of
+    the regional pest file takes about the time of the longest site
+    model run. The regional pest file may be calibrated like the pest
+    file of one site (see :func:`analyses.calibration`):
+
+    * with serial runs of PEST++ and `n_jobs` equal to the number of
+      sites, the sites of each model run are run concurrently, and the
+      Jacobian matrix costs about one site run of wall time per
+      parameter;
+    * with parallel runs of PEST++ (see
+      :func:`functions.launch_pestpp`), the model runs are spread
+      across the workers, and `n_jobs` should be set so that the
+      number of workers times `n_jobs` does not exceed the number of
+      cores.
+
+    Args:
+        sites: list of sites. Each site is a dictionary with the keys
+            'name' (site name, prefix of its observations), 'folder'
+            (folder of the site, relative to the folder of `pst_file`)
+            and the arguments of :func:`write_pest_files` for the site
+            (e.g., 'start_date', 'end_date', 'model_command',
+            'obs_file'), whose paths are relative to the folder of the
+            site. The pest file of the site is written to
+            :file:`<name>.pst` in its folder.
+        par_data_file: path of the file containing the data of the
+            parameters shared by the sites.
+        pst_file: path of the regional PEST control file.
+        n_jobs: maximum number of site models run concurrently. If
+            None, the number of cores.
+        python_cmd: command of the Python interpreter used to run the
+            script of the model command.
+        control_data: a dictionary defining options in the control data
+            section of the regional PEST control file.
+        svd_data: a dictionary used to pass options to the SVD section
+            of the regional PEST control file.
+        reg_data: a dictionary used to pass options to the
+            regularization section of the regional PEST control file.
+        pestpp_opts: a dictionary used to pass PEST++ options to the
+            regional PEST control file.
+
+    Returns:
+        A pest instance of the regional PEST control file. The PEST
+        files of the sites, the regional instruction files
+        (:file:`<name>.regional.ins` in the folder of each site), the
+        regional PEST control file, the list of sites and the script of
+        the model command are also written.
+    """
+    folder0 = os.path.dirname(os.path.abspath(pst_file))
+    root = os.path.basename(pst_file).rsplit('.', 1)[0]
+    par_data = pd.read_csv(par_data_file, delimiter=' ')
+    par_data.index = par_data.loc[:, 'parnme']
+
+    obs_data, sites_list = [], []
+    tpl_files, input_files, ins_files, output_files = [], [], [], []
+    for site in sites:
+        name, folder = site['name'], site['folder']
+        kwargs = {k: v for k, v in site.items()
+                  if k not in ['name', 'folder']}
+        kwargs['par_data_file'] = os.path.abspath(par_data_file)
+        kwargs['pst_file'] = name + '.pst'
+
+        # PEST files of the site (paths relative to its folder)
+        cwd = os.getcwd()
+        os.chdir(os.path.join(folder0, folder))
+        try:
+            write_pest_files(**kwargs)
+            site_pst = pyemu.Pst(kwargs['pst_file'])
+            with open(site_pst.instruction_files[0]) as f:
+                ins_text = f.read()
+            # instruction file with prefixed observation names
+            ins_file = name + '.regional.ins'
+            with open(ins_file, 'w') as f:
+                f.write(re.sub(r'!([^!\s]+)!',
+                               lambda m: m.group(0) if m.group(1) == 'dum'
+                               else f'!{name}_{m.group(1)}!', ins_text))
+            ins_names = pyemu.pst_utils.parse_ins_file(ins_file)
+        finally:
+            os.chdir(cwd)
+
+        obs = site_pst.observation_data.copy()
+        obs['obsnme'] = name + '_' + obs['obsnme']
+        obs['obgnme'] = name + '_' + obs['obgnme']
+        obs.index = obs['obsnme']
+        if sorted(n.lower() for n in ins_names) != sorted(obs['obsnme']):
+            raise ValueError('The observations of the instruction file ' +
+                             f'{ins_file} of site {name} do not match ' +
+                             'those of its pest file.')
+        obs_data.append(obs)
+        tpl_files.append(os.path.join(folder, site_pst.template_files[0]))
+        input_files.append(os.path.join(folder, site_pst.input_files[0]))
+        ins_files.append(os.path.join(folder, ins_file))
+        output_files.append(os.path.join(folder,
+                                         site_pst.output_files[0]))
+        sites_list.append({'name': name, 'folder': folder,
+                           'command': site_pst.model_command[0],
+                           'output_file': site_pst.output_files[0]})
+
+    # List of sites and script of the model command
+    with open(os.path.join(folder0, root + '.sites.json'), 'w') as f:
+        json.dump({'n_jobs': n_jobs, 'sites': sites_list}, f, indent=1)
+    with open(os.path.join(folder0, root + '.run_sites.py'), 'w') as f:
+        f.write('# Run the models of the sites of a regional pest file\n' +
+                'from cuspy.functions import run_site_models\n\n' +
+                f"run_site_models('{root}.sites.json')\n")
+
+    # Regional pest control file
+    obs_data = pd.concat(obs_data)
+    pst1 = pyemu.pst.pst_utils.generic_pst(par_names=par_data['parnme'],
+                                           obs_names=obs_data['obsnme'])
+    pst1.parameter_data = par_data
+    pst1.observation_data = obs_data
+    pst1.model_command = [f'{python_cmd} {root}.run_sites.py']
+    pst1.template_files = tpl_files
+    pst1.input_files = input_files
+    pst1.instruction_files = ins_files
+    pst1.output_files = output_files
+
+    # Configure control data
+    if control_data is not None:
+        for k in control_data:
+            pst1.control_data.__setattr__(k, control_data[k])
+
+    # Configure SVD data
+    if svd_data is not None:
+        for k in svd_data:
+            pst1.svd_data.__setattr__(k, svd_data[k])
+
+    # Configure regularization data
+    if reg_data is not None:
+        for k in reg_data:
+            pst1.reg_data.__setattr__(k, reg_data[k])
+
+    # Add Pest++ options
+    if pestpp_opts is not None:
+        pst1.pestpp_options.update(pestpp_opts)
+
+    # Check and write pest file
+    pst1.sanity_checks()
+    pst1.write(pst_file)
+    return pst1
+
+
 def write_tpl_file(fname, par_names):
     """Write PEST template parameter file.
 
@@ -656,3 +1231,18 @@ def write_tpl_file(fname, par_names):
         f.write('%s #%s       #\n' % (p, p))
     f.close()
     return
+
+
+def _natural_order(names):
+    """Indexes sorting realization names (numeric names first)."""
+    num = pd.to_numeric(names, errors='coerce').values
+    return np.lexsort((names.astype(str).values, np.isnan(num), num))
+
+
+def _sweep_id_col(df):
+    """Name of the column of realization names of a sweep output."""
+    if 'input_run_id' in df.columns:
+        return 'input_run_id'
+    elif 'Unnamed: 0' in df.columns:
+        return 'Unnamed: 0'
+    return 'run_id'
@@ -0,0 +1,324 @@
+"""Functions for linear uncertainty calculations.
+
+The functions in this module implement first-order (linear) uncertainty
+calculations based on a Jacobian matrix. In contrast to the
+:class:`pyemu.Schur` and :class:`pyemu.ErrVar` objects, which load the
+whole Jacobian matrix in memory and treat predictions one at a time,
+the Jacobian matrix is read by blocks of rows (see
+:func:`input_output.read_jco_memmap`) and the variances of all the
+predictions are computed with matrix products.
+
+This module contains the following functions:
+
+    * :func:`ensemble_jacobian`: Jacobian matrix estimated from an
+      ensemble.
+    * :func:`get_parcov`: get prior parameter covariance matrix.
+    * :func:`info_matrices`: information matrices of observation groups.
+    * :func:`normal_bands`: percentile bands of normal predictions.
+    * :func:`posterior_parcov`: posterior parameter covariance matrix.
+    * :func:`pred_variance`: variance of predictions.
+    * :func:`super_dimension`: number of super parameters.
+
+"""
+# Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
+#
+# This file is part of the Python package "cuspy".
+#
+# The package "cuspy" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The package "cuspy" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import os.path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyemu
+from scipy.stats import norm
+
+
+def ensemble_jacobian(par, obs, alpha=1e-3):
+    """Jacobian matrix estimated from an ensemble.
+
+    The sensitivities are the coefficients of the linear regression of
+    the simulated values on the parameter values of an ensemble of
+    realizations (e.g., the prior or posterior ensembles of
+    `pestpp-ies`, or the samples of a Monte Carlo sweep). The
+    regression is made on the anomalies (deviations from the ensemble
+    means) of the standardized parameters, with a ridge penalty
+    `alpha` times the number of realizations, so that the estimate is
+    stable when the parameters are correlated or when there are few
+    realizations. No model runs are needed, but the estimate is an
+    average slope over the spread of the ensemble rather than a local
+    derivative.
+
+    Args:
+        par: array of shape (n_reals, npar) of parameter values
+            (log10-transformed for log-transformed parameters, as in
+            PEST Jacobian matrices).
+        obs: array of shape (n_reals, nobs) of simulated values.
+        alpha: ridge penalty, relative to the number of realizations.
+
+    Returns:
+        A numpy array of shape (nobs, npar).
+
+    References:
+        * Chen, Y.; Oliver, D.S. (2013) Levenberg-Marquardt forms of
+          the iterative ensemble smoother for efficient history
+          matching and uncertainty quantification. *Computational
+          Geosciences*, 17, 689-703.
+    """
+    par = np.asarray(par, dtype=np.float64)
+    obs = np.asarray(obs, dtype=np.float64)
+    n_reals, npar = par.shape
+    dp = par - par.mean(axis=0)
+    sd = dp.std(axis=0)
+    sd[sd == 0] = 1
+    dp /= sd
+    do = obs - obs.mean(axis=0)
+    lhs = dp.T @ dp + alpha * n_reals * np.eye(npar)
+    coefs = np.linalg.solve(lhs, dp.T @ do)
+    return (coefs / sd[:, np.newaxis]).T
+
+
+def get_parcov(pst, par_names, parcov=None):
+    """Get prior parameter covariance matrix.
+
+    Args:
+        pst: a pest instance.
+        par_names: list of parameter names (usually, the column names of
+            the Jacobian matrix) defining the order of the rows and
+            columns of the covariance matrix.
+        parcov: path of a parameter covariance file (extensions
+            :file:`.cov`, :file:`.unc` or :file:`.jcb`) or
+            :class:`pyemu.Cov` instance. If None, the file indicated by
+            the PEST++ option `parcov` of `pst` is used if it exists;
+            otherwise, the covariance is estimated from parameter
+            bounds.
+
+    Returns:
+        A numpy array of shape (npar, npar).
+    """
+    if parcov is None:
+        parcov = pst.pestpp_options.get('parcov', None)
+    if parcov is None:
+        cov = pyemu.Cov.from_parameter_data(pst)
+    elif isinstance(parcov, pyemu.Matrix):
+        cov = parcov
+    else:
+        ext = parcov.rsplit('.', 1)[-1].lower()
+        if not os.path.isfile(parcov):
+            raise FileNotFoundError(parcov)
+        if ext == 'unc':
+            cov = pyemu.Cov.from_uncfile(parcov)
+        elif ext in ['jcb', 'jco']:
+            cov = pyemu.Cov.from_binary(parcov)
+        else:
+            cov = pyemu.Cov.from_ascii(parcov)
+    cov = cov.get(row_names=list(par_names), col_names=list(par_names))
+    return cov.as_2d
+
+
+def info_matrices(jco, obs_groups, block_size=10000):
+    """Information matrices of observation groups.
+
+    The information matrix of a group of observations is J'WJ, where J
+    is the Jacobian matrix of the observations of the group and W is the
+    diagonal matrix of their squared weights. Since the information
+    matrices are additive, the posterior parameter covariance matrix
+    for any combination of groups can be obtained from them without
+    reading the Jacobian matrix again.
+
+    Args:
+        jco: array (or memory-mapped array) containing the Jacobian
+            matrix.
+        obs_groups: list of tuples (inds, weights) containing the row
+            indexes of the observations of each group and their
+            weights.
+        block_size: number of rows of the Jacobian matrix processed in
+            one pass.
+
+    Returns:
+        A numpy array of shape (ngroups, npar, npar).
+    """
+    npar = jco.shape[1]
+    info = np.zeros((len(obs_groups), npar, npar))
+    for g, (inds, weights) in enumerate(obs_groups):
+        inds = np.asarray(inds)
+        weights2 = np.asarray(weights, dtype=np.float64)**2
+        order = np.argsort(inds)
+        inds, weights2 = inds[order], weights2[order]
+        for start in range(0, len(inds), block_size):
+            j_block = np.asarray(jco[inds[start:start + block_size], :])
+            w_block = weights2[start:start + block_size]
+            info[g] += (j_block * w_block[:, np.newaxis]).T @ j_block
+    return info
+
+
+def normal_bands(mean, sd, n_samples=100, index=None):
+    """Percentile bands of normal predictions.
+
+    The bands are those expected for predictions following a normal
+    distribution, as assumed in first-order second-moment (FOSM)
+    uncertainty propagation. The percentiles are those written by
+    :func:`input_output.process_sweep_out`. The minimum and maximum are
+    the expected extreme values of a sample of size `n_samples`, using
+    Blom's approximation of the normal order statistics.
+
+    Args:
+        mean: array of mean values of the predictions.
+        sd: array of standard deviations of the predictions.
+        n_samples: size of the sample used to estimate the minimum and
+            maximum values.
+        index: index of the resulting dataframe (e.g., prediction
+            names).
+
+    Returns:
+        A pandas dataframe with the columns 'min', 'max', 'p05', 'p25',
+        'p50', 'p75' and 'p95'.
+    """
+    mean = np.asarray(mean, dtype=np.float64)
+    sd = np.asarray(sd, dtype=np.float64)
+    z_max = norm.ppf((n_samples - 0.375) / (n_samples + 0.25))
+    bands = pd.DataFrame({'min': mean - z_max * sd,
+                          'max': mean + z_max * sd}, index=index)
+    for p in [5, 25, 50, 75, 95]:
+        bands[f'p{p:02d}'] = mean + norm.ppf(p / 100) * sd
+    return bands
+
+
+def posterior_parcov(jco, obs_inds, weights, parcov, block_size=10000):
+    """Posterior parameter covariance matrix.
+
+    The posterior parameter covariance matrix is calculated using
+    Schur's complement in its "information" form, i.e.,
+    (J'WJ + C^-1)^-1, where J is the Jacobian matrix of the
+    observations, W is the diagonal matrix of squared weights (the
+    inverse of the observation noise covariance matrix) and C is the
+    prior parameter covariance matrix. The product J'WJ is accumulated
+    by blocks of `block_size` rows of the Jacobian matrix.
+
+    Args:
+        jco: array (or memory-mapped array) containing the Jacobian
+            matrix.
+        obs_inds: row indexes of the observations (non-zero weight).
+        weights: weights of the observations.
+        parcov: prior parameter covariance matrix (numpy array).
+        block_size: number of rows of the Jacobian matrix processed in
+            one pass.
+
+    Returns:
+        A numpy array of shape (npar, npar).
+    """
+    obs_inds = np.asarray(obs_inds)
+    weights2 = np.asarray(weights, dtype=np.float64)**2
+    order = np.argsort(obs_inds)
+    obs_inds, weights2 = obs_inds[order], weights2[order]
+    npar = parcov.shape[0]
+
+    # information matrix (J'WJ + C^-1)
+    info = np.linalg.inv(parcov)
+    for start in range(0, len(obs_inds), block_size):
+        j_block = np.asarray(jco[obs_inds[start:start + block_size], :])
+        w_block = weights2[start:start + block_size]
+        info += (j_block * w_block[:, np.newaxis]).T @ j_block
+
+    return np.linalg.solve(info, np.eye(npar))
+
+
+def pred_variance(jco, pred_inds, parcovs, block_size=10000, n_jobs=1):
+    """Variance of predictions.
+
+    The variance of each prediction is calculated as the diagonal of
+    the matrix J C J', where J is the Jacobian matrix of the predictions
+    and C a parameter covariance matrix. Only the diagonal is computed,
+    as the row sums of (J C) * J. The Jacobian matrix is read by blocks
+    of `block_size` rows, and each block is used for all the covariance
+    matrices in `parcovs` at once. Blocks may be processed by several
+    threads.
+
+    Args:
+        jco: array (or memory-mapped array) containing the Jacobian
+            matrix.
+        pred_inds: row indexes of the predictions.
+        parcovs: list of parameter covariance matrices (numpy arrays),
+            or array of shape (ncov, npar, npar), e.g., the prior and
+            posterior covariance matrices.
+        block_size: number of rows of the Jacobian matrix processed in
+            one pass.
+        n_jobs: number of threads used to process the blocks.
+
+    Returns:
+        A numpy array of shape (ncov, npred) containing the
+        variance of the predictions (in the order of `pred_inds`) for
+        each parameter covariance matrix.
+    """
+    pred_inds = np.asarray(pred_inds)
+    parcovs = np.asarray(parcovs)
+    order = np.argsort(pred_inds)
+    variances = np.empty((parcovs.shape[0], len(pred_inds)))
+
+    def _block_variance(start):
+        block = order[start:start + block_size]
+        j_block = np.asarray(jco[pred_inds[block], :])
+        variances[:, block] = np.sum((j_block @ parcovs) * j_block, axis=2)
+
+    starts = range(0, len(pred_inds), block_size)
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(_block_variance, starts))
+    else:
+        for start in starts:
+            _block_variance(start)
+    return variances
+
+
+def super_dimension(jco, obs_inds, weights, parcov, eig_thresh=None,
+                    block_size=10000):
+    """Number of super parameters.
+
+    The singular values of the Jacobian matrix scaled by the weights of
+    the observations and by the prior parameter standard deviations,
+    i.e., W^0.5 J C^0.5, are obtained as the square roots of the
+    eigenvalues of C^0.5' J'WJ C^0.5 (J'WJ being accumulated by blocks,
+    see :func:`info_matrices`). By default, the number of super
+    parameters is the number of singular values larger than 1: the
+    combinations of parameters that the observations inform more than
+    the prior information (solution space). If `eig_thresh` is given,
+    it is the number of singular values whose ratio to the largest one
+    is larger than `eig_thresh`, as the PEST++ option `super_eigthresh`.
+
+    Args:
+        jco: array (or memory-mapped array) containing the Jacobian
+            matrix.
+        obs_inds: row indexes of the observations (non-zero weight).
+        weights: weights of the observations.
+        parcov: prior parameter covariance matrix (numpy array).
+        eig_thresh: ratio of singular values to the largest one under
+            which parameter combinations are not retained. If None, the
+            singular values are compared with 1.
+        block_size: number of rows of the Jacobian matrix processed in
+            one pass.
+
+    Returns:
+        A tuple containing the number of super parameters (at least 1)
+        and the array of singular values (in decreasing order).
+    """
+    info = info_matrices(jco, [(obs_inds, weights)], block_size)[0]
+    evals, evecs = np.linalg.eigh(parcov)
+    sqrt_cov = evecs * np.sqrt(np.maximum(evals, 0))
+    s2 = np.linalg.eigvalsh(sqrt_cov.T @ info @ sqrt_cov)[::-1]
+    sv = np.sqrt(np.maximum(s2, 0))
+    if eig_thresh is None:
+        n_super = int(np.sum(sv > 1))
+    else:
+        n_super = int(np.sum(sv > eig_thresh * sv[0]))
+    return max(n_super, 1), sv
@@ -0,0 +1,387 @@
+"""Functions to run chains of analyses as pipelines of stages.
+
+The functions in this module run a chain of analyses (e.g., writing the
+PEST files, calibrating the model, and making linear uncertainty
+analyses and Monte Carlo simulations with the calibrated model) as a
+pipeline of stages. Each stage declares the files it reads and the
+files it writes. A stage is run only if its function, its arguments or
+the contents of its input files have changed since its last run, or if
+its output files are missing or have been modified since; otherwise,
+its artifacts are reused. Stages that do not depend on each other may
+be run concurrently. The state of the pipeline (hashes of the stages
+and of the files, and timings) is kept in a JSON file.
+
+This module contains the following functions:
+
+    * :func:`analysis_stages`: stages of the usual chain of analyses.
+    * :func:`run_pipeline`: run the stages of a pipeline.
+
+"""
+# Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
+#
+# This file is part of the Python package "cuspy".
+#
+# The package "cuspy" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The package "cuspy" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import hashlib
+import inspect
+import json
+import os.path
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from cuspy.analyses import calibration, linear_uncertainty, monte_carlo
+from cuspy.input_output import process_sweep_out, write_pest_files
+
+
+def analysis_stages(pest_kwargs, calib_kwargs, lin_kwargs=None,
+                    mc_kwargs=None, process_kwargs=None, model_files=()):
+    """Stages of the usual chain of analyses.
+
+    The chain is :func:`input_output.write_pest_files`,
+    :func:`analyses.calibration`, :func:`analyses.linear_uncertainty`,
+    :func:`analyses.monte_carlo` and
+    :func:`input_output.process_sweep_out`. The input and output files
+    of each stage are derived from its arguments (missing arguments
+    take the default values of the functions), and the pest files of
+    the linear uncertainty analysis and of the Monte Carlo simulations
+    are by default the calibrated pest file. Since these two stages run
+    the model with the same files, the Monte Carlo simulations depend on
+    the linear uncertainty analysis, so that they never run concurrently
+    (see :func:`run_pipeline`), unless the Jacobian matrix is estimated
+    from an ensemble (argument `ensemble` of
+    :func:`analyses.linear_uncertainty`), which needs no model runs.
+    The Monte Carlo simulations are run serially unless `mc_kwargs`
+    sets `parallel`, and their results are written to the sweep output
+    file in the folder of `csv_in` (PEST++ option
+    `sweep_output_csv_file`), which is read by the last stage.
+
+    Args:
+        pest_kwargs: dictionary of arguments of
+            :func:`input_output.write_pest_files`.
+        calib_kwargs: dictionary of arguments of
+            :func:`analyses.calibration`. Its `pst_file1` must differ
+            from the pest file written by the first stage (otherwise,
+            the calibration is always run again).
+        lin_kwargs: dictionary of arguments of
+            :func:`analyses.linear_uncertainty`. If None, the stage is
+            not included.
+        mc_kwargs: dictionary of arguments of
+            :func:`analyses.monte_carlo`. If None, the stage is not
+            included.
+        process_kwargs: dictionary of arguments of
+            :func:`input_output.process_sweep_out` ('var_names' is
+            required). If None, the stage is not included.
+        model_files: list of paths of the files read by the model
+            (e.g., the model inputs and executable), which are inputs
+            of the stages that run the model.
+
+    Returns:
+        A list of stages (dictionaries, see :func:`run_pipeline`).
+
+    Note:
+        The output files of PEST++ are read in the folder of the pest
+        files. Parallel runs write them in the folder :file:`master`,
+        and they are copied back next to the pest files (see
+        :func:`functions.launch_pestpp`).
+    """
+    model_files = list(model_files)
+
+    # Pest files
+    pest = _with_defaults(write_pest_files, pest_kwargs)
+    pest_inputs = [pest['par_data_file'], pest['obs_file'],
+                   pest['pred_file']] + \
+        [pest[k] for k in ['obs_weights', 'obs_groups', 'obs_names',
+                           'pred_groups', 'pred_names']
+         if isinstance(pest[k], str) and os.path.isfile(pest[k])]
+    stages = [{'name': 'pest_files', 'func': write_pest_files,
+               'kwargs': pest_kwargs,
+               'inputs': [f for f in pest_inputs if f is not None],
+               'outputs': [pest['pst_file'], pest['tpl_file'],
+                           pest['ins_file']]}]
+
+    # Calibration
+    calib = _with_defaults(calibration,
+                           dict({'pst_file0': pest['pst_file']},
+                                **calib_kwargs))
+    calib_root = calib['pst_file1'].rsplit('.', 1)[0]
+    calib_files = [calib_root + ext for ext in ['.par', '.rei', '.jcb']]
+    stages.append({'name': 'calibration', 'func': calibration,
+                   'kwargs': calib,
+                   'inputs': [calib['pst_file0'], pest['tpl_file'],
+                              pest['ins_file']] + model_files,
+                   'outputs': [calib['pst_file1']] + calib_files +
+                   [calib_root + '.post.cov']})
+
+    # Linear uncertainty analysis
+    if lin_kwargs is not None:
+        lin = _with_defaults(linear_uncertainty,
+                             dict({'pst_file0': calib['pst_file1']},
+                                  **lin_kwargs))
+        lin_root = lin['pst_file1'].rsplit('.', 1)[0]
+        stages.append({'name': 'linear_uncertainty',
+                       'func': linear_uncertainty, 'kwargs': lin,
+                       'inputs': [lin['pst_file0']] + calib_files +
+                       model_files + list(lin['ensemble'] or []),
+                       'outputs': [lin['pst_file1'], lin_root + '.jcb']})
+
+    # Monte Carlo simulations
+    if mc_kwargs is not None:
+        mc = _with_defaults(monte_carlo,
+                            dict({'pst_file0': calib['pst_file1'],
+                                  'parallel': False}, **mc_kwargs))
+        mc_root = mc['pst_file0'].rsplit('.', 1)[0]
+        csv_in = mc['csv_in']
+        if mc['binary']:
+            csv_in = csv_in.rsplit('.', 1)[0] + '.jcb'
+        csv_out = (mc['pestpp_opts'] or {}).get(
+            'sweep_output_csv_file',
+            os.path.join(os.path.dirname(csv_in), 'sweep_out.csv'))
+        # pestpp-swp writes its output in its working folder by default
+        mc['pestpp_opts'] = dict(mc['pestpp_opts'] or {},
+                                 sweep_output_csv_file=csv_out)
+        mc_inputs = [mc['pst_file0']] + model_files
+        if mc['dist_type'] == 'post':
+            mc_inputs.append(mc_root + '.post.cov')
+        stages.append({'name': 'monte_carlo', 'func': monte_carlo,
+                       'kwargs': mc, 'inputs': mc_inputs,
+                       'outputs': [mc['pst_file1'], csv_in, csv_out],
+                       'depends': ['linear_uncertainty']
+                       if (lin_kwargs is not None) and
+                       (lin['ensemble'] is None) else []})
+
+        # Processing of the results
+        if process_kwargs is not None:
+            proc = dict({'fname_in': csv_out,
+                         'folder_out': os.path.dirname(csv_out)},
+                        **process_kwargs)
+            stages.append({'name': 'process_sweep_out',
+                           'func': process_sweep_out, 'kwargs': proc,
+                           'inputs': [proc['fname_in']],
+                           'outputs': [os.path.join(proc['folder_out'],
+                                                    f'mc_uncert_{v}.txt')
+                                       for v in proc['var_names']]})
+    return stages
+
+
+def run_pipeline(stages, state_file='pipeline.json', max_workers=1,
+                 force=None):
+    """Run the stages of a pipeline.
+
+    A stage is run when its key (hash of its function, of its arguments
+    except `parallel` and of the contents of its input files) differs
+    from the key of its last successful run recorded in `state_file`,
+    or when one of its output files is missing or has been modified
+    since. Otherwise, it is skipped and its artifacts are reused, e.g.,
+    after changing only the settings of the Monte Carlo simulations,
+    the calibration is not run again. A stage depends on the stages
+    that write its input files (and on the stages listed in its key
+    'depends'); it is run once they are finished, and it is cancelled
+    if one of them fails. Since the key of a stage depends on the
+    contents of its input files, a stage whose upstream stages were run
+    again but produced the same files is also skipped. The hashes of
+    the files are cached in `state_file` with their size and
+    modification time, so that large files are only read again when
+    they change.
+
+    Args:
+        stages: list of stages. Each stage is a dictionary with the
+            keys 'name' (unique name), 'func' (function run by the
+            stage, defined at the top level of a module if
+            `max_workers` > 1), 'kwargs' (dictionary of arguments of the
+            function), 'inputs' (list of paths of the files read by the
+            stage), 'outputs' (list of paths of the files written by
+            the stage) and, optionally, 'depends' (list of names of the
+            stages it depends on).
+        state_file: path of the JSON file containing the state of the
+            pipeline.
+        max_workers: maximum number of stages run concurrently (in
+            separate processes if larger than 1). Stages run
+            concurrently should not run PEST++ in parallel in the same
+            folder or with the same port (see
+            :func:`functions.launch_pestpp`).
+        force: list of names of stages run even if they are up to date.
+
+    Returns:
+        A pandas dataframe indexed by stage name, with the status of
+        each stage ('run', 'skipped', 'failed' or 'cancelled'), the
+        time (in seconds) spent running it ('seconds') and, for skipped
+        stages, the time of their last run ('saved'). It is also
+        written to the file :file:`<state_file root>.timings.txt`. If
+        some stages failed, a RuntimeError is raised once the other
+        stages are finished.
+    """
+    names = [s['name'] for s in stages]
+    if len(set(names)) < len(names):
+        raise ValueError('Stage names must be unique.')
+    by_name = {s['name']: s for s in stages}
+    force = set(force or [])
+    state = {'files': {}, 'stages': {}}
+    if os.path.isfile(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+
+    # Dependencies between stages
+    producers = {os.path.abspath(f): s['name'] for s in stages
+                 for f in s.get('outputs', [])}
+    deps = {}
+    for s in stages:
+        deps[s['name']] = (set(s.get('depends', [])) |
+                           {producers[os.path.abspath(f)]
+                            for f in s.get('inputs', [])
+                            if os.path.abspath(f) in producers}) - \
+            {s['name']}
+        unknown = deps[s['name']] - set(names)
+        if len(unknown) > 0:
+            raise ValueError(f'Stage {s["name"]} depends on unknown ' +
+                             f'stages {sorted(unknown)}.')
+
+    report = pd.DataFrame(index=pd.Index(names, name='stage'),
+                          columns=['status', 'seconds', 'saved'])
+    errors = {}
+    pending, running = list(names), {}
+    executor = ProcessPoolExecutor(max_workers) if max_workers > 1 \
+        else None
+
+    def _finish(name, key, func):
+        # record a finished stage (func returns the run time)
+        stage = by_name[name]
+        try:
+            seconds = func()
+        except Exception as e:
+            report.loc[name, :] = ['failed', float('nan'), float('nan')]
+            errors[name] = e
+            return
+        state['stages'][name] = {
+            'key': key, 'seconds': seconds,
+            'finished': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'outputs': {f: _file_hash(f, state['files'])
+                        for f in stage.get('outputs', [])}}
+        report.loc[name, :] = ['run', seconds, float('nan')]
+        _write_state(state, state_file)
+
+    try:
+        while len(pending) + len(running) > 0:
+            # Start the stages whose dependencies are finished
+            started = False
+            for name in list(pending):
+                if any(report.loc[d, 'status'] not in
+                       ['run', 'skipped', 'failed', 'cancelled']
+                       for d in deps[name]):
+                    continue
+                pending.remove(name)
+                started = True
+                if any(report.loc[d, 'status'] in ['failed', 'cancelled']
+                       for d in deps[name]):
+                    report.loc[name, 'status'] = 'cancelled'
+                    continue
+                stage = by_name[name]
+                key = _stage_key(stage, state['files'])
+                last = state['stages'].get(name, {})
+                hashes = [_file_hash(f, state['files'])
+                          for f in stage.get('outputs', [])]
+                if (name not in force) and (last.get('key') == key) and \
+                        all((h is not None) and
+                            (h == last['outputs'].get(f))
+                            for f, h in zip(stage.get('outputs', []),
+                                            hashes)):
+                    report.loc[name, :] = ['skipped', 0.0, last['seconds']]
+                elif executor is None:
+                    _finish(name, key, lambda: _run_stage(
+                        stage['func'], stage.get('kwargs', {})))
+                else:
+                    running[executor.submit(
+                        _run_stage, stage['func'],
+                        stage.get('kwargs', {}))] = (name, key)
+            if len(running) == 0:
+                if not started:
+                    raise ValueError('The dependencies of the stages ' +
+                                     f'{pending} are circular.')
+                continue
+
+            # Wait for a running stage
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, key = running.pop(future)
+                _finish(name, key, future.result)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        _write_state(state, state_file)
+        report.to_csv(state_file.rsplit('.', 1)[0] + '.timings.txt',
+                      sep=' ')
+
+    if len(errors) > 0:
+        raise RuntimeError('Stages failed: ' +
+                           '; '.join(f'{k} ({type(e).__name__}: {e})'
+                                     for k, e in errors.items()))
+    return report
+
+
+def _file_hash(fname, cache):
+    """Hash of the contents of a file (None if it does not exist).
+
+    The hashes are cached in the dictionary `cache` with the size and
+    modification time of the files.
+    """
+    path = os.path.abspath(fname)
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    if (path in cache) and (cache[path][:2] == stamp):
+        return cache[path][2]
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    cache[path] = stamp + [sha.hexdigest()]
+    return cache[path][2]
+
+
+def _run_stage(func, kwargs):
+    """Run the function of a stage and return its run time."""
+    t0 = time.time()
+    func(**kwargs)
+    return time.time() - t0
+
+
+def _stage_key(stage, cache):
+    """Hash of the function, arguments and input files of a stage.
+
+    The argument `parallel`, which does not change the results, is
+    ignored.
+    """
+    func = stage['func']
+    kwargs = stage.get('kwargs', {})
+    inputs = [[os.path.abspath(f), _file_hash(f, cache)]
+              for f in stage.get('inputs', [])]
+    text = repr([func.__module__, func.__qualname__,
+                 sorted((k, repr(v)) for k, v in kwargs.items()
+                        if k != 'parallel'), inputs])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _with_defaults(func, kwargs):
+    """Arguments of a function completed with its default values."""
+    params = inspect.signature(func).parameters
+    return dict({k: p.default for k, p in params.items()
+                 if p.default is not inspect.Parameter.empty}, **kwargs)
+
+
+def _write_state(state, state_file):
+    """Write the state of a pipeline."""
+    with open(state_file, 'w') as f:
+        json.dump(state, f, indent=1)
@@ -0,0 +1,359 @@
+"""Functions to draw parameter samples.
+
+The functions in this module are used to draw parameter ensembles using
+Latin hypercube sampling and scrambled quasi-random (Sobol and Halton)
+sequences, as an alternative to the pseudo-random draws of
+:class:`pyemu.ParameterEnsemble`. Stratified and low-discrepancy samples
+cover the parameter space more evenly, so that fewer realizations are
+needed to obtain stable percentile bands in Monte Carlo simulations.
+
+This module contains the following functions:
+
+    * :func:`cov_factor`: factor of a covariance matrix.
+    * :func:`draw_ensemble`: draw a parameter ensemble.
+    * :func:`percentile_convergence`: convergence of percentile estimates.
+    * :func:`percentile_se`: standard error of percentile estimates.
+    * :func:`unit_sample`: sample of the unit hypercube.
+
+"""
+# Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
+#
+# This file is part of the Python package "cuspy".
+#
+# The package "cuspy" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The package "cuspy" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import os.path
+import warnings
+
+import numpy as np
+import pandas as pd
+import pyemu
+from scipy.stats import norm, qmc
+
+
+def unit_sample(n_samples, n_dims, sampler='lhs', seed=None, skip=0):
+    """Sample of the unit hypercube.
+
+    Args:
+        n_samples: number of samples.
+        n_dims: number of dimensions (parameters).
+        sampler: 'lhs' for Latin hypercube sampling, 'sobol' or
+            'halton' for scrambled Sobol or Halton sequences, or 'random'
+            for pseudo-random sampling. The balance properties of Sobol
+            sequences are best when `n_samples` is a power of 2.
+        seed: seed of the random number generator (used for sampling
+            and scrambling).
+        skip: number of points of the sequence to skip. With the same
+            `seed`, successive calls with `skip` equal to the number of
+            points already drawn continue the same sequence ('sobol',
+            'halton' and 'random'). Latin hypercube samples cannot be
+            extended; a new independent sample is drawn, using a seed
+            derived from `seed` and `skip`.
+
+    Returns:
+        A numpy array of shape (n_samples, n_dims) with values in the
+        interval (0, 1).
+    """
+    if sampler == 'lhs':
+        if (seed is not None) and (skip > 0):
+            seed = np.random.default_rng([seed, skip])
+        engine = qmc.LatinHypercube(d=n_dims, seed=seed)
+    elif sampler == 'sobol':
+        engine = qmc.Sobol(d=n_dims, scramble=True, seed=seed)
+    elif sampler == 'halton':
+        engine = qmc.Halton(d=n_dims, scramble=True, seed=seed)
+    elif sampler == 'random':
+        rng = np.random.default_rng(seed)
+        return rng.random((skip + n_samples, n_dims))[skip:, :]
+    else:
+        raise ValueError('Sampler not recognised. Choose "lhs", "sobol", ' +
+                         '"halton" or "random".')
+    with warnings.catch_warnings():
+        # Sobol balance warning when n_samples is not a power of 2
+        warnings.simplefilter('ignore', UserWarning)
+        if (skip > 0) and (sampler != 'lhs'):
+            engine.fast_forward(skip)
+        u = engine.random(n_samples)
+    # avoid infinite values when transforming to normal scores
+    return np.clip(u, 1e-12, 1 - 1e-12)
+
+
+def cov_factor(cov, var_explained=1.0, cache=True):
+    """Factor of a covariance matrix.
+
+    The covariance matrix C is factorized as C = F F', where F has one
+    row per parameter and one column per component, so that gaussian
+    realizations are obtained as F z, z being a vector of independent
+    standard normal scores. If `var_explained` is 1, F is the Cholesky
+    factor of C (or, if C is only semi-definite, the matrix of its
+    eigenvectors scaled by the square root of their eigenvalues). If
+    it is lower, F is truncated to the leading eigenvectors explaining
+    this fraction of the total variance, which reduces the number of
+    normal scores drawn for each realization.
+
+    If `cov` is a file and `cache` is True, the factor is saved in the
+    binary file :file:`<cov>.factor.npz`, next to the covariance file.
+    It is reused as long as it is more recent than the covariance file
+    and it was computed with the same `var_explained`, so that the ASCII
+    file is neither parsed nor factorized again.
+
+    Args:
+        cov: path of a covariance matrix file in ASCII format (e.g.,
+            the :file:`.post.cov` file written by `pestpp-glm`) or
+            :class:`pyemu.Cov` instance.
+        var_explained: fraction (between 0 and 1) of the total variance
+            explained by the retained components.
+        cache: save and reuse the factor of a covariance file.
+
+    Returns:
+        A :class:`pyemu.Matrix` instance of shape (npar, ncomp), with
+        the parameter names as row names.
+    """
+    cache_file = None
+    if isinstance(cov, str):
+        if cache:
+            cache_file = cov + '.factor.npz'
+        if (cache_file is not None) and os.path.isfile(cache_file) and \
+                os.path.getmtime(cache_file) >= os.path.getmtime(cov):
+            with np.load(cache_file) as data:
+                if data['var_explained'] == var_explained:
+                    return pyemu.Matrix(x=data['factor'],
+                                        row_names=list(data['names']),
+                                        col_names=list(data['components']))
+        cov = pyemu.Cov.from_ascii(cov)
+
+    x = cov.as_2d
+    factor = None
+    if var_explained >= 1:
+        try:
+            factor = np.linalg.cholesky(x)
+        except np.linalg.LinAlgError:
+            pass
+    if factor is None:
+        evals, evecs = np.linalg.eigh(x)
+        evals, evecs = np.maximum(evals[::-1], 0), evecs[:, ::-1]
+        n_comp = len(evals)
+        if var_explained < 1:
+            frac = np.cumsum(evals) / np.sum(evals)
+            n_comp = int(np.searchsorted(frac, var_explained) + 1)
+        factor = evecs[:, :n_comp] * np.sqrt(evals[:n_comp])
+    components = [f'pc{i}' for i in range(factor.shape[1])]
+
+    if cache_file is not None:
+        np.savez(cache_file, factor=factor, names=np.array(cov.row_names),
+                 components=np.array(components),
+                 var_explained=var_explained)
+    return pyemu.Matrix(x=factor, row_names=cov.row_names,
+                        col_names=components)
+
+
+def draw_ensemble(pst, n_samples, distribution='gaussian', sampler='lhs',
+                  cov=None, how_dict=None, seed=None, skip=0, factor=None,
+                  chunk_size=None):
+    """Draw a parameter ensemble.
+
+    The adjustable parameters are sampled from the unit hypercube (see
+    :func:`unit_sample`) and transformed to the requested distributions
+    by their inverse cumulative distribution functions. As in
+    :class:`pyemu.ParameterEnsemble`, log-transformed parameters are
+    sampled in log space, and fixed and tied parameters take the values
+    in `pst`. Gaussian parameters are sampled jointly: their normal
+    scores are correlated using the Cholesky factor of `cov`. Values
+    of gaussian parameters outside the parameter bounds are reset to
+    the bounds.
+
+    Args:
+        pst: a pest instance.
+        n_samples: number of realizations.
+        distribution: 'uniform' (between parameter bounds), 'triangular'
+            (between parameter bounds, with mode at the parameter
+            values), 'gaussian' (centered on the parameter values) or
+            'mixed'.
+        sampler: 'lhs', 'sobol', 'halton' or 'random' (see
+            :func:`unit_sample`).
+        cov: parameter covariance (:class:`pyemu.Cov` instance) of
+            gaussian parameters. If None, it is estimated from parameter
+            bounds.
+        how_dict: dictionary of parameter names (keys) and distributions
+            (values). Only used if ``distribution = mixed``. Parameters
+            not in `how_dict` are gaussian.
+        seed: seed of the random number generator.
+        skip: number of points of the sequence to skip (see
+            :func:`unit_sample`). The realizations are named from `skip`
+            to `skip` + `n_samples` - 1.
+        factor: factor of the covariance of gaussian parameters (see
+            :func:`cov_factor`), used instead of `cov`. If it is
+            truncated, the number of normal scores drawn for each
+            realization is the number of components of the factor.
+        chunk_size: number of realizations whose gaussian values are
+            computed in one pass, to limit the size of temporary
+            arrays. If None, all at once.
+
+    Returns:
+        A :class:`pyemu.ParameterEnsemble` instance.
+    """
+    par = pst.parameter_data
+    adj_names = pst.adj_par_names
+    li = (par.partrans == 'log').values
+    lb, ub, pv = [par[c].values.astype(np.float64)
+                  for c in ['parlbnd', 'parubnd', 'parval1']]
+    lb[li], ub[li], pv[li] = np.log10(lb[li]), np.log10(ub[li]), \
+        np.log10(pv[li])
+
+    # distribution of each adjustable parameter
+    if distribution == 'mixed':
+        if how_dict is None:
+            how_dict = {}
+        hows = [how_dict.get(p, 'gaussian') for p in adj_names]
+    elif distribution in ['uniform', 'triangular', 'gaussian']:
+        hows = [distribution] * len(adj_names)
+    else:
+        raise KeyError(distribution)
+    hows = np.array(hows)
+
+    # sample unit hypercube and apply inverse distribution functions
+    u = unit_sample(n_samples, len(adj_names), sampler=sampler, seed=seed,
+                    skip=skip)
+    arr = np.tile(pv, (n_samples, 1))
+    adj_inds = par.index.get_indexer(adj_names)
+
+    inds = adj_inds[hows == 'uniform']
+    arr[:, inds] = lb[inds] + u[:, hows == 'uniform'] * (ub[inds] - lb[inds])
+
+    inds = adj_inds[hows == 'triangular']
+    if len(inds) > 0:
+        ut = u[:, hows == 'triangular']
+        a, b, c = lb[inds], ub[inds], pv[inds]
+        fc = (c - a) / (b - a)
+        arr[:, inds] = np.where(ut < fc,
+                                a + np.sqrt(ut * (b - a) * (c - a)),
+                                b - np.sqrt((1 - ut) * (b - a) * (b - c)))
+
+    inds = adj_inds[hows == 'gaussian']
+    if len(inds) > 0:
+        g_names = [adj_names[i] for i in np.where(hows == 'gaussian')[0]]
+        if factor is None:
+            if cov is None:
+                cov = pyemu.Cov.from_parameter_data(pst)
+            factor = cov_factor(cov.get(row_names=g_names,
+                                        col_names=g_names))
+        factor = factor.get(row_names=g_names).x
+        ug = u[:, hows == 'gaussian'][:, :factor.shape[1]]
+        if chunk_size is None:
+            chunk_size = n_samples
+        for start in range(0, n_samples, chunk_size):
+            rows = slice(start, start + chunk_size)
+            arr[rows, inds] = pv[inds] + norm.ppf(ug[rows]) @ factor.T
+        arr[:, inds] = np.clip(arr[:, inds], lb[inds], ub[inds])
+
+    arr[:, li] = 10.0**arr[:, li]
+    df = pd.DataFrame(arr, index=np.arange(skip, skip + n_samples,
+                                           dtype=np.int64),
+                      columns=pst.par_names)
+    return pyemu.ParameterEnsemble(pst=pst, df=df)
+
+
+def percentile_convergence(pst, response, n_list, samplers=None,
+                           distribution='gaussian', cov=None, how_dict=None,
+                           n_repeats=10, n_ref=10000, percentiles=(5, 95)):
+    """Convergence of percentile estimates.
+
+    This function is a benchmark of the number of realizations needed by
+    each sampler to obtain stable percentile bands. For each sampler and
+    sample size, `n_repeats` ensembles are drawn with different seeds
+    and the percentiles of the response are calculated. The error is
+    the mean absolute difference between these percentiles and those of
+    a reference pseudo-random sample of size `n_ref`, divided by the
+    width of the reference band between the lowest and highest
+    `percentiles`. Since `response` is called with every ensemble, it
+    should be cheap to evaluate (e.g., an analytical function, a
+    linearized model or an emulator).
+
+    Args:
+        pst: a pest instance.
+        response: function taking a pandas dataframe of parameter values
+            (one row per realization) and returning an array of shape
+            (n_realizations, n_outputs).
+        n_list: list of sample sizes.
+        samplers: list of samplers (see :func:`unit_sample`). If None,
+            ['random', 'lhs', 'sobol', 'halton'].
+        distribution: distribution of the parameters (see
+            :func:`draw_ensemble`).
+        cov: parameter covariance (see :func:`draw_ensemble`).
+        how_dict: dictionary of distributions (see
+            :func:`draw_ensemble`).
+        n_repeats: number of ensembles drawn for each sampler and
+            sample size.
+        n_ref: size of the reference sample.
+        percentiles: percentiles whose convergence is evaluated.
+
+    Returns:
+        A pandas dataframe with the mean (over repeats) of the
+        relative error of the percentiles, with a row for each sample
+        size and a column for each sampler.
+    """
+    if samplers is None:
+        samplers = ['random', 'lhs', 'sobol', 'halton']
+
+    def _percentiles(n, sampler, seed):
+        pe = draw_ensemble(pst, n, distribution=distribution,
+                           sampler=sampler, cov=cov, how_dict=how_dict,
+                           seed=seed)
+        y = np.asarray(response(pe._df))
+        return np.percentile(y, percentiles, axis=0)
+
+    q_ref = _percentiles(n_ref, 'random', 0)
+    width = q_ref[-1] - q_ref[0]
+    width[width == 0] = np.nan
+    errors = pd.DataFrame(index=pd.Index(n_list, name='n_samples'),
+                          columns=samplers, dtype=np.float64)
+    for sampler in samplers:
+        for n in n_list:
+            err = [np.nanmean(np.abs(_percentiles(n, sampler, r + 1) -
+                                     q_ref) / width)
+                   for r in range(n_repeats)]
+            errors.loc[n, sampler] = np.mean(err)
+    return errors
+
+
+def percentile_se(values, percentiles=(5, 95), z=1.96):
+    """Standard error of percentile estimates.
+
+    The standard error is estimated in a distribution-free way from the
+    order statistics of the sample: the confidence interval of the
+    percentile q is bounded by the order statistics of ranks
+    n q -/+ z (n q (1 - q))^0.5, and the standard error is the width
+    of this interval divided by 2 z.
+
+    Args:
+        values: array of shape (n_realizations, n_outputs). Missing
+            values (NaN) are ignored.
+        percentiles: percentiles (between 0 and 100).
+        z: quantile of the standard normal distribution defining the
+            confidence interval.
+
+    Returns:
+        A numpy array of shape (len(percentiles), n_outputs).
+    """
+    x = np.sort(np.asarray(values, dtype=np.float64), axis=0)
+    n = np.sum(~np.isnan(x), axis=0)
+    se = np.empty((len(percentiles), x.shape[1]))
+    cols = np.arange(x.shape[1])
+    for i, p in enumerate(percentiles):
+        q = p / 100
+        half = z * np.sqrt(n * q * (1 - q))
+        k_lo = np.clip(np.floor(n * q - half), 0, n - 1).astype(int)
+        k_hi = np.clip(np.ceil(n * q + half), 0, n - 1).astype(int)
+        se[i, :] = (x[k_hi, cols] - x[k_lo, cols]) / (2 * z)
+    se[:, n < 2] = np.nan
+    return se
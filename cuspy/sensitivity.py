@@ -0,0 +1,468 @@
+"""Functions for global sensitivity analyses.
+
+The functions in this module implement the designs and the sensitivity
+indices of the methods of Morris and Sobol, as an alternative to
+`pestpp-sen`. The designs are parameter ensembles that can be run with
+`pestpp-swp` (see :func:`functions.run_sweep`), so that the model runs
+may be parallelized, monitored, resumed and reused. The indices are
+calculated for all the outputs (observations and predictions) at once,
+with bootstrap confidence intervals.
+
+The functions :func:`rank_correlation`, :func:`regression_coefs` and
+:func:`binned_indices` calculate given-data sensitivity measures from
+any sample of parameters and outputs, e.g., the results of a Monte
+Carlo simulation, without additional model runs.
+
+This module contains the following functions:
+
+    * :func:`binned_indices`: first-order indices from binned samples.
+    * :func:`group_indices`: sensitivity indices of groups of outputs.
+    * :func:`morris_design`: design of Morris's method.
+    * :func:`morris_indices`: sensitivity indices of Morris's method.
+    * :func:`par_to_unit`: scale parameter values to the unit interval.
+    * :func:`rank_correlation`: rank correlation coefficients.
+    * :func:`regression_coefs`: standardized regression coefficients.
+    * :func:`sobol_design`: design of Sobol's method.
+    * :func:`sobol_indices`: sensitivity indices of Sobol's method.
+    * :func:`unit_to_par`: scale unit values to parameter values.
+
+"""
+# Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
+#
+# This file is part of the Python package "cuspy".
+#
+# The package "cuspy" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The package "cuspy" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+import numpy as np
+import pandas as pd
+import pyemu
+from scipy.stats import norm
+
+from cuspy.sampling import unit_sample
+
+
+def unit_to_par(pst, u):
+    """Scale unit values to parameter values.
+
+    The values of the adjustable parameters are scaled linearly between
+    their bounds (in log space for log-transformed parameters). Fixed
+    and tied parameters take the values in `pst`.
+
+    Args:
+        pst: a pest instance.
+        u: array of shape (n_samples, n_adj) of values between 0 and 1,
+            with a column for each adjustable parameter.
+
+    Returns:
+        A pandas dataframe of shape (n_samples, npar) containing the
+        values of all the parameters.
+    """
+    par = pst.parameter_data
+    li = (par.partrans == 'log').values
+    lb, ub, pv = [par[c].values.astype(np.float64)
+                  for c in ['parlbnd', 'parubnd', 'parval1']]
+    lb[li], ub[li], pv[li] = np.log10(lb[li]), np.log10(ub[li]), \
+        np.log10(pv[li])
+    inds = par.index.get_indexer(pst.adj_par_names)
+    arr = np.tile(pv, (u.shape[0], 1))
+    arr[:, inds] = lb[inds] + u * (ub[inds] - lb[inds])
+    arr[:, li] = 10.0**arr[:, li]
+    return pd.DataFrame(arr, columns=pst.par_names)
+
+
+def par_to_unit(pst, df):
+    """Scale parameter values to the unit interval.
+
+    This is the inverse of :func:`unit_to_par`.
+
+    Args:
+        pst: a pest instance.
+        df: pandas dataframe containing parameter values (one row per
+            realization and a column for each parameter).
+
+    Returns:
+        An array of shape (n_samples, n_adj), with a column for each
+        adjustable parameter.
+    """
+    par = pst.parameter_data.loc[pst.adj_par_names, :]
+    li = (par.partrans == 'log').values
+    x = df.loc[:, pst.adj_par_names].values.astype(np.float64)
+    lb, ub = par.parlbnd.values.astype(np.float64), \
+        par.parubnd.values.astype(np.float64)
+    x[:, li], lb[li], ub[li] = np.log10(x[:, li]), np.log10(lb[li]), \
+        np.log10(ub[li])
+    return (x - lb) / (ub - lb)
+
+
+def sobol_design(pst, n_samples, seed=None, skip=0):
+    """Design of Sobol's method.
+
+    The design of Saltelli (2002) is built from two matrices A and B
+    of `n_samples` rows, taken from a scrambled Sobol sequence of
+    dimension 2k (k being the number of adjustable parameters), and k
+    matrices AB_i, equal to A except for the column i, taken from B.
+    For each row j of the matrices, the design contains the k + 2
+    realizations A_j, AB_1j, ..., AB_kj, B_j, named from j (k + 2) to
+    j (k + 2) + k + 1. The design requires n_samples (k + 2) model runs.
+    Parameter values are uniformly distributed between their bounds (in
+    log space for log-transformed parameters).
+
+    A design may be extended by calling this function again with the
+    same `seed` and `skip` equal to the number of rows already drawn:
+    the new realizations continue the Sobol sequence and their names
+    continue those of the existing realizations.
+
+    Args:
+        pst: a pest instance.
+        n_samples: number of rows of the matrices A and B. The balance
+            properties of Sobol sequences are best when it is a power
+            of 2.
+        seed: seed of the scrambling of the Sobol sequence.
+        skip: number of rows of the sequence to skip.
+
+    Returns:
+        A :class:`pyemu.ParameterEnsemble` instance.
+
+    References:
+        * Saltelli, A. (2002) Making best use of model evaluations to
+          compute sensitivity indices. *Computer Physics
+          Communications*, 145(2), 280-297.
+    """
+    k = len(pst.adj_par_names)
+    u = unit_sample(n_samples, 2 * k, sampler='sobol', seed=seed,
+                    skip=skip)
+    a, b = u[:, :k], u[:, k:]
+    design = np.repeat(a[:, np.newaxis, :], k + 2, axis=1)
+    design[:, -1, :] = b
+    rows = np.arange(k)
+    design[:, rows + 1, rows] = b[:, rows]
+    df = unit_to_par(pst, design.reshape(-1, k))
+    df.index = np.arange(skip * (k + 2), (skip + n_samples) * (k + 2),
+                         dtype=np.int64)
+    return pyemu.ParameterEnsemble(pst=pst, df=df)
+
+
+def morris_design(pst, n_traj, n_levels=4, n_candidates=None, seed=None):
+    """Design of Morris's method.
+
+    Each trajectory starts from a random point of a grid of `n_levels`
+    levels in the unit hypercube and changes the adjustable parameters
+    one at a time, in random order, by a step of
+    n_levels / (2 (n_levels - 1)) (Morris, 1991). If `n_candidates` is
+    larger than `n_traj`, `n_candidates` trajectories are generated and
+    the `n_traj` trajectories that are most spread are selected, by
+    maximizing greedily the sum of squared distances between
+    trajectories (Campolongo et al., 2007). The realizations of the
+    trajectory t are named from t (k + 1) to t (k + 1) + k, k being the
+    number of adjustable parameters.
+
+    Args:
+        pst: a pest instance.
+        n_traj: number of trajectories (the design requires
+            n_traj (k + 1) model runs).
+        n_levels: number of levels (an even number).
+        n_candidates: number of candidate trajectories. If None, no
+            optimization is made.
+        seed: seed of the random number generator.
+
+    Returns:
+        A :class:`pyemu.ParameterEnsemble` instance.
+
+    References:
+        * Morris, M.D. (1991) Factorial sampling plans for preliminary
+          computational experiments. *Technometrics*, 33(2), 161-174.
+        * Campolongo, F.; Cariboni, J.; Saltelli, A. (2007) An
+          effective screening design for sensitivity analysis of large
+          models. *Environmental Modelling & Software*, 22,
+          1509-1518.
+    """
+    k = len(pst.adj_par_names)
+    rng = np.random.default_rng(seed)
+    n_cand = max(n_traj, n_candidates or 0)
+    delta = n_levels / (2 * (n_levels - 1))
+
+    # trajectories (n_cand, k + 1, k) in the unit hypercube
+    steps = np.tril(np.ones((k + 1, k)), -1)
+    x0 = rng.integers(0, n_levels // 2, size=(n_cand, 1, k)) / \
+        (n_levels - 1)
+    signs = rng.choice([-1, 1], size=(n_cand, 1, k))
+    traj = x0 + delta / 2 * ((2 * steps - 1) * signs + 1)
+    order = np.argsort(rng.random((n_cand, k)), axis=1)
+    traj = np.take_along_axis(traj, order[:, np.newaxis, :], axis=2)
+
+    if n_cand > n_traj:
+        # distances between trajectories (sums of point distances)
+        pts = traj.reshape(-1, k)
+        d2 = np.sum(pts**2, axis=1)
+        dist = np.sqrt(np.maximum(d2[:, np.newaxis] + d2[np.newaxis, :] -
+                                  2 * pts @ pts.T, 0))
+        dist = dist.reshape(n_cand, k + 1, n_cand, k + 1).sum(axis=(1, 3))
+        # greedy selection of the most spread trajectories
+        i, j = np.unravel_index(np.argmax(dist), dist.shape)
+        selected = [i, j]
+        score = dist[i]**2 + dist[j]**2
+        while len(selected) < n_traj:
+            score[selected] = -1
+            i = int(np.argmax(score))
+            selected.append(i)
+            score = score + dist[i]**2
+        traj = traj[np.sort(selected[:n_traj])]
+
+    df = unit_to_par(pst, traj.reshape(-1, k))
+    df.index = np.arange(n_traj * (k + 1), dtype=np.int64)
+    return pyemu.ParameterEnsemble(pst=pst, df=df)
+
+
+def sobol_indices(y, n_params, n_boot=100, conf=0.95, seed=None):
+    """Sensitivity indices of Sobol's method.
+
+    The first-order indices are estimated as in Saltelli et al. (2010),
+    and the total-order indices with the estimator of Jansen (1999),
+    for all the outputs at once. Rows of the design (see
+    :func:`sobol_design`) with missing values (e.g., failed runs) are
+    ignored for the outputs concerned. The confidence intervals are
+    obtained by bootstrap resampling of the rows of the design.
+
+    Args:
+        y: array of shape (n_samples (n_params + 2), n_outputs)
+            containing the model outputs in the order of the design.
+        n_params: number of parameters.
+        n_boot: number of bootstrap resamples.
+        conf: confidence level of the confidence intervals.
+        seed: seed of the random number generator used for bootstrap.
+
+    Returns:
+        A dictionary of arrays of shape (n_params, n_outputs) with the
+        keys 'S1' and 'ST' (first- and total-order indices) and
+        'S1_conf' and 'ST_conf' (half-widths of the confidence
+        intervals), and an array of shape (n_outputs,) with the key
+        'var' (variance of the outputs).
+
+    References:
+        * Jansen, M.J.W. (1999) Analysis of variance designs for model
+          output. *Computer Physics Communications*, 117, 35-43.
+        * Saltelli, A.; Annoni, P.; Azzini, I.; Campolongo, F.; Ratto,
+          M.; Tarantola, S. (2010) Variance based sensitivity analysis
+          of model output. Design and estimator for the total
+          sensitivity index. *Computer Physics Communications*, 181,
+          259-270.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    y = y.reshape(-1, n_params + 2, y.shape[-1])
+    # ignore rows of the design with missing values
+    y = np.where(np.any(np.isnan(y), axis=1, keepdims=True), np.nan, y)
+
+    def _indices(rows):
+        f_a, f_ab, f_b = y[rows, 0], y[rows, 1:-1], y[rows, -1]
+        var = np.nanvar(np.concatenate([f_a, f_b]), axis=0)
+        var[var == 0] = np.nan
+        s1 = np.nanmean(f_b[:, np.newaxis] * (f_ab - f_a[:, np.newaxis]),
+                        axis=0) / var
+        st = 0.5 * np.nanmean((f_a[:, np.newaxis] - f_ab)**2, axis=0) / var
+        return s1, st, var
+
+    n_rows = y.shape[0]
+    s1, st, var = _indices(np.arange(n_rows))
+    rng = np.random.default_rng(seed)
+    boot = [_indices(rng.integers(0, n_rows, n_rows))[:2]
+            for _ in range(n_boot)]
+    z = norm.ppf(0.5 + conf / 2)
+    return {'S1': s1, 'S1_conf': z * np.nanstd([b[0] for b in boot], axis=0),
+            'ST': st, 'ST_conf': z * np.nanstd([b[1] for b in boot], axis=0),
+            'var': var}
+
+
+def morris_indices(x, y, n_boot=100, conf=0.95, seed=None):
+    """Sensitivity indices of Morris's method.
+
+    The elementary effects are the differences of the outputs between
+    successive points of each trajectory (see :func:`morris_design`),
+    divided by the change of the parameter that was modified, in the
+    unit hypercube (i.e., as a fraction of the parameter range). The
+    indices are the mean (mu), mean of absolute values (mu*, Campolongo
+    et al. 2007) and standard deviation (sigma) of the elementary
+    effects, for all the outputs at once. Missing values (e.g., failed
+    runs) are ignored. The confidence intervals of mu* are obtained by
+    bootstrap resampling of the trajectories.
+
+    Args:
+        x: array of shape (n_traj (n_params + 1), n_params) containing
+            the design in the unit hypercube (see :func:`par_to_unit`).
+        y: array of shape (n_traj (n_params + 1), n_outputs) containing
+            the model outputs in the order of the design.
+        n_boot: number of bootstrap resamples.
+        conf: confidence level of the confidence intervals.
+        seed: seed of the random number generator used for bootstrap.
+
+    Returns:
+        A dictionary of arrays of shape (n_params, n_outputs) with the
+        keys 'mu', 'mu_star', 'sigma' and 'mu_star_conf' (half-width of
+        the confidence interval of mu*).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    k = x.shape[1]
+    x = x.reshape(-1, k + 1, k)
+    y = np.asarray(y, dtype=np.float64)
+    y = y.reshape(x.shape[0], k + 1, -1)
+
+    # elementary effects (n_traj, n_params, n_outputs)
+    dx = np.diff(x, axis=1)
+    changed = np.argmax(np.abs(dx), axis=2)
+    step = np.take_along_axis(dx, changed[:, :, np.newaxis], axis=2)
+    ee = np.empty((x.shape[0], k, y.shape[2]))
+    ee[np.arange(x.shape[0])[:, np.newaxis], changed] = \
+        np.diff(y, axis=1) / step
+
+    rng = np.random.default_rng(seed)
+    abs_ee = np.abs(ee)
+    boot = [np.nanmean(abs_ee[rng.integers(0, ee.shape[0], ee.shape[0])],
+                       axis=0) for _ in range(n_boot)]
+    z = norm.ppf(0.5 + conf / 2)
+    return {'mu': np.nanmean(ee, axis=0),
+            'mu_star': np.nanmean(abs_ee, axis=0),
+            'sigma': np.nanstd(ee, axis=0, ddof=1),
+            'mu_star_conf': z * np.nanstd(boot, axis=0)}
+
+
+def rank_correlation(x, y):
+    """Rank correlation coefficients.
+
+    Spearman's rank correlation coefficients between each parameter and
+    each output, calculated for all the outputs at once as the Pearson
+    correlation coefficients of the ranks.
+
+    Args:
+        x: array of shape (n_samples, n_params) of parameter values.
+        y: array of shape (n_samples, n_outputs) of output values,
+            without missing values.
+
+    Returns:
+        An array of shape (n_params, n_outputs).
+    """
+    rx = _standardize(np.argsort(np.argsort(x, axis=0), axis=0))
+    ry = _standardize(np.argsort(np.argsort(y, axis=0), axis=0))
+    return rx.T @ ry / x.shape[0]
+
+
+def regression_coefs(x, y):
+    """Standardized regression coefficients.
+
+    The outputs are regressed linearly on the parameters, after both
+    have been standardized (zero mean, unit variance), for all the
+    outputs at once. For a linear model with independent parameters,
+    the squared coefficients are the first-order sensitivity indices,
+    and their sum is the coefficient of determination R2 of the
+    regression, which indicates whether the coefficients are reliable
+    (e.g., R2 > 0.7).
+
+    Args:
+        x: array of shape (n_samples, n_params) of parameter values.
+        y: array of shape (n_samples, n_outputs) of output values,
+            without missing values.
+
+    Returns:
+        A tuple containing the array of coefficients of shape
+        (n_params, n_outputs) and the array of R2 of shape
+        (n_outputs,).
+    """
+    xs, ys = _standardize(x), _standardize(y)
+    coefs = np.linalg.lstsq(xs, ys, rcond=None)[0]
+    resid = ys - xs @ coefs
+    r2 = 1 - np.sum(resid**2, axis=0) / np.sum(ys**2, axis=0)
+    return coefs, r2
+
+
+def binned_indices(x, y, n_bins=None):
+    """First-order indices from binned samples.
+
+    For each parameter, the sample is divided into `n_bins` bins of
+    equal size according to the parameter values, and the first-order
+    index is estimated as the variance of the mean outputs of the bins
+    divided by the variance of the outputs, i.e., Var(E(Y|X_i)) /
+    Var(Y). The means of the bins are calculated for all the outputs at
+    once with a matrix product. The estimate is biased upwards by about
+    (n_bins - 1) / n_samples (the contribution of sampling noise to the
+    variance of the bin means), which is subtracted.
+
+    Args:
+        x: array of shape (n_samples, n_params) of parameter values.
+        y: array of shape (n_samples, n_outputs) of output values,
+            without missing values.
+        n_bins: number of bins. If None, it is the square root of the
+            number of samples (between 2 and 50).
+
+    Returns:
+        An array of shape (n_params, n_outputs).
+    """
+    n = x.shape[0]
+    if n_bins is None:
+        n_bins = int(np.clip(np.sqrt(n), 2, 50))
+    var = np.var(y, axis=0)
+    var[var == 0] = np.nan
+    y_c = y - np.mean(y, axis=0)
+    s1 = np.empty((x.shape[1], y.shape[1]))
+    for i in range(x.shape[1]):
+        bins = np.argsort(np.argsort(x[:, i])) * n_bins // n
+        one_hot = np.zeros((n_bins, n))
+        one_hot[bins, np.arange(n)] = 1
+        counts = one_hot.sum(axis=1)
+        means = one_hot @ y_c / counts[:, np.newaxis]
+        s1[i] = counts @ means**2 / n / var
+    return s1 - (n_bins - 1) / n * (1 - s1)
+
+
+def group_indices(indices, obs_groups, weights=None):
+    """Sensitivity indices of groups of outputs.
+
+    The indices of the outputs of each group are averaged. For Sobol's
+    indices, the outputs should be weighted by their variance, so that
+    the averages are the indices of the sum of the outputs of the group
+    (generalized sensitivity indices).
+
+    Args:
+        indices: pandas dataframe of indices with a MultiIndex
+            (output name, parameter name), with a column for each index.
+        obs_groups: pandas series of group names, indexed by output
+            names.
+        weights: pandas series of weights, indexed by output names. If
+            None, the outputs have the same weight.
+
+    Returns:
+        A pandas dataframe of indices with a MultiIndex (group name,
+        parameter name).
+    """
+    names = indices.index.get_level_values(0)
+    if weights is None:
+        w = np.ones(len(names))
+    else:
+        w = weights.reindex(names).values.astype(np.float64)
+    w = np.where(np.isnan(w), 0, w)
+    values = indices.values.astype(np.float64)
+    valid = ~np.isnan(values)
+    keys = [obs_groups.reindex(names).values,
+            indices.index.get_level_values(1)]
+    num = pd.DataFrame(np.where(valid, values, 0) * w[:, np.newaxis],
+                       columns=indices.columns).groupby(keys).sum()
+    den = pd.DataFrame(valid * w[:, np.newaxis],
+                       columns=indices.columns).groupby(keys).sum()
+    grouped = num / den.replace(0, np.nan)
+    grouped.index.names = ['group', indices.index.names[1]]
+    return grouped
+
+
+def _standardize(x):
+    """Standardize the columns of an array (constant columns are zero)."""
+    x = np.asarray(x, dtype=np.float64)
+    sd = np.std(x, axis=0)
+    sd[sd == 0] = np.inf
+    return (x - np.mean(x, axis=0)) / sd
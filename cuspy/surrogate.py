@@ -0,0 +1,212 @@
+"""Functions for surrogate models (emulators) of the model outputs.
+
+The functions in this module fit and evaluate polynomial chaos
+expansions (PCE) of the model outputs, trained from the parameter values
+and the results of model runs (e.g., the files :file:`sweep_in.csv` and
+:file:`sweep_out.csv` of a Monte Carlo simulation). The outputs are
+standardized and reduced by principal component analysis (PCA), so that
+a single least-squares fit gives the expansions of all the components,
+and the evaluation of a sample of parameters costs a few matrix
+products, whatever the number of outputs. The accuracy of the surrogate
+is estimated by k-fold cross-validation, and the models fitted on the
+folds are also used to flag the samples where the surrogate is not
+reliable (extrapolation or disagreement between folds).
+
+This module contains the following functions:
+
+    * :func:`fit_pce`: fit a polynomial chaos expansion.
+    * :func:`load_surrogate`: load a surrogate model from a file.
+    * :func:`predict_pce`: evaluate a polynomial chaos expansion.
+    * :func:`save_surrogate`: save a surrogate model to a file.
+
+"""
+# Copyright 2020-2023 Segula Technologies - Office Français de la Biodiversité.
+#
+# This file is part of the Python package "cuspy".
+#
+# The package "cuspy" is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The package "cuspy" is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with "cuspy".  If not, see <https://www.gnu.org/licenses/>.
+from itertools import combinations_with_replacement
+
+import numpy as np
+
+
+def fit_pce(u, y, degree=3, var_explained=0.9999, n_folds=5, alpha=1e-8,
+            seed=None):
+    """Fit a polynomial chaos expansion.
+
+    The outputs are standardized and projected on their principal
+    components, keeping the components that explain the fraction
+    `var_explained` of their variance. The scores of the components are
+    fitted by ridge least squares on a basis of orthonormal Legendre
+    polynomials of the inputs, of total degree up to `degree` (lowered
+    if there are not enough training samples). The same fit is made on
+    `n_folds` subsets of the samples, each one leaving out one fold, to
+    estimate the cross-validation error of each output.
+
+    Args:
+        u: array of shape (n_samples, n_dims) of inputs scaled to the
+            unit interval (e.g., parameter values scaled with
+            :func:`sensitivity.par_to_unit`).
+        y: array of shape (n_samples, n_outputs) of outputs.
+        degree: maximum total degree of the polynomials.
+        var_explained: fraction of the variance of the standardized
+            outputs explained by the principal components kept.
+        n_folds: number of folds of the cross-validation (at least 2).
+        alpha: ridge penalty, relative to the number of samples.
+        seed: seed of the random number generator used to split the
+            samples into folds.
+
+    Returns:
+        A dictionary containing the arrays of the surrogate model. The
+        cross-validation root mean squared error of each output (in the
+        units of the outputs) is in the key 'cv_rmse', and the
+        cross-validated outputs in the key 'cv_pred'.
+
+    References:
+        * Sudret, B. (2008) Global sensitivity analysis using polynomial
+          chaos expansions. *Reliability Engineering & System Safety*,
+          93, 964-979.
+    """
+    u = np.asarray(u, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n_samples, n_dims = u.shape
+    if n_folds < 2:
+        raise ValueError('At least 2 folds are needed.')
+
+    # basis of polynomials (fewer terms than samples of each fold)
+    n_fit = n_samples - int(np.ceil(n_samples / n_folds))
+    exponents = _exponents(n_dims, degree)
+    while (exponents.shape[0] > n_fit) and (degree > 1):
+        degree -= 1
+        exponents = _exponents(n_dims, degree)
+    phi = _legendre_basis(u, exponents)
+
+    # principal components of the standardized outputs
+    mean, scale = y.mean(axis=0), y.std(axis=0)
+    scale[scale == 0] = 1
+    _, sv, vt = np.linalg.svd((y - mean) / scale, full_matrices=False)
+    cum = np.cumsum(sv**2) / max(np.sum(sv**2), np.finfo(float).tiny)
+    n_comp = min(int(np.searchsorted(cum, var_explained)) + 1, len(sv))
+    components = vt[:n_comp, :]
+    scores = ((y - mean) / scale) @ components.T
+
+    # fit on all the samples and on the folds
+    coefs = _fit_coefs(phi, scores, alpha)
+    folds = np.random.default_rng(seed).permutation(n_samples) % n_folds
+    fold_coefs = np.empty((n_folds,) + coefs.shape)
+    cv_pred = np.empty_like(y)
+    for k in range(n_folds):
+        test = folds == k
+        fold_coefs[k] = _fit_coefs(phi[~test], scores[~test], alpha)
+        cv_pred[test] = (phi[test] @ fold_coefs[k]) @ components * scale + \
+            mean
+
+    return {'degree': np.array(degree), 'exponents': exponents,
+            'mean': mean, 'scale': scale, 'components': components,
+            'coefs': coefs, 'fold_coefs': fold_coefs,
+            'u_min': u.min(axis=0), 'u_max': u.max(axis=0),
+            'cv_rmse': np.sqrt(np.mean((cv_pred - y)**2, axis=0)),
+            'cv_pred': cv_pred}
+
+
+def load_surrogate(fname):
+    """Load a surrogate model from a file.
+
+    Args:
+        fname: path of the file written by :func:`save_surrogate`.
+
+    Returns:
+        A dictionary containing the arrays of the surrogate model.
+    """
+    with np.load(fname) as data:
+        return {k: data[k] for k in data.files}
+
+
+def predict_pce(model, u, flag_factor=3.0):
+    """Evaluate a polynomial chaos expansion.
+
+    A sample is flagged when it is outside the range of the training
+    samples, or when the models fitted on the folds of the
+    cross-validation disagree: the root mean square (over the
+    standardized outputs) of their standard deviation is larger than
+    `flag_factor` times the root mean square of the cross-validation
+    errors of the standardized outputs.
+
+    Args:
+        model: dictionary returned by :func:`fit_pce`.
+        u: array of shape (n_samples, n_dims) of inputs scaled to the
+            unit interval.
+        flag_factor: threshold of the disagreement between folds.
+
+    Returns:
+        A tuple containing the array of shape (n_samples, n_outputs) of
+        the outputs and the boolean array of flagged samples.
+    """
+    u = np.asarray(u, dtype=np.float64)
+    phi = _legendre_basis(u, model['exponents'])
+    y = (phi @ model['coefs']) @ model['components'] * model['scale'] + \
+        model['mean']
+
+    # extrapolation and disagreement between folds
+    flags = np.any((u < model['u_min']) | (u > model['u_max']), axis=1)
+    fold_scores = np.einsum('np,kpc->knc', phi, model['fold_coefs'])
+    spread = np.sqrt(np.sum(fold_scores.var(axis=0), axis=1) /
+                     model['components'].shape[1])
+    cv_rms = np.sqrt(np.mean((model['cv_rmse'] / model['scale'])**2))
+    flags |= spread > flag_factor * cv_rms
+    return y, flags
+
+
+def save_surrogate(model, fname):
+    """Save a surrogate model to a file.
+
+    Args:
+        model: dictionary of arrays (e.g., returned by :func:`fit_pce`).
+        fname: path of the file (NumPy format :file:`.npz`).
+    """
+    np.savez(fname, **model)
+
+
+def _exponents(n_dims, degree):
+    """Exponents of the multivariate polynomials of total degree up to
+    `degree` (one row per polynomial)."""
+    rows = [np.zeros(n_dims, dtype=int)]
+    for d in range(1, degree + 1):
+        for dims in combinations_with_replacement(range(n_dims), d):
+            row = np.zeros(n_dims, dtype=int)
+            np.add.at(row, list(dims), 1)
+            rows.append(row)
+    return np.array(rows)
+
+
+def _legendre_basis(u, exponents):
+    """Values of the orthonormal Legendre polynomials (on [0, 1])."""
+    x = 2 * u - 1
+    degree = int(exponents.max()) if exponents.size > 0 else 0
+    leg = np.ones((degree + 1,) + x.shape)
+    if degree > 0:
+        leg[1] = x
+    for d in range(2, degree + 1):
+        leg[d] = ((2 * d - 1) * x * leg[d - 1] - (d - 1) * leg[d - 2]) / d
+    leg *= np.sqrt(2 * np.arange(degree + 1) + 1)[:, np.newaxis, np.newaxis]
+    phi = np.ones((u.shape[0], exponents.shape[0]))
+    for j in range(u.shape[1]):
+        phi *= leg[exponents[:, j], :, j].T
+    return phi
+
+
+def _fit_coefs(phi, scores, alpha):
+    """Ridge least-squares coefficients."""
+    lhs = phi.T @ phi + alpha * phi.shape[0] * np.eye(phi.shape[1])
+    return np.linalg.solve(lhs, phi.T @ scores)
@@ -24,7 +24,7 @@ setup(
         'License :: OSI Approved :: GNU General Public License v3 or ' +
         'later (GPLv3+)'],
     python_requires='>=3.5',
-    install_requires=['numpy', 'pandas', 'pyemu==1.0'],
+    install_requires=['numpy', 'pandas', 'pyemu==1.0', 'scipy'],
     entry_points={
         'console_scripts': []}
 )
@@ -10,12 +10,16 @@ import os
 from shutil import copytree, rmtree
 import time
 
-from cuspy import calibration
+from cuspy import calibration, multistart_calibration, \
+    write_regional_pest_files
 
 
 # Configure calibration
-method = 'glm'  # 'glm', 'de' (method used for calibration)
+method = 'glm'  # 'glm', 'de', 'multistart', 'regional' (calibration method)
 parallel = False  # True or False (parallelize calculations)
+screening = None  # None, {'threshold': 0.05} (fix insensitive parameters)
+svd_assist = False  # True or False (SVD-assisted calibration, method 'glm')
+warm_start = None  # None or path of the .par file of a previous calibration
 
 # Set folders
 whereami = os.path.dirname(os.path.realpath(__file__))
@@ -41,7 +45,8 @@ if method == 'glm':
                       pst_file1=os.path.join(folder, 'test1.pst'),
                       pestpp_folder=pestpp_folder,
                       control_data={'noptmax': 10},
-                      parallel=parallel)
+                      parallel=parallel, screening=screening,
+                      svd_assist=svd_assist, warm_start=warm_start)
 elif method == 'de':
     # method DE
     pst = calibration(method='de', reg=False,
@@ -49,6 +54,32 @@ elif method == 'de':
                       pst_file1=os.path.join(folder, 'test1.pst'),
                       pestpp_folder=pestpp_folder,
                       pestpp_opts={'de_max_gen': 20}, parallel=parallel)
+elif method == 'multistart':
+    # method GLM from several starting points
+    pst, optima = multistart_calibration(
+        pst_file0=os.path.join(folder, 'test0.pst'),
+        pst_file1=os.path.join(folder, 'test1.pst'),
+        pestpp_folder=pestpp_folder, n_starts=4, seed=0,
+        control_data={'noptmax': 10})
+    print(optima)
+elif method == 'regional':
+    # method GLM for the shared parameters of copies of the lake
+    sites = []
+    for k in range(3):
+        copytree(test0_folder, os.path.join(folder, f'lake{k}'))
+        sites.append({'name': f'lake{k}', 'folder': f'lake{k}',
+                      'start_date': '1970-01-01', 'end_date': '2015-12-31',
+                      'model_command': 'run_okp', 'obs_file': 'obs.txt',
+                      'pred_file': 'pred.txt', 'par_file': 'par.txt',
+                      'output_file': 'output.txt'})
+    write_regional_pest_files(sites, par_data_file='par_data.csv',
+                              pst_file=os.path.join(folder, 'regional.pst'),
+                              n_jobs=len(sites))
+    pst = calibration(method='glm', reg=False,
+                      pst_file0=os.path.join(folder, 'regional.pst'),
+                      pst_file1=os.path.join(folder, 'test1.pst'),
+                      pestpp_folder=pestpp_folder,
+                      control_data={'noptmax': 10}, parallel=parallel)
 t1 = time.time()
 
 print('Calibration took %.1f s' % (t1 - t0))
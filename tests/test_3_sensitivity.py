@@ -13,6 +13,7 @@ from cuspy import gsa
 # Configure test
 method = 'morris'  # 'morris', 'sobol' (sensitivity method)
 parallel = True  # True, False (parallelize calculations)
+engine = 'pestpp'  # 'pestpp', 'native' (pestpp-sen or cuspy design/indices)
 
 # Set folders
 whereami = os.path.dirname(os.path.realpath(__file__))
@@ -36,14 +37,15 @@ if method == 'morris':
     gsa(method='morris',
         pst_file0=os.path.join(folder, 'test0.pst'),
         pst_file1=os.path.join(folder, 'test3_sen_morris.pst'),
-        pestpp_folder=pestpp_folder, parallel=parallel)
+        pestpp_folder=pestpp_folder, parallel=parallel, engine=engine)
 elif method == 'sobol':
     # Sobol's method
     gsa(method='sobol',
         pst_file0=os.path.join(folder, 'test0.pst'),
         pst_file1=os.path.join(folder, 'test3_sen_sobol.pst'),
         pestpp_folder=pestpp_folder,
-        pestpp_opts={'gsa_sobol_samples': 50}, parallel=parallel)
+        pestpp_opts={'gsa_sobol_samples': 50}, parallel=parallel,
+        engine=engine)
 t1 = time.time()
 
 print('Sensitivity calculations took %.1f s' % (t1 - t0))
@@ -8,12 +8,16 @@ import os
 import time
 from shutil import rmtree, copytree, copyfile
 
-from cuspy import monte_carlo
+from cuspy import monte_carlo, sweep_sensitivity, train_emulator
 
 
 # Configure test
 method = 'prior'  # 'prior', 'post' (use prior or post. parameter dist.)
+mc_method = 'sampling'  # 'sampling', 'linear' (model runs or linearized)
 parallel = False  # True, False (parallelize calculations)
+tol = None  # None, 0.05 (adaptive sampling until percentiles converge)
+binary = False  # True, False (write parameter samples in binary format)
+emulate = False  # True, False (rerun Monte Carlo with a trained emulator)
 
 # Set folders
 whereami = os.path.dirname(os.path.realpath(__file__))
@@ -28,7 +32,8 @@ folder = os.path.join(folder0, 'test4')
 if os.path.isdir(folder):
     rmtree(folder)
 copytree(test0_folder, folder)  # Copy data from test0_folder to folder
-for f in ['test1.pst', 'test1.post.cov']:
+for f in ['test1.pst', 'test1.post.cov', 'test1.jcb', 'test1.rei',
+          'test1.par']:
     copyfile(os.path.join(folder0, 'test1', f),
              os.path.join(folder0, 'test4', f))
 os.chdir(folder)
@@ -42,7 +47,37 @@ monte_carlo(pst_file0=os.path.join(folder, 'test1.pst'),
             dist_type=method, distribution='uniform', n_samples=50,
             pestpp_folder=pestpp_folder,
             csv_in=os.path.join(folder, 'sweep_in.csv'), parallel=parallel,
-            process_swp_out=True)
+            process_swp_out=True, method=mc_method, tol=tol,
+            batch_size=25, binary=binary)
 t1 = time.time()
 
 print('Monte Carlo took %.1f s' % (t1 - t0))
+
+# Sensitivity indices from the Monte Carlo results (no extra runs)
+if (method == 'prior') and (mc_method == 'sampling'):
+    t0 = time.time()
+    sen_obs, sen_groups = sweep_sensitivity(
+        pst_file=os.path.join(folder, 'test4.pst'),
+        csv_in=os.path.join(folder,
+                            'sweep_in.jcb' if binary else 'sweep_in.csv'))
+    t1 = time.time()
+    print(sen_groups)
+    print('Sweep sensitivity took %.1f s' % (t1 - t0))
+
+if emulate and (mc_method == 'sampling'):
+    csv_in = os.path.join(folder,
+                          'sweep_in.jcb' if binary else 'sweep_in.csv')
+    t0 = time.time()
+    model, cv = train_emulator(pst_file=os.path.join(folder, 'test4.pst'),
+                               csv_in=csv_in)
+    print(cv)
+    emu_folder = os.path.join(folder, 'emulated')
+    os.mkdir(emu_folder)
+    monte_carlo(pst_file0=os.path.join(folder, 'test1.pst'),
+                pst_file1=os.path.join(emu_folder, 'test4.pst'),
+                dist_type=method, distribution='uniform', n_samples=10000,
+                pestpp_folder=pestpp_folder,
+                csv_in=os.path.join(emu_folder, 'sweep_in.csv'),
+                parallel=parallel, process_swp_out=True, emulator=model)
+    t1 = time.time()
+    print('Emulated Monte Carlo took %.1f s' % (t1 - t0))
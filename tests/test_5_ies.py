@@ -6,11 +6,13 @@ import os
 import time
 from shutil import rmtree, copytree
 
-from cuspy import ies
+from cuspy import ies, ies_results
 
 
 # Configure test
 parallel = False  # True, False (parallelize calculations)
+restart = None  # None, path of the pest file of a previous IES run
+binary = False  # True, False (save ensembles in binary format)
 
 # Set folders
 whereami = os.path.dirname(os.path.realpath(__file__))
@@ -32,7 +34,12 @@ t0 = time.time()
 pst = ies(pst_file0=os.path.join(folder, 'test0.pst'),
           pst_file1=os.path.join(folder, 'test5.pst'),
           pestpp_folder=pestpp_folder,
-          parallel=parallel, n_reals=50, control_data={'noptmax': 10})
+          parallel=parallel, n_reals=50, control_data={'noptmax': 10},
+          restart=restart, binary=binary)
 t1 = time.time()
 
 print('IES took %.1f s' % (t1 - t0))
+
+# Summaries of the iterations
+results = ies_results(pst_file=os.path.join(folder, 'test5.pst'))
+print(results['phi_summary'])
@@ -7,10 +7,12 @@ import os
 from shutil import copytree, rmtree
 import time
 
-from cuspy import calibration, linear_uncertainty
+from cuspy import calibration, linear_uncertainty, pred_uncertainty, \
+    data_worth
 
 # Set uncertainty analysis
 analysis = 'prior'  # 'prior', 'schur', 'err_var'
+ensemble = None  # None, ('test5.3.par.csv', 'test5.3.obs.csv') (IES results)
 
 # Set folders
 whereami = os.path.dirname(os.path.realpath(__file__))
@@ -38,6 +40,17 @@ calibration(method='glm', reg=True,
 # Uncertainty analysis
 t0 = time.time()
 la = linear_uncertainty(analysis=analysis, pst_file0='test6.pst',
-                        pst_file1='test6b.pst', pestpp_folder=pestpp_folder)
+                        pst_file1='test6b.pst', pestpp_folder=pestpp_folder,
+                        ensemble=ensemble)
 t1 = time.time()
 print(t1-t0)
+
+# Linear uncertainty of all predictions (memory-mapped Jacobian)
+t0 = time.time()
+uncert = pred_uncertainty(pst_file='test6b.pst', var_names=['tepi', 'thyp'])
+t1 = time.time()
+print(t1-t0)
+
+# Data worth of observation groups
+worth, timings = data_worth(pst_file='test6b.pst')
+print(timings)
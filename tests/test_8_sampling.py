@@ -0,0 +1,71 @@
+"""TEST 8: Quasi-random and Latin hypercube sampling.
+
+Compare the convergence of the percentile bands obtained with
+pseudo-random, Latin hypercube and scrambled Sobol and Halton samples,
+and make Monte Carlo simulations of the OKP model with a Sobol sample.
+The convergence benchmark uses the Jacobian matrix of Test 1
+(test_1_calib_overdet.py run with method='glm') as a linearized model,
+so that it does not need model runs.
+"""
+import os
+import time
+from shutil import rmtree, copytree, copyfile
+
+import numpy as np
+import pyemu
+
+from cuspy import monte_carlo, read_jco_memmap
+from cuspy.sampling import percentile_convergence
+
+
+# Configure test
+parallel = False  # True, False (parallelize calculations)
+
+# Set folders
+whereami = os.path.dirname(os.path.realpath(__file__))
+if __file__ == '<input>':
+    folder0 = os.path.join(whereami, 'tests')
+else:
+    folder0 = whereami
+
+pestpp_folder = os.path.expanduser("~/PycharmProjects/pestpp/bin/linux")
+test0_folder = os.path.join(folder0, "test0")
+folder = os.path.join(folder0, 'test8')
+if os.path.isdir(folder):
+    rmtree(folder)
+copytree(test0_folder, folder)  # Copy data from test0_folder to folder
+copyfile(os.path.join(folder0, 'test1', 'test1.jcb'),
+         os.path.join(folder, 'test1.jcb'))
+os.chdir(folder)
+
+# Convergence benchmark
+# ---------------------
+pst = pyemu.Pst(os.path.join(folder, 'test0.pst'))
+jco, row_names, col_names = read_jco_memmap(os.path.join(folder, 'test1.jcb'))
+par0 = pst.parameter_data.loc[col_names, 'parval1'].values
+
+
+def response(par_df):
+    # linearized model around the initial parameter values
+    return (par_df[col_names].values - par0) @ np.asarray(jco).T
+
+
+t0 = time.time()
+errors = percentile_convergence(pst, response, n_list=[16, 32, 64, 128, 256],
+                                distribution='uniform', n_repeats=10)
+t1 = time.time()
+print(errors)
+print('Convergence benchmark took %.1f s' % (t1 - t0))
+
+# Monte Carlo with a Sobol sample
+# -------------------------------
+t0 = time.time()
+monte_carlo(pst_file0=os.path.join(folder, 'test0.pst'),
+            pst_file1=os.path.join(folder, 'test8.pst'),
+            dist_type='prior', distribution='uniform', n_samples=64,
+            sampler='sobol', seed=0, pestpp_folder=pestpp_folder,
+            csv_in=os.path.join(folder, 'sweep_in.csv'), parallel=parallel,
+            process_swp_out=True)
+t1 = time.time()
+
+print('Monte Carlo took %.1f s' % (t1 - t0))
@@ -0,0 +1,86 @@
+"""TEST 9: Run the chain of analyses as a pipeline.
+
+Write the PEST files, calibrate the OKP model, and make linear
+uncertainty analyses and Monte Carlo simulations with the calibrated
+model as a pipeline of stages. Based on the files of Test 0
+(test_0_input.py). The pipeline is run a second time with a larger
+number of Monte Carlo simulations: only the Monte Carlo simulations and
+the processing of their results are run again. Optionally, the
+pipeline is also run for several copies of the site as a campaign
+sharing one pool of worker slots.
+"""
+import os
+import time
+from shutil import copytree, rmtree
+
+from cuspy import analysis_stages, run_campaign, run_pipeline
+
+
+max_workers = 2  # 1, 2 (number of stages run concurrently)
+campaign = False  # True, False (run copies of the site as a campaign)
+
+whereami = os.path.dirname(os.path.realpath(__file__))
+if __file__ == '<input>':
+    folder0 = os.path.join(whereami, 'tests')
+else:
+    folder0 = whereami
+
+pestpp_folder = os.path.expanduser("~/PycharmProjects/pestpp/bin/linux")
+test0_folder = os.path.join(folder0, "test0")
+folder = os.path.join(folder0, 'test9')
+if os.path.isdir(folder):
+    rmtree(folder)
+copytree(test0_folder, folder)  # Copy data from test0_folder to folder
+os.chdir(folder)
+os.mkdir('mc')
+
+pest_kwargs = {'start_date': '1970-01-01', 'end_date': '2015-12-31',
+               'tpl_file': 'par.tpl', 'par_file': 'par.txt',
+               'par_data_file': 'par_data.csv', 'obs_file': 'obs.txt',
+               'pred_file': 'pred.txt', 'ins_file': 'res_file.ins',
+               'output_file': 'output.txt', 'pst_file': 'test9.pst',
+               'model_command': 'run_okp',
+               'control_data': {'noptmax': 0, 'numlam': 10}}
+calib_kwargs = {'pst_file1': 'test9_calib.pst',
+                'pestpp_folder': pestpp_folder,
+                'control_data': {'noptmax': 10}}
+lin_kwargs = {'analysis': 'schur', 'pst_file1': 'test9_lin.pst',
+              'pestpp_folder': pestpp_folder}
+model_files = ['lake.txt', 'meteo.txt']
+
+for n_samples in [50, 100]:
+    mc_kwargs = {'pst_file1': 'test9_mc.pst',
+                 'csv_in': os.path.join('mc', 'sweep_in.csv'),
+                 'dist_type': 'post', 'n_samples': n_samples,
+                 'pestpp_folder': pestpp_folder}
+    stages = analysis_stages(pest_kwargs, calib_kwargs, lin_kwargs,
+                             mc_kwargs, {'var_names': ['tepi', 'thyp']},
+                             model_files=model_files)
+    t0 = time.time()
+    report = run_pipeline(stages, state_file='test9.pipeline.json',
+                          max_workers=max_workers)
+    t1 = time.time()
+    print(report)
+    print('Pipeline took %.1f s' % (t1 - t0))
+
+if campaign:
+    # Copies of the site, the first one with a higher priority
+    calib_kwargs['parallel'] = True
+    sites = []
+    for k in range(4):
+        site_folder = os.path.join(folder, f'site{k}')
+        copytree(test0_folder, site_folder)
+        os.mkdir(os.path.join(site_folder, 'mc'))
+        sites.append({'name': f'site{k}', 'folder': site_folder,
+                      'priority': int(k == 0), 'slots': 2,
+                      'stages': analysis_stages(
+                          pest_kwargs, calib_kwargs, lin_kwargs, mc_kwargs,
+                          {'var_names': ['tepi', 'thyp']},
+                          model_files=model_files)})
+    t0 = time.time()
+    report, summary = run_campaign(sites, n_slots=4,
+                                   report_file=os.path.join(folder,
+                                                            'campaign.txt'))
+    t1 = time.time()
+    print(report)
+    print('Campaign took %.1f s' % (t1 - t0))